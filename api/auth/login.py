@@ -1,4 +1,3 @@
-from http.server import BaseHTTPRequestHandler
 import json
 import sys
 import os
@@ -7,8 +6,9 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from lib.auth import validate_admin_credentials, generate_admin_token, get_cors_headers
+from lib.timing import TimedRequestHandler
 
-class handler(BaseHTTPRequestHandler):
+class handler(TimedRequestHandler):
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
@@ -20,15 +20,12 @@ class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Handle admin login"""
         try:
-            # Set CORS headers
-            headers = get_cors_headers()
-            for key, value in headers.items():
-                self.send_header(key, value)
-
             # Parse request body
             content_length = int(self.headers.get('Content-Length', 0))
             if content_length == 0:
                 self.send_response(400)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({"error": "No data provided"}).encode())
@@ -42,6 +39,8 @@ class handler(BaseHTTPRequestHandler):
             
             if not username or not password:
                 self.send_response(400)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({"error": "Username and password required"}).encode())
@@ -53,6 +52,8 @@ class handler(BaseHTTPRequestHandler):
                 token = generate_admin_token()
                 
                 self.send_response(200)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
@@ -62,6 +63,8 @@ class handler(BaseHTTPRequestHandler):
                 }).encode())
             else:
                 self.send_response(401)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
@@ -71,6 +74,8 @@ class handler(BaseHTTPRequestHandler):
         except Exception as e:
             print(f"Error in login endpoint: {e}")
             self.send_response(500)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({
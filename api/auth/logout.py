@@ -0,0 +1,53 @@
+import json
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from lib.auth import verify_admin_token, get_bearer_token, invalidate_admin_token, get_cors_headers
+from lib.timing import TimedRequestHandler
+from lib.database import delete_admin_session
+
+class handler(TimedRequestHandler):
+    def do_OPTIONS(self):
+        """Handle CORS preflight requests"""
+        self.send_response(200)
+        headers = get_cors_headers()
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _send_json(self, status, payload):
+        """Send a JSON response with CORS headers"""
+        self.send_response(status)
+        for key, value in get_cors_headers().items():
+            self.send_header(key, value)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
+
+    def do_POST(self):
+        """Handle admin logout"""
+        try:
+            auth_header = self.headers.get('Authorization')
+            if not verify_admin_token(auth_header):
+                self._send_json(401, {"error": "Unauthorized. Admin access required."})
+                return
+
+            token = get_bearer_token(auth_header)
+            invalidate_admin_token(token)
+            delete_admin_session(token)
+
+            self._send_json(200, {
+                "success": True,
+                "message": "Logout successful"
+            })
+
+        except Exception as e:
+            print(f"Error in logout endpoint: {e}")
+            self._send_json(500, {"error": "Internal server error"})
+
+    def do_GET(self):
+        """Handle GET requests (not allowed for logout)"""
+        self._send_json(405, {"error": "Method not allowed"})
@@ -1,4 +1,3 @@
-from http.server import BaseHTTPRequestHandler
 import json
 import sys
 import os
@@ -6,10 +5,12 @@ import os
 # Add the project root to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
-from lib.auth import verify_admin_token, get_cors_headers
-from lib.database import clear_analysis_results
+from lib.auth import verify_admin_token, clear_token_cache, get_cors_headers
+from lib.timing import TimedRequestHandler
+from lib.cache import invalidate_results_cache
+from lib.database import clear_analysis_results, clear_user_aggregates
 
-class handler(BaseHTTPRequestHandler):
+class handler(TimedRequestHandler):
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
@@ -21,15 +22,12 @@ class handler(BaseHTTPRequestHandler):
     def do_DELETE(self):
         """Handle clearing analysis data (admin only)"""
         try:
-            # Set CORS headers
-            headers = get_cors_headers()
-            for key, value in headers.items():
-                self.send_header(key, value)
-
             # Verify admin token
             auth_header = self.headers.get('Authorization')
             if not verify_admin_token(auth_header):
                 self.send_response(401)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
@@ -40,8 +38,13 @@ class handler(BaseHTTPRequestHandler):
             # Clear analysis results from Supabase
             try:
                 clear_analysis_results()
+                clear_user_aggregates()
+                invalidate_results_cache()
+                clear_token_cache()
                 
                 self.send_response(200)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
@@ -52,6 +55,8 @@ class handler(BaseHTTPRequestHandler):
             except Exception as e:
                 print(f"Error clearing data: {e}")
                 self.send_response(500)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
@@ -61,6 +66,8 @@ class handler(BaseHTTPRequestHandler):
         except Exception as e:
             print(f"Error in clear endpoint: {e}")
             self.send_response(500)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({
@@ -0,0 +1,64 @@
+import json
+import sys
+import os
+from urllib.parse import urlparse, parse_qs
+
+# Add the project root to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from lib.auth import verify_admin_token, get_cors_headers
+from lib.timing import TimedRequestHandler
+from lib.database import get_upload_job
+from lib.jobs import job_status
+
+class handler(TimedRequestHandler):
+    def do_OPTIONS(self):
+        """Handle CORS preflight requests"""
+        self.send_response(200)
+        headers = get_cors_headers()
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _send_json(self, status, payload):
+        """Send a JSON response with CORS headers"""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for key, value in get_cors_headers().items():
+            self.send_header(key, value)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        # Progress changes between polls, so no cache may keep it
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Handle polling the stage and progress of a background upload job (admin only)"""
+        try:
+            auth_header = self.headers.get('Authorization')
+            if not verify_admin_token(auth_header):
+                self._send_json(401, {"error": "Unauthorized. Admin access required."})
+                return
+
+            job_id = parse_qs(urlparse(self.path).query).get('id', [''])[0].strip()
+            if not job_id:
+                self._send_json(400, {"error": "id parameter required"})
+                return
+
+            try:
+                job = get_upload_job(job_id)
+            except Exception as e:
+                print(f"Error fetching upload job: {e}")
+                self._send_json(500, {"error": f"Error fetching upload job: {str(e)}"})
+                return
+
+            if job is None:
+                self._send_json(404, {"success": False, "message": "Upload job not found"})
+                return
+
+            self._send_json(200, {"success": True, "data": job_status(job)})
+
+        except Exception as e:
+            print(f"Error in jobs endpoint: {e}")
+            self._send_json(500, {"error": "Internal server error"})
@@ -0,0 +1,100 @@
+import json
+import sys
+import os
+from urllib.parse import urlparse, parse_qs
+
+# Add the project root to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from lib.auth import get_cors_headers
+from lib.timing import TimedRequestHandler
+from lib.cache import get_cached_leaderboard, get_results_cache_headers
+from lib.leaderboard import find_learner, search_learners, DEFAULT_SEARCH_RESULTS, MAX_SEARCH_RESULTS
+
+class handler(TimedRequestHandler):
+    def do_OPTIONS(self):
+        """Handle CORS preflight requests"""
+        self.send_response(200)
+        headers = get_cors_headers()
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _send_json(self, status, payload, cacheable=False):
+        """Send a JSON response with CORS (and optionally CDN cache) headers"""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        headers = {**get_cors_headers(), **(get_results_cache_headers() if cacheable else {})}
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Handle learner lookup by email and name/email prefix search (public endpoint)"""
+        try:
+            query = parse_qs(urlparse(self.path).query)
+            email = query.get('email', [''])[0].strip()
+            search = query.get('q', [''])[0].strip()
+
+            if not email and not search:
+                self._send_json(400, {"error": "email or q parameter required"})
+                return
+
+            try:
+                limit = int(query.get('limit', [DEFAULT_SEARCH_RESULTS])[0])
+            except ValueError:
+                limit = 0
+            if limit < 1 or limit > MAX_SEARCH_RESULTS:
+                self._send_json(400, {"error": f"limit must be between 1 and {MAX_SEARCH_RESULTS}"})
+                return
+
+            # The cached index resolves lookups; only the matching ranking rows are read
+            try:
+                leaderboard = get_cached_leaderboard()
+                
+                if leaderboard["id"] is None:
+                    self._send_json(404, {
+                        "success": False,
+                        "message": "No analysis results found"
+                    })
+                elif email:
+                    learner = find_learner(leaderboard, email)
+                    if learner is None:
+                        self._send_json(404, {
+                            "success": False,
+                            "message": "Learner not found"
+                        })
+                    else:
+                        self._send_json(200, {
+                            "success": True,
+                            "data": {**learner, "createdAt": leaderboard["createdAt"]}
+                        }, cacheable=True)
+                else:
+                    self._send_json(200, {
+                        "success": True,
+                        "data": {
+                            "matches": search_learners(leaderboard, search, limit),
+                            "createdAt": leaderboard["createdAt"]
+                        }
+                    }, cacheable=True)
+                    
+            except Exception as e:
+                print(f"Error looking up learner: {e}")
+                self._send_json(500, {"error": f"Error fetching data: {str(e)}"})
+
+        except Exception as e:
+            print(f"Error in learner endpoint: {e}")
+            self._send_json(500, {"error": "Internal server error"})
+
+    def do_POST(self):
+        """Handle POST requests (not allowed for learner lookup)"""
+        self.send_response(405)
+        headers = get_cors_headers()
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({"error": "Method not allowed"}).encode())
@@ -1,15 +1,20 @@
-from http.server import BaseHTTPRequestHandler
 import json
 import sys
 import os
+from urllib.parse import urlparse, parse_qs
 
 # Add the project root to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from lib.auth import get_cors_headers
-from lib.database import get_latest_analysis_results
+from lib.timing import TimedRequestHandler
+from lib.cache import (get_cached_results, get_cached_leaderboard, get_cached_diff, get_cached_window,
+                       get_cached_scope, etag_matches, get_results_cache_headers)
+from lib.leaderboard import (paginate_leaderboard, parse_page_params, parse_movers_params, parse_window_params,
+                             parse_scope_params, movers_view, page_etag, SCOPES)
+from lib.artifacts import choose_encoding, encoded_etag
 
-class handler(BaseHTTPRequestHandler):
+class handler(TimedRequestHandler):
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
@@ -18,52 +23,236 @@ class handler(BaseHTTPRequestHandler):
             self.send_header(key, value)
         self.end_headers()
 
+    def _send_json(self, status, payload, etag=None):
+        """Send a JSON response with CORS headers; an ETag also adds the CDN cache headers"""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        headers = {**get_cors_headers(), **(get_results_cache_headers() if etag else {})}
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        """Send a JSON error response"""
+        self._send_json(status, {"error": message})
+
+    def _send_not_modified(self, etag):
+        """Answer a revalidation with 304 when the client already holds etag, returning whether it did"""
+        if not etag_matches(self.headers.get('If-None-Match'), etag):
+            return False
+        self.send_response(304)
+        for key, value in {**get_cors_headers(), **get_results_cache_headers()}.items():
+            self.send_header(key, value)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
+
     def do_GET(self):
         """Handle fetching latest analysis results (public endpoint)"""
         try:
-            # Set CORS headers
-            headers = get_cors_headers()
-            for key, value in headers.items():
-                self.send_header(key, value)
+            # Any paging parameter switches to a server-side page of the leaderboard
+            query = parse_qs(urlparse(self.path).query)
+            if query.get("view") == ["movers"]:
+                self._send_movers(query)
+                return
+            if query.get("view") == ["window"]:
+                self._send_window(query)
+                return
+            if query.keys() & set(SCOPES):
+                self._send_scope(query)
+                return
+            if query.keys() & {"offset", "limit", "sort", "order", "achievement"}:
+                self._send_page(query)
+                return
 
-            # Fetch latest results from Supabase
+            # Fetch latest results, served from the warm-instance cache when current
             try:
-                results = get_latest_analysis_results()
+                entry = get_cached_results()
                 
-                if results:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
+                if entry.get("body") is not None:
+                    # Clients and the CDN revalidate with the ETag instead of re-downloading;
+                    # each pre-compressed variant has its own ETag and any of them revalidates
+                    encoding = choose_encoding(self.headers.get('Accept-Encoding'), entry)
+                    status = 304 if etag_matches(self.headers.get('If-None-Match'), entry["etag"]) else 200
+                    self.send_response(status)
+                    for key, value in {**get_cors_headers(), **get_results_cache_headers()}.items():
+                        self.send_header(key, value)
+                    self.send_header('ETag', encoded_etag(entry["etag"], encoding))
+                    self.send_header('Vary', 'Accept-Encoding')
+                    if status == 200:
+                        # Stream the pre-compressed variant the client accepts, as stored
+                        body = entry[encoding] if encoding else entry["body"]
+                        self.send_header('Content-type', 'application/json')
+                        if encoding:
+                            self.send_header('Content-Encoding', encoding)
+                        self.send_header('Content-Length', str(len(body)))
                     self.end_headers()
-                    self.wfile.write(json.dumps({
-                        "success": True,
-                        "data": results
-                    }).encode())
+                    if status == 200:
+                        self.wfile.write(body)
                 else:
-                    self.send_response(404)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
+                    self._send_json(404, {
                         "success": False,
                         "message": "No analysis results found"
-                    }).encode())
+                    })
                     
             except Exception as e:
                 print(f"Error fetching results: {e}")
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    "error": f"Error fetching data: {str(e)}"
-                }).encode())
+                self._send_error(500, f"Error fetching data: {str(e)}")
 
         except Exception as e:
             print(f"Error in results endpoint: {e}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "error": "Internal server error"
-            }).encode())
+            self._send_error(500, "Internal server error")
+
+    def _send_page(self, query):
+        """Send one sorted, filtered page of the cached leaderboard"""
+        try:
+            params = parse_page_params(query)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        try:
+            leaderboard = get_cached_leaderboard()
+            
+            if leaderboard["id"] is None:
+                self._send_json(404, {
+                    "success": False,
+                    "message": "No analysis results found"
+                })
+                return
+
+            etag = page_etag(leaderboard["id"], params)
+            if self._send_not_modified(etag):
+                return
+
+            page, total = paginate_leaderboard(leaderboard, **params)
+            self._send_json(200, {
+                "success": True,
+                "data": {
+                    "rankingData": page,
+                    "total": total,
+                    "createdAt": leaderboard["createdAt"],
+                    **params
+                }
+            }, etag)
+            
+        except Exception as e:
+            print(f"Error fetching leaderboard page: {e}")
+            self._send_error(500, f"Error fetching data: {str(e)}")
+
+    def _send_movers(self, query):
+        """Send who moved up or down, joined or dropped out since the previous snapshot"""
+        try:
+            params = parse_movers_params(query)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        try:
+            entry = get_cached_diff()
+            
+            if entry["id"] is None or entry.get("diff") is None:
+                self._send_json(404, {
+                    "success": False,
+                    "message": "No earlier snapshot to compare against"
+                })
+                return
+
+            etag = page_etag(entry["id"], params)
+            if self._send_not_modified(etag):
+                return
+
+            self._send_json(200, {
+                "success": True,
+                "data": {
+                    **movers_view(entry["diff"], params["limit"]),
+                    "createdAt": entry["createdAt"],
+                    **params
+                }
+            }, etag)
+            
+        except Exception as e:
+            print(f"Error fetching snapshot diff: {e}")
+            self._send_error(500, f"Error fetching data: {str(e)}")
+
+    def _send_window(self, query):
+        """Send one page of the leaderboard for a time window, summed from daily buckets"""
+        try:
+            params = parse_window_params(query)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        try:
+            entry = get_cached_window(params["from"], params["to"])
+            
+            if entry["id"] is None:
+                self._send_json(404, {
+                    "success": False,
+                    "message": "No analysis results found"
+                })
+                return
+
+            etag = page_etag(entry["id"], params)
+            if self._send_not_modified(etag):
+                return
+
+            ranking_data = entry["rankingData"]
+            self._send_json(200, {
+                "success": True,
+                "data": {
+                    "rankingData": ranking_data[params["offset"]:params["offset"] + params["limit"]],
+                    "total": len(ranking_data),
+                    "createdAt": entry["createdAt"],
+                    **params
+                }
+            }, etag)
+            
+        except Exception as e:
+            print(f"Error fetching window leaderboard: {e}")
+            self._send_error(500, f"Error fetching data: {str(e)}")
+
+    def _send_scope(self, query):
+        """Send one page of the leaderboard of a single course or AI assistant"""
+        try:
+            params = parse_scope_params(query)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        try:
+            scope = params["scope"]
+            entry = get_cached_scope(scope, params[scope])
+            
+            if entry["id"] is None or not entry["rankingData"]:
+                self._send_json(404, {
+                    "success": False,
+                    "message": f"No leaderboard found for {scope} {params[scope]}"
+                })
+                return
+
+            etag = page_etag(entry["id"], params)
+            if self._send_not_modified(etag):
+                return
+
+            ranking_data = entry["rankingData"]
+            self._send_json(200, {
+                "success": True,
+                "data": {
+                    "rankingData": ranking_data[params["offset"]:params["offset"] + params["limit"]],
+                    "total": len(ranking_data),
+                    **params
+                }
+            }, etag)
+            
+        except Exception as e:
+            print(f"Error fetching scoped leaderboard: {e}")
+            self._send_error(500, f"Error fetching data: {str(e)}")
 
     def do_POST(self):
         """Handle POST requests (not allowed for results)"""
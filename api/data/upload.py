@@ -1,16 +1,20 @@
-from http.server import BaseHTTPRequestHandler
 import json
 import sys
 import os
+import io
+from urllib.parse import urlparse, parse_qs
 
 # Add the project root to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from lib.auth import verify_admin_token, get_cors_headers
-from lib.gamification import process_csv_data
-from lib.database import save_analysis_results
+from lib.timing import TimedRequestHandler, stage
+from lib.streams import open_request_body
+from lib.uploads import UPLOAD_MODES, RubricMismatchError, load_stored_aggregates, score_upload, upload_response
+from lib.jobs import (UploadBusyError, wants_job, spool_upload_job, start_upload_job, synchronous_upload_job,
+                      finish_upload_job, job_accepted_response)
 
-class handler(BaseHTTPRequestHandler):
+class handler(TimedRequestHandler):
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
@@ -22,15 +26,12 @@ class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Handle CSV data upload and processing"""
         try:
-            # Set CORS headers
-            headers = get_cors_headers()
-            for key, value in headers.items():
-                self.send_header(key, value)
-
             # Verify admin token
             auth_header = self.headers.get('Authorization')
             if not verify_admin_token(auth_header):
                 self.send_response(401)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
@@ -42,66 +43,161 @@ class handler(BaseHTTPRequestHandler):
             content_length = int(self.headers.get('Content-Length', 0))
             if content_length == 0:
                 self.send_response(400)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({"error": "No data provided"}).encode())
                 return
 
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            csv_content = data.get('csvData')
-            if not csv_content:
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "CSV data required"}).encode())
-                return
+            # Raw text/csv bodies skip the JSON envelope and are streamed in chunks
+            content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            is_raw_csv = content_type == 'text/csv'
+            query = parse_qs(urlparse(self.path).query)
+            mode = query.get('mode', ['replace'])[0]
 
-            # Process CSV data using gamification analysis
-            try:
-                analysis_results = process_csv_data(csv_content)
-            except Exception as e:
-                print(f"Error processing CSV: {e}")
+            if is_raw_csv:
+                csv_stream = open_request_body(self.rfile, content_length)
+            else:
+                post_data = self.rfile.read(content_length)
+                with stage("decode"):
+                    data = json.loads(post_data.decode('utf-8'))
+                mode = data.get('mode', mode)
+                
+                csv_content = data.get('csvData')
+                if not csv_content:
+                    self.send_response(400)
+                    for key, value in get_cors_headers().items():
+                        self.send_header(key, value)
+                    self.send_header('Content-type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"error": "CSV data required"}).encode())
+                    return
+                csv_stream = io.StringIO(csv_content)
+
+            if mode not in UPLOAD_MODES:
                 self.send_response(400)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
-                    "error": f"Error processing CSV data: {str(e)}"
+                    "error": f"Unknown upload mode: {mode}"
                 }).encode())
                 return
 
-            # Save results to Supabase
-            try:
-                saved_result = save_analysis_results(analysis_results)
+            # Job mode spools the upload and answers before any scoring happens
+            if wants_job(query):
+                try:
+                    job = spool_upload_job(csv_stream, mode)
+                    start_upload_job()
+                except Exception as e:
+                    print(f"Error queueing upload job: {e}")
+                    self.send_response(500)
+                    for key, value in get_cors_headers().items():
+                        self.send_header(key, value)
+                    self.send_header('Content-type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps({
+                        "error": f"Error queueing upload job: {str(e)}"
+                    }).encode())
+                    return
                 
-                self.send_response(200)
+                accepted = job_accepted_response(job)
+                self.send_response(202)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
+                self.send_header('Location', accepted["statusUrl"])
                 self.end_headers()
-                self.wfile.write(json.dumps({
-                    "success": True,
-                    "message": "Data processed and saved successfully",
-                    "summary": analysis_results["summaryStats"]
-                }).encode())
-                
-            except Exception as e:
-                print(f"Error saving to database: {e}")
-                self.send_response(500)
+                self.wfile.write(json.dumps(accepted).encode())
+                return
+
+            # Inline uploads wait their turn in the job queue, so they never score or save alongside another
+            try:
+                with synchronous_upload_job(mode, content_length) as job:
+                    self.score_and_save(job, csv_stream, mode)
+            except UploadBusyError as e:
+                self.send_response(503)
+                for key, value in get_cors_headers().items():
+                    self.send_header(key, value)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
-                self.wfile.write(json.dumps({
-                    "error": f"Error saving data: {str(e)}"
-                }).encode())
+                self.wfile.write(json.dumps({"error": str(e)}).encode())
 
         except Exception as e:
             print(f"Error in upload endpoint: {e}")
             self.send_response(500)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({
                 "error": "Internal server error"
             }).encode())
 
+    def score_and_save(self, job, csv_stream, mode):
+        """Score an inline upload and publish it under its claimed job, answering the request"""
+        # Append uploads merge into the stored per-user aggregates
+        try:
+            stored_aggregates = load_stored_aggregates(mode)
+        except RubricMismatchError as e:
+            self.send_response(409)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            return
+        except Exception as e:
+            print(f"Error loading stored aggregates: {e}")
+            self.send_response(500)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                "error": f"Error loading stored aggregates: {str(e)}"
+            }).encode())
+            return
+
+        # Process CSV data using gamification analysis
+        try:
+            analysis_results = score_upload(csv_stream, mode, stored_aggregates)
+        except Exception as e:
+            print(f"Error processing CSV: {e}")
+            self.send_response(400)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                "error": f"Error processing CSV data: {str(e)}"
+            }).encode())
+            return
+
+        # Save aggregate state and results to Supabase
+        try:
+            finish_upload_job(job["id"], analysis_results, mode)
+            
+            self.send_response(200)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(upload_response(analysis_results, mode)).encode())
+            
+        except Exception as e:
+            print(f"Error saving to database: {e}")
+            self.send_response(500)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                "error": f"Error saving data: {str(e)}"
+            }).encode())
+
     def do_GET(self):
         """Handle GET requests (not allowed for upload)"""
         self.send_response(405)
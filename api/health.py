@@ -1,15 +1,16 @@
-from http.server import BaseHTTPRequestHandler
 import json
 import sys
 import os
-from datetime import datetime
+from urllib.parse import urlparse, parse_qs
 
 # Add the project root to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from lib.auth import get_cors_headers
+from lib.timing import TimedRequestHandler
+from lib.health import health_report, render_prometheus, wants_deep, wants_prometheus, PROMETHEUS_CONTENT_TYPE
 
-class handler(BaseHTTPRequestHandler):
+class handler(TimedRequestHandler):
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
@@ -19,36 +20,34 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_GET(self):
-        """Handle health check requests"""
+        """Handle health check requests; ?deep=1 adds a database round trip and metrics"""
         try:
-            # Set CORS headers
-            headers = get_cors_headers()
-            for key, value in headers.items():
-                self.send_header(key, value)
-
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
+            query = parse_qs(urlparse(self.path).query)
+            deep = wants_deep(query)
+            report = health_report(deep)
+            status = 200 if report["status"] == "healthy" else 503
             
-            response_data = {
-                "status": "healthy",
-                "timestamp": datetime.utcnow().isoformat(),
-                "service": "Per Scholas Azari Leaderboard API",
-                "version": "1.0.0",
-                "endpoints": {
-                    "auth": "/api/auth/login",
-                    "upload": "/api/data/upload",
-                    "results": "/api/data/results",
-                    "clear": "/api/data/clear",
-                    "health": "/api/health"
-                }
-            }
+            if wants_prometheus(query):
+                body = render_prometheus(report).encode()
+                content_type = PROMETHEUS_CONTENT_TYPE
+            else:
+                body = json.dumps(report).encode()
+                content_type = 'application/json'
             
-            self.wfile.write(json.dumps(response_data).encode())
+            self.send_response(status)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
 
         except Exception as e:
             print(f"Error in health endpoint: {e}")
             self.send_response(500)
+            for key, value in get_cors_headers().items():
+                self.send_header(key, value)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Measure the cold-start import time of each API endpoint with python -X importtime
+Usage: python benchmarks/bench_imports.py --repeat 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Handler file -> import budget in milliseconds; generous so slower CI machines stay under it
+BUDGETS_MS = {
+    "api/health.py": 250,
+    "api/data/results.py": 250,
+    "api/data/learner.py": 250,
+    "api/auth/login.py": 300,
+    "api/auth/logout.py": 300,
+    "api/data/clear.py": 300,
+    "api/data/jobs.py": 300,
+    "api/data/upload.py": 300,
+}
+
+# Dependencies that each cost tens to hundreds of milliseconds to import
+HEAVY_MODULES = ("pandas", "numpy", "supabase", "httpx", "jwt")
+
+# Read-only endpoints serve from PostgREST and cached artifacts, so they must load none of these
+READ_ENDPOINTS = ("api/health.py", "api/data/results.py", "api/data/learner.py")
+READ_BANNED = ("pandas", "numpy", "supabase", "httpx")
+
+MARKER = "-- handler import --"
+
+CHILD_TEMPLATE = """
+import importlib.util, json, sys
+sys.path.insert(0, {root!r})
+sys.stderr.write({marker!r} + "\\n")
+sys.stderr.flush()
+spec = importlib.util.spec_from_file_location("handler", {path!r})
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+print(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+"""
+
+def parse_importtime(stderr):
+    """Sum the cumulative microseconds of top-level imports logged after the marker"""
+    total = 0
+    started = False
+    for line in stderr.splitlines():
+        if line == MARKER:
+            started = True
+            continue
+        if not started or not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # Nested imports are indented and already counted in their parent's cumulative time
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total
+
+def measure(handler):
+    """Import one handler in a fresh interpreter and return (milliseconds, heavy modules loaded)"""
+    code = CHILD_TEMPLATE.format(root=PROJECT_ROOT, marker=MARKER, heavy=HEAVY_MODULES,
+                                 path=os.path.join(PROJECT_ROOT, handler))
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                             check=True, capture_output=True, text=True, cwd=PROJECT_ROOT)
+    return parse_importtime(process.stderr) / 1000, json.loads(process.stdout)
+
+def measure_endpoints(repeat=3):
+    """Fastest of several cold imports per handler: {handler: (milliseconds, heavy modules)}"""
+    results = {}
+    for handler in BUDGETS_MS:
+        runs = [measure(handler) for _ in range(repeat)]
+        results[handler] = (min(ms for ms, _ in runs), runs[0][1])
+    return results
+
+def check_budgets(results):
+    """Return one message per endpoint over its budget or loading a banned module"""
+    failures = []
+    for handler, (ms, heavy) in results.items():
+        if ms > BUDGETS_MS[handler]:
+            failures.append(f"{handler} imports in {ms:.0f}ms, over its {BUDGETS_MS[handler]}ms budget")
+        banned = [name for name in heavy if handler in READ_ENDPOINTS and name in READ_BANNED]
+        if banned:
+            failures.append(f"{handler} loads {', '.join(banned)}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = measure_endpoints(args.repeat)
+    for handler, (ms, heavy) in results.items():
+        print(f"{handler:22s} {ms:7.1f} ms (budget {BUDGETS_MS[handler]} ms)  heavy: {', '.join(heavy) or '-'}")
+
+    failures = check_budgets(results)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
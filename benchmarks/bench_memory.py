@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Compare peak RSS of the row-dict pipeline against the columnar pipeline
+Usage: python benchmarks/bench_memory.py --rows 500000 --extra-columns 30
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(PROJECT_ROOT)
+
+from benchmarks.synthetic import write_cohort_csv
+
+# Each pipeline runs in a fresh interpreter so peak RSS is not shared between them
+PIPELINES = {
+    # The previous pipeline: every column parsed, then one dict per row kept as rawData
+    "row dicts": """
+import pandas as pd
+from lib.gamification import calculate_user_scores, build_analysis_results
+df = pd.read_csv(io.StringIO(csv_content))
+raw_data = df.to_dict('records')
+results = build_analysis_results(calculate_user_scores(df))
+results["rawData"] = raw_data
+""",
+    "columnar": """
+from lib.gamification import process_csv_data
+results = process_csv_data(csv_content)
+""",
+}
+
+CHILD_TEMPLATE = """
+import io, resource, sys
+sys.path.append({root!r})
+csv_content = open({path!r}).read()
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+{body}
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(baseline, peak, len(results["rawData"]))
+"""
+
+def measure(path, body):
+    """Run one pipeline in a subprocess and return (baseline_kb, peak_kb, rows)"""
+    code = CHILD_TEMPLATE.format(root=PROJECT_ROOT, path=path, body=body)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    baseline, peak, rows = output.split()
+    return int(baseline), int(peak), int(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--extra-columns", type=int, default=30)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cohort.csv")
+        write_cohort_csv(path, args.users, args.rows, extra_columns=args.extra_columns)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"CSV: {args.rows:,} rows, {13 + args.extra_columns} columns, {size_mb:.1f} MB")
+        
+        peaks = {}
+        for name, body in PIPELINES.items():
+            baseline, peak, rows = measure(path, body)
+            peaks[name] = peak
+            print(f"{name:10s} peak RSS {peak / 1024:8.1f} MB (+{(peak - baseline) / 1024:.1f} MB over CSV load)")
+        
+        print(f"Peak RSS reduction: {1 - peaks['columnar'] / peaks['row dicts']:.0%}")
+
+if __name__ == "__main__":
+    main()
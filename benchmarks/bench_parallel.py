@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark serial vs sharded multi-process scoring on a synthetic export
+Usage: python benchmarks/bench_parallel.py --rows 2000000 --users 5000 --workers 4
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+# Add the project root to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.synthetic import generate_cohort_csv
+from lib.gamification import process_csv_data, process_csv_upload, PARALLEL_MIN_ROWS
+
+def timed(func, *args, **kwargs):
+    """Run func once and return (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    
+    print(f"Generating {args.rows:,} rows for {args.users:,} users...")
+    csv_content = generate_cohort_csv(args.users, args.rows)
+    if args.rows < PARALLEL_MIN_ROWS:
+        print(f"⚠️  Below PARALLEL_MIN_ROWS ({PARALLEL_MIN_ROWS:,}); both runs will be serial")
+    
+    serial, serial_seconds = timed(process_csv_data, csv_content)
+    print(f"Serial:            {serial_seconds:8.2f}s")
+    
+    parallel, parallel_seconds = timed(process_csv_data, csv_content, workers=args.workers)
+    print(f"Parallel ({args.workers} procs): {parallel_seconds:8.2f}s")
+    print(f"Speed-up:          {serial_seconds / parallel_seconds:8.2f}x")
+    
+    # Uploads stream chunk by chunk and shard each chunk once PARALLEL_MIN_ROWS rows are read
+    serial_upload, serial_upload_seconds = timed(process_csv_upload, io.StringIO(csv_content))
+    print(f"Serial upload:     {serial_upload_seconds:8.2f}s")
+    
+    parallel_upload, parallel_upload_seconds = timed(process_csv_upload, io.StringIO(csv_content),
+                                                     workers=args.workers)
+    print(f"Sharded upload ({args.workers} procs): {parallel_upload_seconds:8.2f}s")
+    print(f"Speed-up:          {serial_upload_seconds / parallel_upload_seconds:8.2f}x")
+    
+    if parallel["rankingData"] != serial["rankingData"]:
+        print("❌ Parallel rankingData differs from serial")
+        sys.exit(1)
+    if parallel_upload["rankingData"] != serial_upload["rankingData"]:
+        print("❌ Sharded upload rankingData differs from serial")
+        sys.exit(1)
+    print("✅ Parallel results match serial results")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scoring functions at increasing cohort sizes against a stored baseline
+Usage: python benchmarks/bench_scoring.py --sizes 1000,10000,100000,1000000 [--save-baseline]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(PROJECT_ROOT)
+
+# The sizes recorded in baseline.json; larger ones run with --sizes but have nothing to compare against
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Slowdowns smaller than this are timer noise and never flagged
+NOISE_FLOOR_SECONDS = 0.005
+
+def users_for(rows):
+    """Cohort size used for a row count (about 20 questions per learner, capped)"""
+    return max(50, min(rows // 20, 50000))
+
+def repeats_for(rows):
+    """Timed runs per case; the best run is reported"""
+    return 5 if rows <= 10000 else 3 if rows <= 100000 else 1
+
+def build_cases(csv_content):
+    """Prepare inputs once and return {name: zero-argument callable}"""
+    from lib.gamification import (read_interactions_csv, process_csv_data, calculate_user_scores,
+                                  analyze_question_quality_batch, identify_achievements)
+
+    frame = read_interactions_csv(io.StringIO(csv_content))
+    user_scores = calculate_user_scores(frame)
+    return {
+        "process_csv_data": lambda: process_csv_data(csv_content),
+        "calculate_user_scores": lambda: calculate_user_scores(frame),
+        # The rubric is scored column-wise; analyze_question_quality wraps this for one row
+        "analyze_question_quality": lambda: analyze_question_quality_batch(frame["input"], frame["outputs"]),
+        "identify_achievements": lambda: identify_achievements(user_scores),
+    }
+
+def run_size(rows, seed):
+    """Run every case at one size in this process and return their measurements"""
+    from benchmarks.synthetic import generate_cohort_csv
+
+    csv_content = generate_cohort_csv(users_for(rows), rows, seed)
+    cases = build_cases(csv_content)
+    measurements = {}
+    for name, case in cases.items():
+        best = float("inf")
+        for _ in range(repeats_for(rows)):
+            start = time.perf_counter()
+            case()
+            best = min(best, time.perf_counter() - start)
+
+        # Traced separately so allocation tracking does not slow the timed runs
+        tracemalloc.start()
+        case()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        measurements[f"{name}@{rows}"] = {"seconds": round(best, 6), "peakMB": round(peak / 2**20, 2)}
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10
+    return {"measurements": measurements, "maxRssMB": round(rss_mb, 1)}
+
+def measure_size(rows, seed):
+    """Run one size in a fresh interpreter so memory from other sizes is not counted"""
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(rows), "--seed", str(seed)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def load_baseline(path):
+    """Load stored measurements, or an empty baseline when none exists"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file).get("measurements", {})
+
+def save_baseline(path, measurements):
+    """Store measurements with enough machine details to judge comparisons"""
+    with open(path, "w") as baseline_file:
+        json.dump({
+            "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                        "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count()},
+            "measurements": measurements
+        }, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a case is flagged")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_size(args.child, args.seed)))
+        return
+
+    baseline = load_baseline(args.baseline)
+    measurements = {}
+    regressions = []
+    print(f"{'case':<34}{'seconds':>10}{'peak MB':>10}{'baseline':>10}{'change':>9}")
+    for rows in (int(size) for size in args.sizes.split(",")):
+        size_result = measure_size(rows, args.seed)
+        for key, measured in size_result["measurements"].items():
+            measurements[key] = measured
+            previous = baseline.get(key)
+            change = ""
+            if previous and previous["seconds"] > 0:
+                ratio = measured["seconds"] / previous["seconds"] - 1
+                change = f"{ratio:+.0%}"
+                if ratio > args.tolerance and measured["seconds"] - previous["seconds"] > NOISE_FLOOR_SECONDS:
+                    regressions.append(key)
+                    change += " ❌"
+            reference = f"{previous['seconds']:.4f}" if previous else "-"
+            print(f"{key:<34}{measured['seconds']:>10.4f}{measured['peakMB']:>10.1f}{reference:>10}{change:>9}")
+        print(f"{'  process peak RSS @' + str(rows):<34}{'':>10}{size_result['maxRssMB']:>10.1f}")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, {**baseline, **measurements})
+        print(f"✅ Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"❌ {len(regressions)} case(s) slower than baseline by more than {args.tolerance:.0%}")
+        sys.exit(1)
+    elif baseline:
+        print("✅ No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Load-test the api/ handlers on a local threaded server backed by an in-memory database
+Usage: python benchmarks/load_test.py --duration 20 --readers 32 --latency-ms 40 --upload-interval 5
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(PROJECT_ROOT)
+
+from benchmarks import local_database
+from benchmarks.synthetic import generate_cohort_csv
+import lib.timing
+from lib.timing import TimedRequestHandler
+
+# The handlers import lib.database by name, so the stand-in must be installed before they load
+sys.modules["lib.database"] = local_database
+
+# Vercel function files served by the harness, keyed by request path
+ROUTES = {
+    "/api/auth/login": "api/auth/login.py",
+    "/api/auth/logout": "api/auth/logout.py",
+    "/api/data/upload": "api/data/upload.py",
+    "/api/data/jobs": "api/data/jobs.py",
+    "/api/data/results": "api/data/results.py",
+    "/api/data/learner": "api/data/learner.py",
+    "/api/data/clear": "api/data/clear.py",
+    "/api/health": "api/health.py",
+}
+
+class RoutedHandler(TimedRequestHandler):
+    """Dispatch each request to the handler class of its api/ route"""
+
+    routes = {}
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        route = self.routes.get(urlparse(self.path).path.rstrip("/"))
+        if route is None:
+            self.send_error(404)
+            return False
+        self.__class__ = route
+        return True
+
+    def log_message(self, format, *args):
+        pass
+
+def load_routes():
+    """Import every api/ handler module and bind it to its path"""
+    routes = {}
+    for path, file_name in ROUTES.items():
+        module_name = "loadtest_" + file_name[:-3].replace("/", "_")
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(PROJECT_ROOT, file_name))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        routes[path] = type(module_name, (RoutedHandler, module.handler), {})
+    return routes
+
+def start_server():
+    """Serve the handlers on an ephemeral local port from a background thread"""
+    RoutedHandler.routes = load_routes()
+    ThreadingHTTPServer.request_queue_size = 256
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RoutedHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class Recorder:
+    """Thread-safe latency samples and error counts per endpoint label"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, label, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+def send(port, method, path, headers=None, body=None):
+    """Make one request and return (status, headers, body, seconds)"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    start = time.perf_counter()
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, dict(response.getheaders()), data, time.perf_counter() - start
+    finally:
+        connection.close()
+
+def timed_request(recorder, label, port, method, path, headers=None, body=None, expected=(200, 304)):
+    """Make a request and record its latency under label"""
+    start = time.perf_counter()
+    try:
+        status, response_headers, data, seconds = send(port, method, path, headers, body)
+    except Exception as e:
+        print(f"Error requesting {path}: {e}")
+        recorder.record(label, time.perf_counter() - start, False)
+        return None, {}, b""
+    recorder.record(label, seconds, status in expected)
+    return status, response_headers, data
+
+def reader(recorder, port, users, stop):
+    """Browse like a leaderboard visitor: full results, pages and learner lookups, revalidating with ETags"""
+    rng = random.Random(threading.get_ident())
+    etags = {}
+    while not stop.is_set():
+        choice = rng.random()
+        if choice < 0.6:
+            label, path = "results", "/api/data/results"
+        elif choice < 0.85:
+            label = "results page"
+            sort = rng.choice(["rank", "totalPoints", "followUps"])
+            path = f"/api/data/results?offset={rng.randrange(0, 200, 50)}&limit=50&sort={sort}"
+        else:
+            label, path = "learner", f"/api/data/learner?email=learner{rng.randrange(users)}@example.com"
+
+        headers = {"Accept-Encoding": "br, gzip"}
+        if path in etags:
+            headers["If-None-Match"] = etags[path]
+        status, response_headers, _ = timed_request(recorder, label, port, "GET", path, headers,
+                                                    expected=(200, 304, 404))
+        if status == 200 and "ETag" in response_headers:
+            etags[path] = response_headers["ETag"]
+
+def uploader(recorder, port, token, payloads, interval, stop, as_jobs=False):
+    """Append a new export every interval seconds, optionally as background jobs polled until published"""
+    index = 0
+    while not stop.wait(interval):
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "text/csv"}
+        if not as_jobs:
+            timed_request(recorder, "upload", port, "POST", "/api/data/upload?mode=append",
+                          headers, payloads[index % len(payloads)], expected=(200,))
+            index += 1
+            continue
+
+        start = time.perf_counter()
+        status, _, body = timed_request(recorder, "upload accept", port, "POST",
+                                        "/api/data/upload?mode=append&async=1",
+                                        headers, payloads[index % len(payloads)], expected=(202,))
+        index += 1
+        if status != 202:
+            continue
+        status_url = json.loads(body)["statusUrl"]
+        stage = "queued"
+        while stage not in ("published", "failed"):
+            time.sleep(0.1)
+            status, _, body = timed_request(recorder, "job poll", port, "GET", status_url,
+                                            {"Authorization": headers["Authorization"]}, expected=(200,))
+            if status != 200:
+                break
+            stage = json.loads(body)["data"]["stage"]
+        recorder.record("upload job", time.perf_counter() - start, stage == "published")
+
+def report(recorder, duration):
+    """Print latency percentiles and throughput per endpoint"""
+    print(f"{'endpoint':<16}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, samples in sorted(recorder.samples.items()):
+        values = sorted(samples)
+        print(f"{label:<16}{len(values):>10}{recorder.errors.get(label, 0):>8}{len(values) / duration:>10.1f}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=float, default=20, help="seconds of mixed traffic")
+    parser.add_argument("--readers", type=int, default=32, help="concurrent leaderboard readers")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=20000, help="rows in the initial upload")
+    parser.add_argument("--upload-rows", type=int, default=5000, help="rows in each periodic append upload")
+    parser.add_argument("--upload-interval", type=float, default=5, help="seconds between uploads (0 disables)")
+    parser.add_argument("--job-uploads", action="store_true", help="send periodic uploads as background jobs")
+    parser.add_argument("--latency-ms", type=float, default=30, help="simulated database round trip")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--cache-ttl", help="override RESULTS_CACHE_TTL for the run")
+    parser.add_argument("--request-log", action="store_true", help="print the JSON log line of every request")
+    args = parser.parse_args()
+
+    os.environ.setdefault("JWT_SECRET", "load-test-secret-of-at-least-32-bytes")
+    os.environ.setdefault("ADMIN_USERNAME", "loadtest")
+    os.environ.setdefault("ADMIN_PASSWORD", "loadtest")
+    if args.cache_ttl is not None:
+        os.environ["RESULTS_CACHE_TTL"] = args.cache_ttl
+    local_database.configure(args.latency_ms, args.jitter_ms)
+    lib.timing.REQUEST_LOG = args.request_log
+
+    server = start_server()
+    port = server.server_address[1]
+    print(f"Serving api/ handlers on 127.0.0.1:{port} "
+          f"(database latency {args.latency_ms:g}±{args.jitter_ms:g} ms)")
+
+    status, _, body, _ = send(port, "POST", "/api/auth/login", {"Content-Type": "application/json"},
+                              json.dumps({"username": os.environ["ADMIN_USERNAME"],
+                                          "password": os.environ["ADMIN_PASSWORD"]}))
+    if status != 200:
+        print(f"❌ Login failed with {status}: {body[:200]}")
+        sys.exit(1)
+    token = json.loads(body)["token"]
+
+    print(f"Seeding {args.rows:,} rows for {args.users:,} users...")
+    status, headers, body, seconds = send(port, "POST", "/api/data/upload",
+                                          {"Authorization": f"Bearer {token}", "Content-Type": "text/csv"},
+                                          generate_cohort_csv(args.users, args.rows).encode())
+    if status != 200:
+        print(f"❌ Seed upload failed with {status}: {body[:200]}")
+        sys.exit(1)
+    print(f"Seed upload took {seconds:.2f}s ({headers.get('Server-Timing')})")
+
+    # Payloads are generated up front so the harness does not compete with the server for CPU
+    payloads = [generate_cohort_csv(args.users, args.upload_rows, seed=seed).encode() for seed in range(1, 4)]
+
+    local_database.call_counts.clear()
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [threading.Thread(target=reader, args=(recorder, port, args.users, stop)) for _ in range(args.readers)]
+    if args.upload_interval > 0:
+        threads.append(threading.Thread(target=uploader,
+                                        args=(recorder, port, token, payloads, args.upload_interval, stop,
+                                              args.job_uploads)))
+
+    print(f"Running {args.readers} readers for {args.duration:g}s...")
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    report(recorder, elapsed)
+
+    from lib.cache import get_cache_stats
+    from lib.auth import get_token_cache_stats
+    print(f"Database round trips: {json.dumps(dict(sorted(local_database.call_counts.items())))}")
+    print(f"Results caches:       {json.dumps(get_cache_stats())}")
+    print(f"Token cache:          {json.dumps(get_token_cache_stats())}")
+
+    if recorder.errors:
+        print(f"❌ {sum(recorder.errors.values())} failed request(s)")
+        sys.exit(1)
+    print("✅ No failed requests")
+
+if __name__ == "__main__":
+    main()
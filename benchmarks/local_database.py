@@ -0,0 +1,315 @@
+"""
+In-memory stand-in for lib.database used by the load-test harness
+Implements the same public functions with configurable per-call latency
+"""
+
+import random
+import threading
+import time
+from datetime import datetime
+
+from lib.artifacts import render_results_body, build_results_artifact
+from lib.timing import timed
+from lib.leaderboard import build_leaderboard_index
+
+# Same batch sizes as lib.database, so batched calls pay the same number of round trips
+STATE_WRITE_BATCH_SIZE = 1000
+ROW_KEY_LOOKUP_BATCH_SIZE = 200
+READ_BATCH_SIZE = 1000
+RANK_LOOKUP_BATCH_SIZE = 500
+
+_lock = threading.Lock()
+_latency = {"seconds": 0.0, "jitter": 0.0}
+_tables = {"snapshots": [], "admin_sessions": {}, "user_aggregates": {}, "ingested_rows": set(),
+           "user_daily_buckets": {}, "scope_rankings": {}, "upload_jobs": {}}
+_next_id = [1]
+
+# Round trips per function, so harness runs can show how often the database was hit
+call_counts = {}
+
+def configure(latency_ms=0.0, jitter_ms=0.0):
+    """Set the simulated network latency added to every round trip"""
+    _latency["seconds"] = latency_ms / 1000
+    _latency["jitter"] = jitter_ms / 1000
+
+def reset():
+    """Drop all stored rows and call counts"""
+    with _lock:
+        _tables["snapshots"].clear()
+        _tables["admin_sessions"].clear()
+        _tables["user_aggregates"].clear()
+        _tables["ingested_rows"].clear()
+        _tables["user_daily_buckets"].clear()
+        _tables["scope_rankings"].clear()
+        _tables["upload_jobs"].clear()
+        call_counts.clear()
+
+def _round_trip(name, count=1):
+    """Sleep for count simulated round trips and record them"""
+    with _lock:
+        call_counts[name] = call_counts.get(name, 0) + count
+    for _ in range(count):
+        delay = _latency["seconds"] + random.uniform(0, _latency["jitter"])
+        if delay > 0:
+            time.sleep(delay)
+
+def _batches(size, batch_size):
+    """Number of requests a batched write or lookup of size items takes"""
+    return max(1, -(-size // batch_size))
+
+def get_supabase_client():
+    """There is no client to create; kept for interface parity"""
+    return None
+
+def get_read_client():
+    """There is no reader to create; kept for interface parity"""
+    return None
+
+def reset_supabase_client():
+    """Kept for interface parity"""
+
+def get_client_stats():
+    """Report the stand-in as a single reused client"""
+    with _lock:
+        total = sum(call_counts.values())
+    return {"clientsCreated": 1, "clientsReused": max(0, total - 1), "retries": 0}
+
+def save_analysis_results(results_data):
+    """Save analysis results and their pre-rendered response"""
+    created_at = datetime.utcnow().isoformat()
+    raw_data_count = results_data.get("rawDataCount", len(results_data.get("rawData", [])))
+    body = render_results_body(results_data["summaryStats"], results_data["rankingData"], created_at, raw_data_count)
+    row = {
+        "created_at": created_at,
+        "summaryStats": results_data["summaryStats"],
+        "rankingData": results_data["rankingData"],
+        "rawDataCount": raw_data_count,
+        "index": build_leaderboard_index(results_data["rankingData"], results_data.get("scoreBreakdowns")),
+        "artifact": build_results_artifact(body),
+        "diff": results_data.get("snapshotDiff")
+    }
+    buckets, scopes = results_data.get("dailyBuckets", []), results_data.get("scopeRankings", [])
+    aggregates, row_keys = results_data.get("changedAggregates", {}), results_data.get("newRowKeys", [])
+    # Snapshot insert, one bulk insert per batch of rankings, buckets and staged state, then the publish call
+    _round_trip("save_analysis_results", 2 + _batches(len(results_data["rankingData"]), STATE_WRITE_BATCH_SIZE)
+                + sum(_batches(len(rows), STATE_WRITE_BATCH_SIZE)
+                      for rows in (buckets, scopes, aggregates, row_keys) if rows))
+    with _lock:
+        row["id"] = _next_id[0]
+        _next_id[0] += 1
+        _tables["snapshots"].append(row)
+        if results_data.get("replaceState"):
+            for table in ("user_daily_buckets", "scope_rankings", "user_aggregates", "ingested_rows"):
+                _tables[table].clear()
+        for record in buckets:
+            _tables["user_daily_buckets"][(record["email"], record["day"])] = dict(record)
+        for record in scopes:
+            _tables["scope_rankings"][(record["scope"], record["scopeValue"], record["email"])] = dict(record)
+        _tables["user_aggregates"].update(aggregates)
+        _tables["ingested_rows"].update(row_keys)
+    return {"id": row["id"], "created_at": created_at}
+
+def _latest():
+    """Most recent snapshot, or None"""
+    with _lock:
+        return _tables["snapshots"][-1] if _tables["snapshots"] else None
+
+def get_latest_analysis_results():
+    """Get the most recent analysis results"""
+    _round_trip("get_latest_analysis_results")
+    row = _latest()
+    if row is None:
+        return None
+    return {"id": row["id"], "summaryStats": row["summaryStats"], "rankingData": row["rankingData"],
+            "createdAt": row["created_at"], "rawDataCount": row["rawDataCount"]}
+
+def get_latest_results_artifact():
+    """Get the pre-rendered response of the most recent analysis results"""
+    _round_trip("get_latest_results_artifact")
+    row = _latest()
+    return {**row["artifact"], "id": row["id"]} if row is not None else None
+
+def get_latest_leaderboard():
+    """Get the most recent ranking data with its precomputed index"""
+    _round_trip("get_latest_leaderboard")
+    row = _latest()
+    if row is None:
+        return None
+    return {"id": row["id"], "createdAt": row["created_at"], "index": row["index"]}
+
+def _snapshot_ranking_data(snapshot_id):
+    """Ranking entries of one snapshot, or an empty list"""
+    with _lock:
+        row = next((row for row in _tables["snapshots"] if row["id"] == snapshot_id), None)
+    return row["rankingData"] if row is not None else []
+
+def get_snapshot_rankings(snapshot_id):
+    """Get a snapshot's ranking entries in rank order"""
+    ranking_data = _snapshot_ranking_data(snapshot_id)
+    _round_trip("get_snapshot_rankings", _batches(len(ranking_data), READ_BATCH_SIZE))
+    return list(ranking_data)
+
+def get_snapshot_ranking(snapshot_id, email):
+    """Get one learner's ranking entry in a snapshot, or None"""
+    _round_trip("get_snapshot_ranking")
+    return next((entry for entry in _snapshot_ranking_data(snapshot_id) if entry["email"] == email), None)
+
+def get_snapshot_ranking_page(snapshot_id, first_rank, last_rank):
+    """Get a snapshot's ranking entries with first_rank <= rank <= last_rank, in rank order"""
+    _round_trip("get_snapshot_ranking_page", _batches(last_rank - first_rank + 1, READ_BATCH_SIZE))
+    return [entry for entry in _snapshot_ranking_data(snapshot_id) if first_rank <= entry["rank"] <= last_rank]
+
+def get_snapshot_rankings_at(snapshot_id, ranks):
+    """Get a snapshot's ranking entries at the given ranks, in rank order"""
+    wanted = set(ranks)
+    _round_trip("get_snapshot_rankings_at", _batches(len(wanted), RANK_LOOKUP_BATCH_SIZE))
+    return [entry for entry in _snapshot_ranking_data(snapshot_id) if entry["rank"] in wanted]
+
+def get_latest_snapshot_diff():
+    """Get the rank-movement diff stored with the most recent snapshot"""
+    _round_trip("get_latest_snapshot_diff")
+    row = _latest()
+    return {"id": row["id"], "createdAt": row["created_at"], "diff": row["diff"]} if row is not None else None
+
+def get_latest_analysis_id():
+    """Get the id of the most recent analysis results, or None when there are none"""
+    _round_trip("get_latest_analysis_id")
+    row = _latest()
+    return row["id"] if row is not None else None
+
+def clear_analysis_results():
+    """Clear all analysis results and the buckets saved with them"""
+    _round_trip("clear_analysis_results")
+    with _lock:
+        _tables["snapshots"].clear()
+        _tables["user_daily_buckets"].clear()
+        _tables["scope_rankings"].clear()
+    return True
+
+def save_admin_session(token, expires_at):
+    """Save an admin session token"""
+    _round_trip("save_admin_session")
+    with _lock:
+        _tables["admin_sessions"][token] = expires_at
+    return {"token": token}
+
+def delete_admin_session(token):
+    """Delete an admin session token"""
+    _round_trip("delete_admin_session")
+    with _lock:
+        _tables["admin_sessions"].pop(token, None)
+    return True
+
+def validate_admin_session(token):
+    """Validate an admin session token"""
+    _round_trip("validate_admin_session")
+    with _lock:
+        expires_at = _tables["admin_sessions"].get(token)
+    return expires_at is not None and expires_at > datetime.utcnow()
+
+def get_user_aggregates():
+    """Get the stored per-user aggregate records keyed by email"""
+    _round_trip("get_user_aggregates")
+    with _lock:
+        return dict(_tables["user_aggregates"])
+
+def save_user_aggregates(aggregate_records):
+    """Upsert per-user aggregate records keyed by email"""
+    _round_trip("save_user_aggregates", _batches(len(aggregate_records), STATE_WRITE_BATCH_SIZE))
+    with _lock:
+        _tables["user_aggregates"].update(aggregate_records)
+    return len(aggregate_records)
+
+def find_ingested_row_keys(row_keys):
+    """Return the subset of row keys that earlier uploads already ingested"""
+    unique_keys = set(row_keys)
+    _round_trip("find_ingested_row_keys", _batches(len(unique_keys), ROW_KEY_LOOKUP_BATCH_SIZE))
+    with _lock:
+        return unique_keys & _tables["ingested_rows"]
+
+def save_ingested_row_keys(row_keys):
+    """Record row keys so re-sent rows are not counted again"""
+    _round_trip("save_ingested_row_keys", _batches(len(row_keys), STATE_WRITE_BATCH_SIZE))
+    with _lock:
+        _tables["ingested_rows"].update(row_keys)
+    return len(row_keys)
+
+def get_daily_buckets(start_day, end_day):
+    """Get the per-user daily buckets from start_day to end_day inclusive"""
+    with _lock:
+        records = sorted((record for (_, day), record in _tables["user_daily_buckets"].items()
+                          if start_day <= day <= end_day), key=lambda record: (record["day"], record["email"]))
+    _round_trip("get_daily_buckets", _batches(len(records), READ_BATCH_SIZE))
+    return [dict(record) for record in records]
+
+def get_scope_rankings(scope, scope_value):
+    """Get the ranked bucket records of one course or assistant in rank order"""
+    with _lock:
+        records = sorted((record for (record_scope, value, _), record in _tables["scope_rankings"].items()
+                          if record_scope == scope and value == scope_value), key=lambda record: record["rank"])
+    _round_trip("get_scope_rankings", _batches(len(records), READ_BATCH_SIZE))
+    return [dict(record) for record in records]
+
+def clear_user_aggregates():
+    """Clear stored per-user aggregates and ingested row keys"""
+    _round_trip("clear_user_aggregates", 2)
+    with _lock:
+        _tables["user_aggregates"].clear()
+        _tables["ingested_rows"].clear()
+    return True
+
+def save_upload_job(job):
+    """Insert an upload job row"""
+    _round_trip("save_upload_job")
+    with _lock:
+        _tables["upload_jobs"][job["id"]] = {"started_at": None, "heartbeat_at": None, "finished_at": None,
+                                             "error": None, "result": None, "synchronous": False, **job}
+    return job
+
+def update_upload_job(job_id, changes):
+    """Update columns of an upload job row"""
+    _round_trip("update_upload_job")
+    with _lock:
+        _tables["upload_jobs"][job_id].update(changes)
+    return True
+
+def get_upload_job(job_id):
+    """Get an upload job row, or None when there is no such job"""
+    _round_trip("get_upload_job")
+    with _lock:
+        job = _tables["upload_jobs"].get(job_id)
+        return dict(job) if job is not None else None
+
+def claim_upload_job(stale_before, job_id=None):
+    """Move the oldest queued upload job to scoring and return it, or None when none can be claimed"""
+    _round_trip("claim_upload_job")
+    now = datetime.utcnow().isoformat()
+    with _lock:
+        for job in _tables["upload_jobs"].values():
+            stale = (job.get("heartbeat_at") or job["updated_at"]) < stale_before
+            if job["synchronous"] and job["stage"] in ("queued", "scoring", "saving") and stale:
+                job.update({"stage": "failed", "updated_at": now, "finished_at": now,
+                            "error": "Upload request stopped before finishing; upload the file again"})
+            elif job["stage"] in ("scoring", "saving") and stale:
+                if job["stage"] == "scoring":
+                    job.update({"stage": "queued", "started_at": None, "heartbeat_at": None, "updated_at": now})
+                else:
+                    job.update({"stage": "failed", "error": "Worker stopped while saving; upload the file again",
+                                "updated_at": now, "finished_at": now})
+        jobs = _tables["upload_jobs"].values()
+        queued = [job for job in jobs if job["stage"] == "queued"]
+        if not queued or any(job["stage"] in ("scoring", "saving") for job in jobs):
+            return None
+        job = min(queued, key=lambda job: job["created_at"])
+        # A synchronous upload's job is only claimed by its own request
+        if job["synchronous"] != (job_id is not None) or job_id not in (None, job["id"]):
+            return None
+        job.update({"stage": "scoring", "started_at": now, "updated_at": now, "heartbeat_at": now})
+        return dict(job)
+
+# Timed like lib.database, so Server-Timing and request logs show the simulated round trips
+for _name, _value in list(globals().items()):
+    if (callable(_value) and getattr(_value, "__module__", None) == __name__ and not _name.startswith("_")
+            and _name not in ("configure", "reset", "get_supabase_client", "get_read_client",
+                              "reset_supabase_client", "get_client_stats")):
+        globals()[_name] = timed(f"db.{_name}")(_value)
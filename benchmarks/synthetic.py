@@ -0,0 +1,82 @@
+"""
+Deterministic synthetic cohort generator for benchmarks
+Produces LMS-shaped CSV exports with the columns the scorer reads
+"""
+
+import numpy as np
+import pandas as pd
+
+QUESTIONS = [
+    "How should I study for the CompTIA A+ exam?",
+    "Can you explain subnetting for my networking class?",
+    "What assignments are due on the calendar this week?",
+    "Help me troubleshoot a hardware issue with my laptop",
+    "What is the difference between TCP and UDP?",
+    "Is my tutor available for a health check?",
+    "hello",
+    "Summarize today's lesson",
+]
+
+COURSES = [
+    ("IT-101", "IT Support Fundamentals"),
+    ("NET-201", "Networking Essentials"),
+    ("SEC-301", "Security+ Prep"),
+    ("CLD-401", "Cloud Practitioner"),
+    ("DEV-501", "Intro to Python"),
+]
+
+ASSISTANTS = ["Azari", "Study Coach", "Cert Tutor"]
+
+def _responses():
+    """Responses of varying length around the detailed-response threshold"""
+    words = "the quick learner reviews each concept carefully before moving on".split()
+    return [" ".join(words[i % len(words)] for i in range(count)) for count in (8, 35, 51, 90, 180)]
+
+def generate_cohort_frame(users=1000, rows=10000, seed=42, staff_share=0.02, extra_columns=0):
+    """Build a synthetic interaction DataFrame with a fixed seed
+    
+    extra_columns adds unused LMS metadata columns to mimic a wide export.
+    """
+    rng = np.random.default_rng(seed)
+    
+    # Skewed activity: a few learners ask most of the questions
+    weights = rng.pareto(1.5, users) + 1
+    user_ids = rng.choice(users, size=rows, p=weights / weights.sum())
+    staff = rng.random(users) < staff_share
+    domains = np.where(staff, "perscholas.org", "example.com")
+    emails = np.array([f"learner{i}@{domains[i]}" for i in range(users)], dtype=object)
+    
+    course_index = rng.integers(0, len(COURSES), rows)
+    responses = np.array(_responses(), dtype=object)
+    created = (np.datetime64("2024-01-01T00:00:00") +
+               rng.integers(0, 90 * 24 * 3600, rows).astype("timedelta64[s]"))
+    
+    frame = pd.DataFrame({
+        "email": emails[user_ids],
+        "first": np.char.add("First", user_ids.astype(str)),
+        "last": np.char.add("Last", user_ids.astype(str)),
+        "course_id": np.array([c[0] for c in COURSES], dtype=object)[course_index],
+        "course_name": np.array([c[1] for c in COURSES], dtype=object)[course_index],
+        "instance_ainame": np.array(ASSISTANTS, dtype=object)[rng.integers(0, len(ASSISTANTS), rows)],
+        "input": np.array(QUESTIONS, dtype=object)[rng.integers(0, len(QUESTIONS), rows)],
+        "outputs": responses[rng.integers(0, len(responses), rows)],
+        "credits": rng.integers(1, 10, rows),
+        "query_duration_ms": rng.integers(300, 8000, rows),
+        "ttft": rng.integers(40, 1200, rows),
+        "success": np.where(rng.random(rows) < 0.93, "TRUE", "FALSE"),
+        "created": np.datetime_as_string(created, unit="s"),
+    })
+    
+    for index in range(extra_columns):
+        frame[f"lms_meta_{index}"] = np.char.add(f"meta{index}-", rng.integers(0, 100000, rows).astype(str))
+    
+    return frame
+
+def generate_cohort_csv(users=1000, rows=10000, seed=42, extra_columns=0):
+    """Build a synthetic CSV export as a string"""
+    return generate_cohort_frame(users, rows, seed, extra_columns=extra_columns).to_csv(index=False)
+
+def write_cohort_csv(path, users=1000, rows=10000, seed=42, extra_columns=0):
+    """Write a synthetic CSV export to path"""
+    generate_cohort_frame(users, rows, seed, extra_columns=extra_columns).to_csv(path, index=False)
+    return path
@@ -0,0 +1,88 @@
+import gzip
+import json
+import base64
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings in order of preference when the client accepts several
+PREFERRED_ENCODINGS = ('br', 'gzip')
+
+# Suffix each coded variant adds inside its ETag's quotes, so caches never mix up the variants
+ENCODING_ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+
+def render_results_body(summary_stats, ranking_data, created_at, raw_data_count):
+    """Render the exact /api/data/results response body"""
+    return json.dumps({
+        "success": True,
+        "data": {
+            "summaryStats": summary_stats,
+            "rankingData": ranking_data,
+            "createdAt": created_at,
+            "rawDataCount": raw_data_count
+        }
+    }, separators=(',', ':')).encode()
+
+def build_results_artifact(body):
+    """Pre-compress a response body and hash it for use as a strong ETag"""
+    return {
+        "body": body,
+        "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        "br": brotli.compress(body, quality=11) if brotli is not None else None,
+        "contentHash": hashlib.sha256(body).hexdigest()[:32]
+    }
+
+def artifact_to_record(artifact):
+    """Convert an artifact into analysis_results column values"""
+    return {
+        "response_body": artifact["body"].decode(),
+        "response_gzip": base64.b64encode(artifact["gzip"]).decode(),
+        "response_br": base64.b64encode(artifact["br"]).decode() if artifact["br"] is not None else None,
+        "content_hash": artifact["contentHash"]
+    }
+
+def artifact_from_record(record):
+    """Rebuild an artifact from analysis_results column values without parsing JSON"""
+    return {
+        "body": record["response_body"].encode(),
+        "gzip": base64.b64decode(record["response_gzip"]) if record.get("response_gzip") else None,
+        "br": base64.b64decode(record["response_br"]) if record.get("response_br") else None,
+        "contentHash": record["content_hash"]
+    }
+
+def choose_encoding(accept_encoding, artifact):
+    """Pick the best pre-compressed variant the client accepts, or None for identity"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    
+    for coding in PREFERRED_ENCODINGS:
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > 0 and artifact.get(coding) is not None:
+            return coding
+    return None
+
+def encoded_etag(etag, encoding):
+    """The ETag of one content-coding of a response, e.g. "abc-br" for "abc" sent as brotli"""
+    if not encoding:
+        return etag
+    return etag[:-1] + ENCODING_ETAG_SUFFIXES[encoding] + '"'
+
+def unencoded_etag(etag):
+    """Strip a content-coding suffix from an ETag, giving the ETag of the identity response"""
+    for suffix in ENCODING_ETAG_SUFFIXES.values():
+        if etag.endswith(suffix + '"'):
+            return etag[:-len(suffix) - 1] + '"'
+    return etag
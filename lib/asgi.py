@@ -0,0 +1,608 @@
+import os
+import json
+import asyncio
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs
+
+from lib.auth import (validate_admin_credentials, generate_admin_token, verify_admin_token, get_bearer_token,
+                      invalidate_admin_token, clear_token_cache, get_cors_headers)
+from lib.cache import (results_cache, leaderboard_cache, diff_cache, get_cached_results, get_cached_leaderboard,
+                       get_cached_diff, get_window_cache, get_scope_cache, invalidate_results_cache, etag_matches,
+                       get_results_cache_headers)
+from lib.artifacts import choose_encoding, encoded_etag
+from lib.timing import (collect_timings, current_timings, stage, run_timed, timing_headers, log_event,
+                        finish_request)
+from lib.leaderboard import (paginate_leaderboard, parse_page_params, parse_movers_params, parse_window_params,
+                             parse_scope_params, movers_view, page_etag, find_learner, search_learners, SCOPES,
+                             DEFAULT_SEARCH_RESULTS, MAX_SEARCH_RESULTS)
+from lib.database import clear_analysis_results, clear_user_aggregates, delete_admin_session, get_upload_job
+from lib.uploads import UPLOAD_MODES, RubricMismatchError, load_stored_aggregates, score_upload_file, upload_response
+from lib.health import health_report, render_prometheus, wants_deep, wants_prometheus, PROMETHEUS_CONTENT_TYPE
+from lib.jobs import (UPLOAD_JOB_RUNNER, SYNC_UPLOAD_WAIT_SECONDS, SYNC_UPLOAD_POLL_INTERVAL, UPLOAD_BUSY_ERROR,
+                      wants_job, new_job_path, create_upload_job, create_synchronous_upload_job, claim_next_job,
+                      job_heartbeat, score_upload_job, finish_upload_job, fail_upload_job,
+                      release_synchronous_upload_job, job_accepted_response, job_status)
+
+# Worker processes that score uploaded CSVs, so scoring never stalls the event loop
+SCORING_WORKERS = int(os.environ.get("ASGI_SCORING_WORKERS", "1"))
+
+# Largest request body the app will spool (bytes)
+MAX_BODY_BYTES = int(os.environ.get("ASGI_MAX_BODY_BYTES", str(256 * 1024 * 1024)))
+
+# Body bytes gathered before each spool write is handed to a thread
+SPOOL_WRITE_BYTES = 1024 * 1024
+
+# Query parameters that switch /api/data/results to a server-side page
+PAGE_PARAMS = {"offset", "limit", "sort", "order", "achievement"}
+
+_scoring_pool = None
+
+# Running upload jobs, referenced so the event loop does not drop them mid-flight
+_job_tasks = set()
+
+def get_scoring_pool():
+    """Get the process pool used for CPU-heavy scoring, creating it on first use"""
+    global _scoring_pool
+    if _scoring_pool is None:
+        # spawn avoids forking a process that already runs an event loop and threads
+        _scoring_pool = ProcessPoolExecutor(max_workers=SCORING_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _scoring_pool
+
+def shutdown_scoring_pool():
+    """Stop the scoring worker processes"""
+    global _scoring_pool
+    if _scoring_pool is not None:
+        _scoring_pool.shutdown(wait=True)
+        _scoring_pool = None
+
+class Request:
+    """Method, path, query, headers and body stream of one ASGI HTTP request"""
+
+    __slots__ = ("method", "path", "query", "headers", "_receive")
+
+    def __init__(self, scope, receive):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        self._receive = receive
+
+    def header(self, name, default=None):
+        """Get a request header by case-insensitive name"""
+        return self.headers.get(name.lower(), default)
+
+    async def stream(self):
+        """Yield the request body in the chunks the server delivers"""
+        while True:
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                return
+            if message.get("body"):
+                yield message["body"]
+            if not message.get("more_body"):
+                return
+
+    async def body(self):
+        """Read the whole request body, refusing bodies over MAX_BODY_BYTES"""
+        chunks = []
+        size = 0
+        async for chunk in self.stream():
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise ValueError("Request body too large")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+def json_response(status, payload, headers=None):
+    """Build a JSON response with CORS headers"""
+    return status, {**get_cors_headers(), **(headers or {}), "Content-Type": "application/json"}, json.dumps(payload).encode()
+
+async def send_response(send, status, headers, body=b""):
+    """Send a complete response through the ASGI send channel"""
+    if body or status not in (204, 304):
+        headers = {**headers, "Content-Length": str(len(body))}
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in headers.items()]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def is_admin(request):
+    """Verify the admin token off the event loop (a cache miss costs a session lookup)"""
+    return await asyncio.to_thread(verify_admin_token, request.header("Authorization"))
+
+async def login(request):
+    """Handle admin login"""
+    try:
+        data = json.loads((await request.body()).decode("utf-8") or "null")
+    except ValueError:
+        data = None
+    if not data:
+        return json_response(400, {"error": "No data provided"})
+
+    username = data.get("username")
+    password = data.get("password")
+    if not username or not password:
+        return json_response(400, {"error": "Username and password required"})
+
+    if not validate_admin_credentials(username, password):
+        return json_response(401, {"error": "Invalid credentials"})
+
+    token = await asyncio.to_thread(generate_admin_token)
+    return json_response(200, {"success": True, "token": token, "message": "Login successful"})
+
+async def logout(request):
+    """Handle admin logout"""
+    if not await is_admin(request):
+        return json_response(401, {"error": "Unauthorized. Admin access required."})
+
+    token = get_bearer_token(request.header("Authorization"))
+    invalidate_admin_token(token)
+    await asyncio.to_thread(delete_admin_session, token)
+    return json_response(200, {"success": True, "message": "Logout successful"})
+
+async def spool_body(request, path):
+    """Write the request body to a file as it arrives and return its size"""
+    # File calls run in threads, batched, so disk writes never block the event loop
+    size = written = 0
+    pending = []
+    spool = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise ValueError("Request body too large")
+            pending.append(chunk)
+            if size - written >= SPOOL_WRITE_BYTES:
+                await asyncio.to_thread(spool.writelines, pending)
+                pending, written = [], size
+        await asyncio.to_thread(spool.writelines, pending)
+    finally:
+        await asyncio.to_thread(spool.close)
+    return size
+
+def unwrap_json_upload(path):
+    """Replace a spooled {"csvData", "mode"} body with its CSV text and return the mode"""
+    with open(path, "rb") as spool:
+        with stage("decode"):
+            data = json.loads(spool.read().decode("utf-8"))
+
+    csv_content = data.get("csvData")
+    if not csv_content:
+        return None, None
+    with open(path, "w", encoding="utf-8") as spool:
+        spool.write(csv_content)
+    return True, data.get("mode")
+
+async def run_upload_job(job_id, path, mode):
+    """Score a claimed job in the scoring pool and publish it, after its request has returned"""
+    with collect_timings() as timings, job_heartbeat(job_id):
+        try:
+            stored_aggregates = await asyncio.to_thread(load_stored_aggregates, mode)
+            loop = asyncio.get_running_loop()
+            analysis_results, scoring_timings = await loop.run_in_executor(
+                get_scoring_pool(), run_timed, score_upload_job, job_id, path, mode, stored_aggregates)
+            timings.merge(scoring_timings)
+            await asyncio.to_thread(finish_upload_job, job_id, analysis_results, mode)
+        except Exception as e:
+            print(f"Error running upload job {job_id}: {e}")
+            await asyncio.to_thread(fail_upload_job, job_id, e)
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+        log_event("upload_job", timings, jobId=job_id, mode=mode)
+
+async def run_queued_jobs():
+    """Claim and run queued jobs one at a time until none can be claimed"""
+    while True:
+        try:
+            job = await asyncio.to_thread(claim_next_job)
+        except Exception as e:
+            print(f"Error claiming upload job: {e}")
+            return
+        if job is None:
+            return
+        await run_upload_job(job["id"], job["payload_path"], job["mode"])
+
+def start_upload_job():
+    """Run queued jobs on this event loop unless a separate queue worker handles them"""
+    if UPLOAD_JOB_RUNNER != "thread":
+        return
+    task = asyncio.create_task(run_queued_jobs())
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+
+async def wait_for_upload_turn(job_id):
+    """Claim a synchronous upload's job once the jobs queued before it have finished; False on timeout"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SYNC_UPLOAD_WAIT_SECONDS
+    while await asyncio.to_thread(claim_next_job, job_id) is None:
+        if loop.time() >= deadline:
+            return False
+        await asyncio.sleep(SYNC_UPLOAD_POLL_INTERVAL)
+    return True
+
+async def score_and_save(job, path, mode):
+    """Score an inline upload spooled to path and publish it under its claimed job"""
+    try:
+        stored_aggregates = await asyncio.to_thread(load_stored_aggregates, mode)
+    except RubricMismatchError as e:
+        return json_response(409, {"error": str(e)})
+    except Exception as e:
+        print(f"Error loading stored aggregates: {e}")
+        return json_response(500, {"error": f"Error loading stored aggregates: {str(e)}"})
+
+    try:
+        loop = asyncio.get_running_loop()
+        # Stages timed in the worker process are folded into this request's timings
+        analysis_results, scoring_timings = await loop.run_in_executor(get_scoring_pool(), run_timed,
+                                                                       score_upload_file, path, mode,
+                                                                       stored_aggregates)
+        timings = current_timings()
+        if timings is not None:
+            timings.merge(scoring_timings)
+    except Exception as e:
+        print(f"Error processing CSV: {e}")
+        return json_response(400, {"error": f"Error processing CSV data: {str(e)}"})
+
+    try:
+        await asyncio.to_thread(finish_upload_job, job["id"], analysis_results, mode)
+    except Exception as e:
+        print(f"Error saving to database: {e}")
+        return json_response(500, {"error": f"Error saving data: {str(e)}"})
+
+    return json_response(200, upload_response(analysis_results, mode))
+
+async def upload(request):
+    """Handle CSV data upload and processing (admin only)"""
+    if not await is_admin(request):
+        return json_response(401, {"error": "Unauthorized. Admin access required."})
+
+    mode = request.query.get("mode", ["replace"])[0]
+    is_raw_csv = request.header("Content-Type", "").split(";")[0].strip().lower() == "text/csv"
+    as_job = wants_job(request.query)
+
+    # The body is spooled to disk so a worker process can stream it back in chunks
+    if as_job:
+        path = new_job_path()
+    else:
+        descriptor, path = tempfile.mkstemp(suffix=".csv")
+        os.close(descriptor)
+    queued = False
+    try:
+        try:
+            size = await spool_body(request, path)
+        except ValueError as e:
+            return json_response(413, {"error": str(e)})
+        if size == 0:
+            return json_response(400, {"error": "No data provided"})
+
+        if not is_raw_csv:
+            has_csv, body_mode = await asyncio.to_thread(unwrap_json_upload, path)
+            if not has_csv:
+                return json_response(400, {"error": "CSV data required"})
+            mode = body_mode or mode
+
+        if mode not in UPLOAD_MODES:
+            return json_response(400, {"error": f"Unknown upload mode: {mode}"})
+
+        # Job mode answers as soon as the upload is spooled; the spool file now belongs to the job
+        if as_job:
+            try:
+                job = await asyncio.to_thread(create_upload_job, path, mode)
+            except Exception as e:
+                print(f"Error queueing upload job: {e}")
+                return json_response(500, {"error": f"Error queueing upload job: {str(e)}"})
+            queued = True
+            start_upload_job()
+            accepted = job_accepted_response(job)
+            return json_response(202, accepted, {"Location": accepted["statusUrl"]})
+
+        # Inline uploads wait their turn in the job queue, so they never score or save alongside another
+        try:
+            job = await asyncio.to_thread(create_synchronous_upload_job, mode, size)
+        except Exception as e:
+            print(f"Error queueing upload job: {e}")
+            return json_response(500, {"error": f"Error queueing upload job: {str(e)}"})
+        try:
+            with job_heartbeat(job["id"]):
+                if not await wait_for_upload_turn(job["id"]):
+                    return json_response(503, {"error": UPLOAD_BUSY_ERROR})
+                return await score_and_save(job, path, mode)
+        finally:
+            await asyncio.to_thread(release_synchronous_upload_job, job["id"])
+            start_upload_job()
+    finally:
+        if not queued:
+            os.unlink(path)
+
+async def jobs(request):
+    """Handle polling the stage and progress of a background upload job (admin only)"""
+    if not await is_admin(request):
+        return json_response(401, {"error": "Unauthorized. Admin access required."})
+
+    job_id = request.query.get("id", [""])[0].strip()
+    if not job_id:
+        return json_response(400, {"error": "id parameter required"})
+
+    try:
+        job = await asyncio.to_thread(get_upload_job, job_id)
+    except Exception as e:
+        print(f"Error fetching upload job: {e}")
+        return json_response(500, {"error": f"Error fetching upload job: {str(e)}"})
+
+    if job is None:
+        return json_response(404, {"success": False, "message": "Upload job not found"})
+    return json_response(200, {"success": True, "data": job_status(job)}, {"Cache-Control": "no-store"})
+
+async def results(request):
+    """Handle fetching latest analysis results (public endpoint)"""
+    if request.query.get("view") == ["movers"]:
+        return await results_movers(request)
+    if request.query.get("view") == ["window"]:
+        return await results_window(request)
+    if request.query.keys() & set(SCOPES):
+        return await results_scope(request)
+    if request.query.keys() & PAGE_PARAMS:
+        return await results_page(request)
+
+    try:
+        # Fresh entries are answered without leaving the event loop
+        entry = results_cache.peek() or await asyncio.to_thread(get_cached_results)
+    except Exception as e:
+        print(f"Error fetching results: {e}")
+        return json_response(500, {"error": f"Error fetching data: {str(e)}"})
+
+    if entry.get("body") is None:
+        return json_response(404, {"success": False, "message": "No analysis results found"})
+
+    # Each content-coding is its own representation with its own ETag; revalidation accepts any of them
+    encoding = choose_encoding(request.header("Accept-Encoding"), entry)
+    headers = {**get_cors_headers(), **get_results_cache_headers(), "ETag": encoded_etag(entry["etag"], encoding),
+               "Vary": "Accept-Encoding"}
+    if etag_matches(request.header("If-None-Match"), entry["etag"]):
+        return 304, headers, b""
+
+    headers["Content-Type"] = "application/json"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return 200, headers, entry[encoding] if encoding else entry["body"]
+
+async def cached_leaderboard():
+    """Get the cached leaderboard, refreshing it off the event loop when stale"""
+    return leaderboard_cache.peek() or await asyncio.to_thread(get_cached_leaderboard)
+
+async def results_page(request):
+    """Handle one sorted, filtered page of the cached leaderboard"""
+    try:
+        params = parse_page_params(request.query)
+    except ValueError as e:
+        return json_response(400, {"error": str(e)})
+
+    try:
+        leaderboard = await cached_leaderboard()
+    except Exception as e:
+        print(f"Error fetching leaderboard page: {e}")
+        return json_response(500, {"error": f"Error fetching data: {str(e)}"})
+
+    if leaderboard["id"] is None:
+        return json_response(404, {"success": False, "message": "No analysis results found"})
+
+    etag = page_etag(leaderboard["id"], params)
+    cache_headers = {**get_results_cache_headers(), "ETag": etag}
+    if etag_matches(request.header("If-None-Match"), etag):
+        return 304, {**get_cors_headers(), **cache_headers}, b""
+
+    try:
+        # Only the rows of this page are read
+        page, total = await asyncio.to_thread(paginate_leaderboard, leaderboard, **params)
+    except Exception as e:
+        print(f"Error fetching leaderboard page: {e}")
+        return json_response(500, {"error": f"Error fetching data: {str(e)}"})
+    return json_response(200, {
+        "success": True,
+        "data": {"rankingData": page, "total": total, "createdAt": leaderboard["createdAt"], **params}
+    }, cache_headers)
+
+async def results_movers(request):
+    """Handle the rank movement between the latest snapshot and the one before it"""
+    try:
+        params = parse_movers_params(request.query)
+    except ValueError as e:
+        return json_response(400, {"error": str(e)})
+
+    try:
+        entry = diff_cache.peek() or await asyncio.to_thread(get_cached_diff)
+    except Exception as e:
+        print(f"Error fetching snapshot diff: {e}")
+        return json_response(500, {"error": f"Error fetching data: {str(e)}"})
+
+    if entry["id"] is None or entry.get("diff") is None:
+        return json_response(404, {"success": False, "message": "No earlier snapshot to compare against"})
+
+    etag = page_etag(entry["id"], params)
+    cache_headers = {**get_results_cache_headers(), "ETag": etag}
+    if etag_matches(request.header("If-None-Match"), etag):
+        return 304, {**get_cors_headers(), **cache_headers}, b""
+
+    return json_response(200, {
+        "success": True,
+        "data": {**movers_view(entry["diff"], params["limit"]), "createdAt": entry["createdAt"], **params}
+    }, cache_headers)
+
+async def results_window(request):
+    """Handle one page of the leaderboard for a time window, summed from daily buckets"""
+    try:
+        params = parse_window_params(request.query)
+    except ValueError as e:
+        return json_response(400, {"error": str(e)})
+
+    try:
+        cache = get_window_cache(params["from"], params["to"])
+        entry = cache.peek() or await asyncio.to_thread(cache.get)
+    except Exception as e:
+        print(f"Error fetching window leaderboard: {e}")
+        return json_response(500, {"error": f"Error fetching data: {str(e)}"})
+
+    if entry["id"] is None:
+        return json_response(404, {"success": False, "message": "No analysis results found"})
+
+    etag = page_etag(entry["id"], params)
+    cache_headers = {**get_results_cache_headers(), "ETag": etag}
+    if etag_matches(request.header("If-None-Match"), etag):
+        return 304, {**get_cors_headers(), **cache_headers}, b""
+
+    ranking_data = entry["rankingData"]
+    return json_response(200, {
+        "success": True,
+        "data": {"rankingData": ranking_data[params["offset"]:params["offset"] + params["limit"]],
+                 "total": len(ranking_data), "createdAt": entry["createdAt"], **params}
+    }, cache_headers)
+
+async def results_scope(request):
+    """Handle one page of the leaderboard of a single course or AI assistant"""
+    try:
+        params = parse_scope_params(request.query)
+    except ValueError as e:
+        return json_response(400, {"error": str(e)})
+
+    scope = params["scope"]
+    try:
+        cache = get_scope_cache(scope, params[scope])
+        entry = cache.peek() or await asyncio.to_thread(cache.get)
+    except Exception as e:
+        print(f"Error fetching scoped leaderboard: {e}")
+        return json_response(500, {"error": f"Error fetching data: {str(e)}"})
+
+    if entry["id"] is None or not entry["rankingData"]:
+        return json_response(404, {"success": False, "message": f"No leaderboard found for {scope} {params[scope]}"})
+
+    etag = page_etag(entry["id"], params)
+    cache_headers = {**get_results_cache_headers(), "ETag": etag}
+    if etag_matches(request.header("If-None-Match"), etag):
+        return 304, {**get_cors_headers(), **cache_headers}, b""
+
+    ranking_data = entry["rankingData"]
+    return json_response(200, {
+        "success": True,
+        "data": {"rankingData": ranking_data[params["offset"]:params["offset"] + params["limit"]],
+                 "total": len(ranking_data), **params}
+    }, cache_headers)
+
+async def learner(request):
+    """Handle learner lookup by email and name/email prefix search (public endpoint)"""
+    email = request.query.get("email", [""])[0].strip()
+    search = request.query.get("q", [""])[0].strip()
+    if not email and not search:
+        return json_response(400, {"error": "email or q parameter required"})
+
+    try:
+        limit = int(request.query.get("limit", [DEFAULT_SEARCH_RESULTS])[0])
+    except ValueError:
+        limit = 0
+    if limit < 1 or limit > MAX_SEARCH_RESULTS:
+        return json_response(400, {"error": f"limit must be between 1 and {MAX_SEARCH_RESULTS}"})
+
+    try:
+        leaderboard = await cached_leaderboard()
+    except Exception as e:
+        print(f"Error looking up learner: {e}")
+        return json_response(500, {"error": f"Error fetching data: {str(e)}"})
+
+    if leaderboard["id"] is None:
+        return json_response(404, {"success": False, "message": "No analysis results found"})
+
+    try:
+        if email:
+            found = await asyncio.to_thread(find_learner, leaderboard, email)
+            if found is None:
+                return json_response(404, {"success": False, "message": "Learner not found"})
+            data = {**found, "createdAt": leaderboard["createdAt"]}
+        else:
+            matches = await asyncio.to_thread(search_learners, leaderboard, search, limit)
+            data = {"matches": matches, "createdAt": leaderboard["createdAt"]}
+    except Exception as e:
+        print(f"Error looking up learner: {e}")
+        return json_response(500, {"error": f"Error fetching data: {str(e)}"})
+    return json_response(200, {"success": True, "data": data}, get_results_cache_headers())
+
+async def clear(request):
+    """Handle clearing analysis data (admin only)"""
+    if not await is_admin(request):
+        return json_response(401, {"error": "Unauthorized. Admin access required."})
+
+    try:
+        await asyncio.to_thread(clear_analysis_results)
+        await asyncio.to_thread(clear_user_aggregates)
+        invalidate_results_cache()
+        clear_token_cache()
+    except Exception as e:
+        print(f"Error clearing data: {e}")
+        return json_response(500, {"error": f"Error clearing data: {str(e)}"})
+
+    return json_response(200, {"success": True, "message": "Analysis data cleared successfully"})
+
+async def health(request):
+    """Handle health check requests; ?deep=1 adds a database round trip and metrics"""
+    deep = wants_deep(request.query)
+    report = await asyncio.to_thread(health_report, True) if deep else health_report()
+    status = 200 if report["status"] == "healthy" else 503
+    if wants_prometheus(request.query):
+        return status, {**get_cors_headers(), "Content-Type": PROMETHEUS_CONTENT_TYPE,
+                        "Cache-Control": "no-store"}, render_prometheus(report).encode()
+    return json_response(status, report, {"Cache-Control": "no-store"})
+
+# Same paths and methods as the Vercel functions under api/
+ROUTES = {
+    "/api/auth/login": {"POST": login},
+    "/api/auth/logout": {"POST": logout},
+    "/api/data/upload": {"POST": upload},
+    "/api/data/jobs": {"GET": jobs},
+    "/api/data/results": {"GET": results},
+    "/api/data/learner": {"GET": learner},
+    "/api/data/clear": {"DELETE": clear, "POST": clear},
+    "/api/health": {"GET": health},
+}
+
+async def lifespan(receive, send):
+    """Handle ASGI lifespan events, stopping the scoring pool on shutdown"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(shutdown_scoring_pool)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    """ASGI application serving every API route on one event loop"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    request = Request(scope, receive)
+    methods = ROUTES.get(request.path.rstrip("/"))
+    with collect_timings() as timings:
+        try:
+            if methods is None:
+                response = json_response(404, {"error": "Not found"})
+            elif request.method == "OPTIONS":
+                response = 200, get_cors_headers(), b""
+            elif request.method not in methods:
+                response = json_response(405, {"error": "Method not allowed"})
+            else:
+                response = await methods[request.method](request)
+        except Exception as e:
+            print(f"Error in {request.path} endpoint: {e}")
+            response = json_response(500, {"error": "Internal server error"})
+
+        status, headers, body = response
+        await send_response(send, status, {**headers, **timing_headers(timings)}, body)
+        finish_request(request.method, request.path, status, timings)
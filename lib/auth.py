@@ -1,8 +1,21 @@
 import os
-import jwt
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from lib.database import save_admin_session, validate_admin_session
 
+# Verified tokens are re-checked against admin_sessions at least this often (seconds)
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "60"))
+
+# Maximum number of verified tokens kept per warm instance
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "256"))
+
+# token -> epoch seconds after which the session must be validated again
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+token_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
 def validate_admin_credentials(username, password):
     """Validate admin credentials against environment variables"""
     admin_username = os.environ.get("ADMIN_USERNAME")
@@ -15,6 +28,8 @@ def validate_admin_credentials(username, password):
 
 def generate_admin_token():
     """Generate JWT token for admin authentication"""
+    import jwt
+    
     jwt_secret = os.environ.get("JWT_SECRET")
     if not jwt_secret:
         raise ValueError("JWT secret not configured")
@@ -40,6 +55,9 @@ def verify_admin_token(authorization_header):
     if not authorization_header:
         return False
     
+    # Imported here so endpoints that never check a token skip loading PyJWT and its crypto backends
+    import jwt
+    
     try:
         # Extract token from "Bearer <token>" format
         if not authorization_header.startswith("Bearer "):
@@ -58,8 +76,16 @@ def verify_admin_token(authorization_header):
         if not payload.get("admin"):
             return False
         
+        # Recently validated sessions skip the database round trip
+        if _is_token_cached(token):
+            return True
+        
         # Validate session in database
-        return validate_admin_session(token)
+        if not validate_admin_session(token):
+            return False
+        
+        _cache_token(token, payload.get("exp"))
+        return True
         
     except jwt.ExpiredSignatureError:
         return False
@@ -69,6 +95,55 @@ def verify_admin_token(authorization_header):
         print(f"Error verifying admin token: {e}")
         return False
 
+def _is_token_cached(token):
+    """Check for an unexpired verified entry, counting the hit or miss"""
+    with _token_cache_lock:
+        expires_at = _token_cache.get(token)
+        if expires_at is not None and time.time() < expires_at:
+            _token_cache.move_to_end(token)
+            token_cache_stats["hits"] += 1
+            return True
+        if expires_at is not None:
+            del _token_cache[token]
+        token_cache_stats["misses"] += 1
+        return False
+
+def _cache_token(token, jwt_expires_at):
+    """Remember a verified token until its JWT expiry or the revalidation TTL"""
+    expires_at = time.time() + TOKEN_CACHE_TTL
+    if jwt_expires_at is not None:
+        expires_at = min(expires_at, float(jwt_expires_at))
+    
+    with _token_cache_lock:
+        _token_cache[token] = expires_at
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+            token_cache_stats["evictions"] += 1
+
+def invalidate_admin_token(token):
+    """Drop a token from the verified token cache"""
+    with _token_cache_lock:
+        if _token_cache.pop(token, None) is not None:
+            token_cache_stats["invalidations"] += 1
+
+def clear_token_cache():
+    """Drop every cached token so all sessions are validated again"""
+    with _token_cache_lock:
+        token_cache_stats["invalidations"] += len(_token_cache)
+        _token_cache.clear()
+
+def get_token_cache_stats():
+    """Get hit/miss counters and the current size of the verified token cache"""
+    with _token_cache_lock:
+        return {**token_cache_stats, "size": len(_token_cache)}
+
+def get_bearer_token(authorization_header):
+    """Extract the token from a "Bearer <token>" Authorization header"""
+    if not authorization_header or not authorization_header.startswith("Bearer "):
+        return None
+    return authorization_header.split(" ")[1]
+
 def get_cors_headers():
     """Get CORS headers for API responses"""
     return {
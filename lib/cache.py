@@ -0,0 +1,264 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from lib.database import (get_latest_results_artifact, get_latest_leaderboard, get_latest_analysis_id,
+                          get_latest_snapshot_diff, get_daily_buckets, get_scope_rankings, get_snapshot_ranking,
+                          get_snapshot_ranking_page, get_snapshot_rankings_at)
+from lib.leaderboard import (prepare_leaderboard, build_window_leaderboard, scope_record_to_entry,
+                             normalize_search_key)
+from lib.artifacts import unencoded_etag
+
+# Seconds a warm instance serves cached results before rechecking the latest id
+RESULTS_CACHE_TTL = float(os.environ.get("RESULTS_CACHE_TTL", "15"))
+
+# Distinct time windows kept warm per instance (week, month and a few custom ranges)
+WINDOW_CACHE_SIZE = int(os.environ.get("WINDOW_CACHE_SIZE", "16"))
+
+# Distinct course and assistant leaderboards kept warm per instance
+SCOPE_CACHE_SIZE = int(os.environ.get("SCOPE_CACHE_SIZE", "32"))
+
+# Seconds a CDN may keep serving a stale response while it revalidates in the background
+RESULTS_STALE_WHILE_REVALIDATE = int(os.environ.get("RESULTS_STALE_WHILE_REVALIDATE", "300"))
+
+class SnapshotCache:
+    """Warm-instance cache of one value derived from the latest analysis results
+    
+    Within RESULTS_CACHE_TTL the cached value is served without touching the
+    database. After that a cheap lookup of the latest analysis id decides
+    whether the value is still current or must be reloaded.
+    """
+    
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._entry = None
+        self._checked_at = 0.0
+        # Hits skip the database, revalidations cost one id lookup, misses a full fetch
+        self.stats = {"hits": 0, "revalidations": 0, "misses": 0, "invalidations": 0}
+    
+    def get(self):
+        """Get the cached entry, refreshing it when stale"""
+        with self._lock:
+            entry = self._entry
+            now = time.monotonic()
+            
+            if entry is not None and now - self._checked_at < RESULTS_CACHE_TTL:
+                self.stats["hits"] += 1
+                return entry
+            
+            if entry is not None and entry["id"] is not None and get_latest_analysis_id() == entry["id"]:
+                self.stats["revalidations"] += 1
+                self._checked_at = now
+                return entry
+            
+            self.stats["misses"] += 1
+            self._entry = self._loader() or {"id": None}
+            self._checked_at = now
+            return self._entry
+    
+    def peek(self):
+        """Get the cached entry only if it can be served without a database call
+        
+        Never blocks: returns None while another thread holds the lock (e.g. it
+        is refreshing the entry) or once the entry is due for revalidation.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if self._entry is not None and time.monotonic() - self._checked_at < RESULTS_CACHE_TTL:
+                self.stats["hits"] += 1
+                return self._entry
+            return None
+        finally:
+            self._lock.release()
+    
+    def invalidate(self):
+        """Drop the cached entry so the next read reloads it"""
+        with self._lock:
+            self._entry = None
+            self._checked_at = 0.0
+            self.stats["invalidations"] += 1
+
+class KeyedSnapshotCache:
+    """Bounded set of SnapshotCaches, one per key, evicting the least recently used key"""
+    
+    def __init__(self, loader, max_entries):
+        self._loader = loader
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._caches = OrderedDict()
+    
+    def cache_for(self, *key):
+        """Get the SnapshotCache of one key, creating it on first use"""
+        with self._lock:
+            cache = self._caches.get(key)
+            if cache is None:
+                cache = self._caches[key] = SnapshotCache(lambda: self._loader(*key))
+                if len(self._caches) > self._max_entries:
+                    self._caches.popitem(last=False)
+            else:
+                self._caches.move_to_end(key)
+            return cache
+    
+    def get(self, *key):
+        """Get the entry of one key, refreshing it when stale"""
+        return self.cache_for(*key).get()
+    
+    def clear(self):
+        """Drop every key's cache so the next reads reload them"""
+        with self._lock:
+            self._caches.clear()
+    
+    @property
+    def stats(self):
+        """Counters summed over the keys currently cached"""
+        with self._lock:
+            caches = list(self._caches.values())
+        totals = {"hits": 0, "revalidations": 0, "misses": 0, "invalidations": 0, "keys": len(caches)}
+        for cache in caches:
+            for key, value in cache.stats.items():
+                totals[key] += value
+        return totals
+
+def _load_results_entry():
+    """Load the pre-rendered results artifact with its strong ETag"""
+    artifact = get_latest_results_artifact()
+    if artifact is None:
+        return None
+    return {**artifact, "etag": '"' + artifact["contentHash"] + '"'}
+
+def load_ranking_entries(snapshot_id, positions):
+    """Read the ranking entries at rank-order positions of a snapshot, in the order given
+    
+    Position p holds rank p + 1, so a run of consecutive positions is one
+    rank-range read and scattered positions are read by rank.
+    """
+    if not positions:
+        return []
+    first, last = min(positions), max(positions)
+    if last - first + 1 == len(positions):
+        entries = get_snapshot_ranking_page(snapshot_id, first + 1, last + 1)
+    else:
+        entries = get_snapshot_rankings_at(snapshot_id, [position + 1 for position in positions])
+    by_rank = {entry["rank"]: entry for entry in entries}
+    return [by_rank[position + 1] for position in positions]
+
+def load_learner_entry(snapshot_id, email, position):
+    """Read one learner's ranking entry, by stored email or, when the casing differs, by rank"""
+    entry = get_snapshot_ranking(snapshot_id, email.strip())
+    return entry if entry is not None else load_ranking_entries(snapshot_id, [position])[0]
+
+def _load_leaderboard_entry():
+    """Load the latest snapshot's index; its ranking rows are read per page or lookup"""
+    leaderboard = get_latest_leaderboard()
+    if leaderboard is None:
+        return None
+    snapshot_id = leaderboard["id"]
+    return prepare_leaderboard(leaderboard,
+                               lambda positions: load_ranking_entries(snapshot_id, positions),
+                               lambda email, position: load_learner_entry(snapshot_id, email, position))
+
+def _load_diff_entry():
+    """Load the rank-movement diff stored with the latest snapshot"""
+    return get_latest_snapshot_diff()
+
+def _load_window_entry(start_day, end_day):
+    """Sum the daily buckets of one window into a ranked leaderboard"""
+    snapshot_id = get_latest_analysis_id()
+    if snapshot_id is None:
+        return None
+    
+    # Display names come from the all-time ranking rows of the learners active in the window
+    bucket_records = get_daily_buckets(start_day, end_day)
+    leaderboard = leaderboard_cache.get()
+    names = {}
+    if leaderboard["id"] is not None:
+        emails = leaderboard["index"]["learners"]["emails"]
+        positions = {emails.get(normalize_search_key(record["email"])) for record in bucket_records} - {None}
+        names = {entry["email"]: entry["name"] for entry in leaderboard["loadEntries"](sorted(positions))}
+    return {
+        "id": snapshot_id,
+        "createdAt": leaderboard.get("createdAt"),
+        "rankingData": build_window_leaderboard(bucket_records, names)
+    }
+
+def _load_scope_entry(scope, scope_value):
+    """Load the stored ranking of one course or assistant"""
+    snapshot_id = get_latest_analysis_id()
+    if snapshot_id is None:
+        return None
+    return {
+        "id": snapshot_id,
+        "rankingData": [scope_record_to_entry(record) for record in get_scope_rankings(scope, scope_value)]
+    }
+
+results_cache = SnapshotCache(_load_results_entry)
+leaderboard_cache = SnapshotCache(_load_leaderboard_entry)
+diff_cache = SnapshotCache(_load_diff_entry)
+window_caches = KeyedSnapshotCache(_load_window_entry, WINDOW_CACHE_SIZE)
+scope_caches = KeyedSnapshotCache(_load_scope_entry, SCOPE_CACHE_SIZE)
+
+def get_cached_results():
+    """Get the latest results response entry, refreshing it when stale
+    
+    Returns the pre-rendered artifact (id, body, gzip and br variants) plus its
+    ETag. The entry has no body when no analysis results exist.
+    """
+    return results_cache.get()
+
+def get_cached_leaderboard():
+    """Get the latest ranking data and index, refreshing them when stale"""
+    return leaderboard_cache.get()
+
+def get_cached_diff():
+    """Get the latest snapshot's diff entry, refreshing it when stale
+    
+    The entry's diff is None for the first snapshot, which has nothing to compare against.
+    """
+    return diff_cache.get()
+
+def get_window_cache(start_day, end_day):
+    """Get the cache for one window, evicting the least recently used window when full"""
+    return window_caches.cache_for(start_day, end_day)
+
+def get_cached_window(start_day, end_day):
+    """Get the ranked leaderboard of one inclusive day range, refreshing it when stale"""
+    return window_caches.get(start_day, end_day)
+
+def get_scope_cache(scope, scope_value):
+    """Get the cache for one course or assistant leaderboard"""
+    return scope_caches.cache_for(scope, scope_value)
+
+def get_cached_scope(scope, scope_value):
+    """Get the ranking of one course or assistant, refreshing it when stale"""
+    return scope_caches.get(scope, scope_value)
+
+def invalidate_results_cache():
+    """Drop cached results so the next read fetches them from the database"""
+    for cache in (results_cache, leaderboard_cache, diff_cache):
+        cache.invalidate()
+    window_caches.clear()
+    scope_caches.clear()
+
+def get_cache_stats():
+    """Get hit/revalidation/miss counters for each results cache"""
+    return {"results": dict(results_cache.stats), "leaderboard": dict(leaderboard_cache.stats),
+            "diff": dict(diff_cache.stats), "windows": window_caches.stats, "scopes": scope_caches.stats}
+
+def etag_matches(if_none_match, etag):
+    """Check an If-None-Match header value against an ETag or any content-coding of it"""
+    if not if_none_match or not etag:
+        return False
+    
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored; a client holding
+    # the gzip variant may now negotiate brotli, and its copy is just as current
+    candidates = [unencoded_etag(value.strip().removeprefix("W/")) for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def get_results_cache_headers():
+    """Get Cache-Control headers that let the CDN absorb bursts of reads"""
+    return {
+        "Cache-Control": (f"public, max-age=0, s-maxage={int(RESULTS_CACHE_TTL)}, "
+                          f"stale-while-revalidate={RESULTS_STALE_WHILE_REVALIDATE}")
+    }
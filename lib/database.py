@@ -1,64 +1,362 @@
 import os
+import sys
 import json
+import time
+import threading
+import http.client
 from datetime import datetime
-from supabase import create_client, Client
+from lib.postgrest import PostgrestReader
+from lib.artifacts import render_results_body, build_results_artifact, artifact_to_record, artifact_from_record
+from lib.timing import timed
+from lib.leaderboard import (build_leaderboard_index, ranking_entry_to_row, ranking_row_to_entry, RANKING_ROW_COLUMNS,
+                             bucket_record_to_row, bucket_row_to_record, DAILY_BUCKET_ROW_COLUMNS,
+                             scope_record_to_row, scope_row_to_record, SCOPE_ROW_COLUMNS)
 
-def get_supabase_client() -> Client:
-    """Initialize and return Supabase client"""
+# Seconds before a Supabase REST request times out
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", "10"))
+
+# Retries for transient network errors, with exponential backoff starting at this delay
+SUPABASE_MAX_RETRIES = int(os.environ.get("SUPABASE_MAX_RETRIES", "2"))
+SUPABASE_RETRY_BACKOFF = float(os.environ.get("SUPABASE_RETRY_BACKOFF", "0.2"))
+
+# One client per warm instance; its HTTP session keeps connections alive between calls
+_client = None
+_client_lock = threading.Lock()
+
+# Reads go through a small http.client PostgREST reader, so read-only endpoints never load the SDK
+_reader = None
+
+# Each reuse is a client object that did not have to be created; connection reuse is up to its pool
+client_stats = {"created": 0, "reused": 0, "retries": 0}
+
+def _supabase_credentials():
+    """Supabase URL and anon key from the environment"""
     url = os.environ.get("SUPABASE_URL")
     key = os.environ.get("SUPABASE_ANON_KEY")
     
     if not url or not key:
         raise ValueError("Supabase URL and key must be set in environment variables")
+    return url, key
+
+def get_supabase_client():
+    """Return the shared Supabase client used for writes, creating it on first use"""
+    global _client
+    
+    if _client is not None:
+        client_stats["reused"] += 1
+        return _client
+    
+    with _client_lock:
+        if _client is None:
+            url, key = _supabase_credentials()
+            
+            # The SDK (with httpx and pydantic) takes hundreds of milliseconds to import, so only writes load it
+            from supabase import create_client, ClientOptions
+            _client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT))
+            client_stats["created"] += 1
+        else:
+            client_stats["reused"] += 1
+        return _client
+
+def get_read_client():
+    """Return the shared PostgREST reader used for selects, creating it on first use"""
+    global _reader
+    
+    if _reader is not None:
+        client_stats["reused"] += 1
+        return _reader
     
-    return create_client(url, key)
+    with _client_lock:
+        if _reader is None:
+            url, key = _supabase_credentials()
+            _reader = PostgrestReader(url, key, SUPABASE_TIMEOUT)
+            client_stats["created"] += 1
+        else:
+            client_stats["reused"] += 1
+        return _reader
+
+def reset_supabase_client():
+    """Drop the shared clients so the next call creates fresh ones"""
+    global _client, _reader
+    with _client_lock:
+        _client = None
+        _reader = None
+
+def _retryable_errors(idempotent):
+    """Transport errors worth retrying, for whichever HTTP clients are loaded"""
+    # The reader raises OSError (timeouts, resets) and http.client errors
+    errors = (OSError, http.client.HTTPException) if idempotent else (ConnectionRefusedError,)
+    
+    # httpx is only imported once the SDK has been, so its errors are only checked then
+    httpx = sys.modules.get("httpx")
+    if httpx is not None:
+        errors += (httpx.TransportError,) if idempotent else (httpx.ConnectError, httpx.ConnectTimeout)
+    return errors
+
+def _execute(query, idempotent=True):
+    """Execute a query, retrying transient network errors with backoff
+    
+    Non-idempotent writes are only retried when the connection could not be
+    established, so a request that may have reached the server is never repeated.
+    """
+    retryable = _retryable_errors(idempotent)
+    for attempt in range(SUPABASE_MAX_RETRIES + 1):
+        try:
+            return query.execute()
+        except retryable as e:
+            if attempt == SUPABASE_MAX_RETRIES:
+                raise
+            client_stats["retries"] += 1
+            print(f"Retrying Supabase request after {type(e).__name__} (attempt {attempt + 1})")
+            time.sleep(SUPABASE_RETRY_BACKOFF * (2 ** attempt))
+
+def get_client_stats():
+    """Get counters for client creation, reuse and retries"""
+    return {
+        "clientsCreated": client_stats["created"],
+        "clientsReused": client_stats["reused"],
+        "retries": client_stats["retries"]
+    }
+
+def _jsonb(value):
+    """Decode a JSONB value, tolerating rows written as double-encoded JSON strings"""
+    return json.loads(value) if isinstance(value, str) else value
+
+# Rows per request when reading snapshot rankings (PostgREST caps a response at 1000 rows by default)
+RANKING_READ_BATCH_SIZE = 1000
+
+# Ranks per in.() filter when reading scattered ranking rows, keeping the request URL short
+RANK_LOOKUP_BATCH_SIZE = 500
+
+RANKING_SELECT = ", ".join(column for _, column in RANKING_ROW_COLUMNS)
+DAILY_BUCKET_SELECT = ", ".join(column for _, column in DAILY_BUCKET_ROW_COLUMNS)
+SCOPE_SELECT = ", ".join(column for _, column in SCOPE_ROW_COLUMNS)
 
 def save_analysis_results(results_data):
-    """Save analysis results to Supabase"""
+    """Save a results snapshot, its per-user rankings and its pre-rendered response to Supabase
+    
+    The snapshot is inserted as pending, its rankings and the upload's daily
+    and scope buckets (results_data["dailyBuckets"], ["scopeRankings"]) are
+    bulk inserted in batches, its aggregates and row keys (["changedAggregates"],
+    ["newRowKeys"]) are staged against it, and only then does publish_snapshot
+    move the staged state into place and flip it to published, in one
+    transaction. Readers only see published snapshots and the buckets written
+    up to them, so a partially written upload is never served or merged onto.
+    With results_data["replaceState"] the new buckets, aggregates and row keys
+    replace every stored one instead of only those for the same learner and day
+    or the same scope.
+    """
     supabase = get_supabase_client()
     
+    created_at = datetime.utcnow().isoformat()
+    ranking_data = results_data["rankingData"]
+    raw_data_count = results_data.get("rawDataCount", len(results_data.get("rawData", [])))
+    
+    # Render and compress the public response once, at write time
+    body = render_results_body(results_data["summaryStats"], ranking_data, created_at, raw_data_count)
+    
     # Prepare data for insertion
     data = {
-        "created_at": datetime.utcnow().isoformat(),
-        "summary_stats": json.dumps(results_data["summaryStats"]),
-        "ranking_data": json.dumps(results_data["rankingData"]),
-        "raw_data_count": len(results_data.get("rawData", []))
+        "created_at": created_at,
+        "status": "pending",
+        "summary_stats": results_data["summaryStats"],
+        "raw_data_count": raw_data_count,
+        "user_count": len(ranking_data),
+        "leaderboard_index": build_leaderboard_index(ranking_data, results_data.get("scoreBreakdowns")),
+        "snapshot_diff": results_data.get("snapshotDiff"),
+        **artifact_to_record(build_results_artifact(body))
     }
     
     try:
-        # Insert new results (this will replace any existing data)
-        result = supabase.table("analysis_results").insert(data).execute()
-        return result.data[0] if result.data else None
+        snapshot = _execute(supabase.table("snapshots").insert(data), idempotent=False).data[0]
+        rows = [ranking_entry_to_row(snapshot["id"], entry) for entry in ranking_data]
+        bucket_rows = [bucket_record_to_row(snapshot["id"], record) for record in results_data.get("dailyBuckets", [])]
+        scope_rows = [scope_record_to_row(snapshot["id"], record) for record in results_data.get("scopeRankings", [])]
+        aggregate_rows = [{"snapshot_id": snapshot["id"], "email": email, "aggregate": record}
+                          for email, record in results_data.get("changedAggregates", {}).items()]
+        row_key_rows = [{"snapshot_id": snapshot["id"], "row_key": key} for key in results_data.get("newRowKeys", [])]
+        
+        try:
+            # Upserts keyed by snapshot_id are safe to retry after a timeout
+            for table, table_rows in (("snapshot_rankings", rows), ("user_daily_buckets", bucket_rows),
+                                      ("scope_rankings", scope_rows), ("pending_user_aggregates", aggregate_rows),
+                                      ("pending_ingested_rows", row_key_rows)):
+                for start in range(0, len(table_rows), STATE_WRITE_BATCH_SIZE):
+                    _execute(supabase.table(table).upsert(table_rows[start:start + STATE_WRITE_BATCH_SIZE]))
+            
+            # One transaction drops the buckets the new ones supersede, moves the staged state into place
+            # and publishes the snapshot
+            _execute(supabase.rpc("publish_snapshot", {"p_snapshot_id": snapshot["id"],
+                                                       "p_replace": bool(results_data.get("replaceState"))}))
+        except Exception:
+            # Drop the pending snapshot; its rankings, buckets and staged state go with it by ON DELETE CASCADE
+            _execute(supabase.table("snapshots").delete().eq("id", snapshot["id"]))
+            raise
+        
+        return {"id": snapshot["id"], "created_at": created_at, "status": "published"}
     except Exception as e:
         print(f"Error saving analysis results: {e}")
         raise
 
+def _latest_snapshot(columns):
+    """Select columns of the most recent published snapshot, or None"""
+    reader = get_read_client()
+    result = _execute(reader.table("snapshots").select(columns)
+                      .eq("status", "published").order("id", desc=True).limit(1))
+    return result.data[0] if result.data else None
+
+def get_snapshot_rankings(snapshot_id):
+    """Get a snapshot's ranking entries in rank order, reading them in batches"""
+    reader = get_read_client()
+    rows = []
+    
+    try:
+        while True:
+            result = _execute(reader.table("snapshot_rankings").select(RANKING_SELECT)
+                              .eq("snapshot_id", snapshot_id).order("rank")
+                              .range(len(rows), len(rows) + RANKING_READ_BATCH_SIZE - 1))
+            rows.extend(result.data)
+            if len(result.data) < RANKING_READ_BATCH_SIZE:
+                return [ranking_row_to_entry(row) for row in rows]
+    except Exception as e:
+        print(f"Error fetching snapshot rankings: {e}")
+        raise
+
+def get_snapshot_ranking(snapshot_id, email):
+    """Get one learner's ranking entry in a snapshot, or None"""
+    reader = get_read_client()
+    
+    try:
+        result = _execute(reader.table("snapshot_rankings").select(RANKING_SELECT)
+                          .eq("snapshot_id", snapshot_id).eq("email", email).limit(1))
+        return ranking_row_to_entry(result.data[0]) if result.data else None
+    except Exception as e:
+        print(f"Error fetching snapshot ranking: {e}")
+        raise
+
+def get_snapshot_ranking_page(snapshot_id, first_rank, last_rank):
+    """Get a snapshot's ranking entries with first_rank <= rank <= last_rank, in rank order"""
+    reader = get_read_client()
+    rows = []
+    
+    try:
+        # A page is at most MAX_PAGE_SIZE rows, but stay under PostgREST's response cap regardless
+        for start in range(first_rank, last_rank + 1, RANKING_READ_BATCH_SIZE):
+            result = _execute(reader.table("snapshot_rankings").select(RANKING_SELECT)
+                              .eq("snapshot_id", snapshot_id).gte("rank", start)
+                              .lte("rank", min(start + RANKING_READ_BATCH_SIZE - 1, last_rank)).order("rank"))
+            rows.extend(result.data)
+        return [ranking_row_to_entry(row) for row in rows]
+    except Exception as e:
+        print(f"Error fetching snapshot ranking page: {e}")
+        raise
+
+def get_snapshot_rankings_at(snapshot_id, ranks):
+    """Get a snapshot's ranking entries at the given ranks, in rank order"""
+    reader = get_read_client()
+    rows = []
+    
+    try:
+        unique_ranks = sorted(set(ranks))
+        for start in range(0, len(unique_ranks), RANK_LOOKUP_BATCH_SIZE):
+            batch = unique_ranks[start:start + RANK_LOOKUP_BATCH_SIZE]
+            result = _execute(reader.table("snapshot_rankings").select(RANKING_SELECT)
+                              .eq("snapshot_id", snapshot_id).in_("rank", batch).order("rank"))
+            rows.extend(result.data)
+        return [ranking_row_to_entry(row) for row in rows]
+    except Exception as e:
+        print(f"Error fetching snapshot rankings by rank: {e}")
+        raise
+
 def get_latest_analysis_results():
     """Get the most recent analysis results from Supabase"""
-    supabase = get_supabase_client()
-    
     try:
-        result = supabase.table("analysis_results").select("*").order("created_at", desc=True).limit(1).execute()
+        snapshot = _latest_snapshot("id, created_at, summary_stats, raw_data_count")
         
-        if result.data:
-            data = result.data[0]
+        if snapshot:
             return {
-                "summaryStats": json.loads(data["summary_stats"]),
-                "rankingData": json.loads(data["ranking_data"]),
-                "createdAt": data["created_at"],
-                "rawDataCount": data["raw_data_count"]
+                "id": snapshot["id"],
+                "summaryStats": _jsonb(snapshot["summary_stats"]),
+                "rankingData": get_snapshot_rankings(snapshot["id"]),
+                "createdAt": snapshot["created_at"],
+                "rawDataCount": snapshot["raw_data_count"]
             }
         return None
     except Exception as e:
         print(f"Error fetching analysis results: {e}")
         raise
 
+def get_latest_results_artifact():
+    """Get the pre-rendered response of the most recent analysis results"""
+    try:
+        # Only the snapshot row is read; none of its rankings are needed
+        snapshot = _latest_snapshot("id, content_hash, response_body, response_gzip, response_br")
+        
+        if not snapshot:
+            return None
+        
+        if snapshot.get("response_body"):
+            artifact = artifact_from_record(snapshot)
+        else:
+            # Snapshots migrated from rows saved before artifacts existed are rendered once here
+            results = get_latest_analysis_results()
+            artifact = build_results_artifact(render_results_body(
+                results["summaryStats"], results["rankingData"], results["createdAt"], results["rawDataCount"]))
+        artifact["id"] = snapshot["id"]
+        return artifact
+    except Exception as e:
+        print(f"Error fetching results artifact: {e}")
+        raise
+
+def get_latest_leaderboard():
+    """Get the most recent snapshot's precomputed sort, achievement and learner index
+    
+    Ranking rows are not included; pages and lookups read only the rows they return.
+    """
+    try:
+        snapshot = _latest_snapshot("id, created_at, leaderboard_index")
+        
+        if not snapshot:
+            return None
+        
+        # Snapshots migrated without an index are indexed from their rankings once
+        index = _jsonb(snapshot.get("leaderboard_index")) or build_leaderboard_index(get_snapshot_rankings(snapshot["id"]))
+        return {
+            "id": snapshot["id"],
+            "createdAt": snapshot["created_at"],
+            "index": index
+        }
+    except Exception as e:
+        print(f"Error fetching leaderboard: {e}")
+        raise
+
+def get_latest_snapshot_diff():
+    """Get the rank-movement diff stored with the most recent snapshot"""
+    try:
+        snapshot = _latest_snapshot("id, created_at, snapshot_diff")
+        
+        if not snapshot:
+            return None
+        return {"id": snapshot["id"], "createdAt": snapshot["created_at"], "diff": _jsonb(snapshot["snapshot_diff"])}
+    except Exception as e:
+        print(f"Error fetching snapshot diff: {e}")
+        raise
+
+def get_latest_analysis_id():
+    """Get the id of the most recent analysis results, or None when there are none"""
+    try:
+        snapshot = _latest_snapshot("id")
+        return snapshot["id"] if snapshot else None
+    except Exception as e:
+        print(f"Error fetching latest analysis id: {e}")
+        raise
+
 def clear_analysis_results():
-    """Clear all analysis results from Supabase"""
+    """Clear all snapshots (and, by cascade, their rankings, daily buckets and scope rankings) from Supabase"""
     supabase = get_supabase_client()
     
     try:
-        result = supabase.table("analysis_results").delete().neq("id", 0).execute()
+        _execute(supabase.table("snapshots").delete().neq("id", 0))
         return True
     except Exception as e:
         print(f"Error clearing analysis results: {e}")
@@ -75,20 +373,251 @@ def save_admin_session(token, expires_at):
     }
     
     try:
-        result = supabase.table("admin_sessions").insert(data).execute()
+        result = _execute(supabase.table("admin_sessions").insert(data), idempotent=False)
         return result.data[0] if result.data else None
     except Exception as e:
         print(f"Error saving admin session: {e}")
         raise
 
+def delete_admin_session(token):
+    """Delete an admin session token from Supabase"""
+    supabase = get_supabase_client()
+    
+    try:
+        _execute(supabase.table("admin_sessions").delete().eq("token", token))
+        return True
+    except Exception as e:
+        print(f"Error deleting admin session: {e}")
+        raise
+
 def validate_admin_session(token):
     """Validate admin session token"""
-    supabase = get_supabase_client()
+    reader = get_read_client()
     
     try:
-        result = supabase.table("admin_sessions").select("*").eq("token", token).gt("expires_at", datetime.utcnow().isoformat()).execute()
+        result = _execute(reader.table("admin_sessions").select("*").eq("token", token).gt("expires_at", datetime.utcnow().isoformat()))
         return len(result.data) > 0
     except Exception as e:
         print(f"Error validating admin session: {e}")
         return False
 
+
+# Rows per request when bulk writing or looking up aggregate state
+STATE_WRITE_BATCH_SIZE = 1000
+ROW_KEY_LOOKUP_BATCH_SIZE = 200
+
+def get_user_aggregates():
+    """Get the stored per-user aggregate records keyed by email, reading them in batches"""
+    reader = get_read_client()
+    aggregates = {}
+    
+    try:
+        while True:
+            result = _execute(reader.table("user_aggregates").select("email, aggregate").order("email")
+                              .range(len(aggregates), len(aggregates) + RANKING_READ_BATCH_SIZE - 1))
+            aggregates.update((row["email"], _jsonb(row["aggregate"])) for row in result.data)
+            if len(result.data) < RANKING_READ_BATCH_SIZE:
+                return aggregates
+    except Exception as e:
+        print(f"Error fetching user aggregates: {e}")
+        raise
+
+def save_user_aggregates(aggregate_records):
+    """Upsert per-user aggregate records keyed by email"""
+    supabase = get_supabase_client()
+    updated_at = datetime.utcnow().isoformat()
+    rows = [{"email": email, "aggregate": record, "updated_at": updated_at}
+            for email, record in aggregate_records.items()]
+    
+    try:
+        for start in range(0, len(rows), STATE_WRITE_BATCH_SIZE):
+            _execute(supabase.table("user_aggregates").upsert(rows[start:start + STATE_WRITE_BATCH_SIZE]))
+        return len(rows)
+    except Exception as e:
+        print(f"Error saving user aggregates: {e}")
+        raise
+
+def find_ingested_row_keys(row_keys):
+    """Return the subset of row keys that earlier uploads already ingested"""
+    reader = get_read_client()
+    known = set()
+    
+    try:
+        unique_keys = list(dict.fromkeys(row_keys))
+        for start in range(0, len(unique_keys), ROW_KEY_LOOKUP_BATCH_SIZE):
+            batch = unique_keys[start:start + ROW_KEY_LOOKUP_BATCH_SIZE]
+            result = _execute(reader.table("ingested_rows").select("row_key").in_("row_key", batch))
+            known.update(row["row_key"] for row in result.data)
+        return known
+    except Exception as e:
+        print(f"Error looking up ingested rows: {e}")
+        raise
+
+def save_ingested_row_keys(row_keys):
+    """Record row keys so re-sent rows are not counted again"""
+    supabase = get_supabase_client()
+    created_at = datetime.utcnow().isoformat()
+    rows = [{"row_key": key, "created_at": created_at} for key in row_keys]
+    
+    try:
+        for start in range(0, len(rows), STATE_WRITE_BATCH_SIZE):
+            _execute(supabase.table("ingested_rows").upsert(rows[start:start + STATE_WRITE_BATCH_SIZE]))
+        return len(rows)
+    except Exception as e:
+        print(f"Error saving ingested row keys: {e}")
+        raise
+
+def get_daily_buckets(start_day, end_day):
+    """Get the per-user daily buckets from start_day to end_day inclusive, reading them in batches
+    
+    Only buckets written up to the latest published snapshot are read; those of
+    an upload still being saved belong to a later, pending snapshot.
+    """
+    reader = get_read_client()
+    rows = []
+    
+    try:
+        snapshot = _latest_snapshot("id")
+        if not snapshot:
+            return []
+        
+        while True:
+            result = _execute(reader.table("user_daily_buckets").select(DAILY_BUCKET_SELECT)
+                              .gte("day", start_day).lte("day", end_day).lte("snapshot_id", snapshot["id"])
+                              .order("day").order("email")
+                              .range(len(rows), len(rows) + RANKING_READ_BATCH_SIZE - 1))
+            rows.extend(result.data)
+            if len(result.data) < RANKING_READ_BATCH_SIZE:
+                return [bucket_row_to_record(row) for row in rows]
+    except Exception as e:
+        print(f"Error fetching daily buckets: {e}")
+        raise
+
+def get_scope_rankings(scope, scope_value):
+    """Get the ranked bucket records of one course or assistant in rank order, reading them in batches
+    
+    Like daily buckets, only rows written up to the latest published snapshot are read.
+    """
+    reader = get_read_client()
+    rows = []
+    
+    try:
+        snapshot = _latest_snapshot("id")
+        if not snapshot:
+            return []
+        
+        while True:
+            result = _execute(reader.table("scope_rankings").select(SCOPE_SELECT)
+                              .eq("scope", scope).eq("scope_value", scope_value)
+                              .lte("snapshot_id", snapshot["id"]).order("rank")
+                              .range(len(rows), len(rows) + RANKING_READ_BATCH_SIZE - 1))
+            rows.extend(result.data)
+            if len(result.data) < RANKING_READ_BATCH_SIZE:
+                return [scope_row_to_record(row) for row in rows]
+    except Exception as e:
+        print(f"Error fetching scope rankings: {e}")
+        raise
+
+def clear_user_aggregates():
+    """Clear stored per-user aggregates and ingested row keys
+    
+    Daily buckets and scope rankings belong to snapshots: they are replaced when
+    a replace upload publishes and removed with the snapshots by clear_analysis_results.
+    """
+    supabase = get_supabase_client()
+    
+    try:
+        _execute(supabase.table("user_aggregates").delete().neq("email", ""))
+        _execute(supabase.table("ingested_rows").delete().neq("row_key", ""))
+        return True
+    except Exception as e:
+        print(f"Error clearing user aggregates: {e}")
+        raise
+
+def save_upload_job(job):
+    """Insert an upload job row"""
+    supabase = get_supabase_client()
+    
+    try:
+        result = _execute(supabase.table("upload_jobs").insert(job), idempotent=False)
+        return result.data[0] if result.data else None
+    except Exception as e:
+        print(f"Error saving upload job: {e}")
+        raise
+
+def update_upload_job(job_id, changes):
+    """Update columns of an upload job row"""
+    supabase = get_supabase_client()
+    
+    try:
+        _execute(supabase.table("upload_jobs").update(changes).eq("id", job_id))
+        return True
+    except Exception as e:
+        print(f"Error updating upload job: {e}")
+        raise
+
+def get_upload_job(job_id):
+    """Get an upload job row, or None when there is no such job"""
+    reader = get_read_client()
+    
+    try:
+        result = _execute(reader.table("upload_jobs").select("*").eq("id", job_id).limit(1))
+        if not result.data:
+            return None
+        return {**result.data[0], "result": _jsonb(result.data[0]["result"])}
+    except Exception as e:
+        print(f"Error fetching upload job: {e}")
+        raise
+
+def claim_upload_job(stale_before, job_id=None):
+    """Move the oldest queued upload job to scoring and return it, or None when none can be claimed
+    
+    The claim_upload_job database function takes an advisory lock, so only one
+    worker claims at a time. Under it, jobs whose heartbeat is older than
+    stale_before are requeued (scoring) or failed (saving, or synchronous), and
+    nothing is claimed while another job is still scoring or saving. A
+    synchronous upload's job is only claimed when its request passes job_id.
+    """
+    supabase = get_supabase_client()
+    params = {"p_stale_before": stale_before, "p_now": datetime.utcnow().isoformat(), "p_job_id": job_id}
+    
+    try:
+        # A repeated claim would find the first one's job active and return nothing, so it is not retried
+        claimed = _execute(supabase.rpc("claim_upload_job", params), idempotent=False)
+        return claimed.data[0] if claimed.data else None
+    except Exception as e:
+        print(f"Error claiming upload job: {e}")
+        raise
+
+
+# Functions every storage backend implements; lib.database always exports these names
+STORAGE_FUNCTIONS = (
+    "save_analysis_results", "get_latest_analysis_results", "get_latest_results_artifact",
+    "get_latest_leaderboard", "get_latest_analysis_id", "get_snapshot_rankings", "get_snapshot_ranking",
+    "get_snapshot_ranking_page", "get_snapshot_rankings_at", "get_latest_snapshot_diff", "clear_analysis_results",
+    "save_admin_session", "delete_admin_session", "validate_admin_session",
+    "get_user_aggregates", "save_user_aggregates", "find_ingested_row_keys",
+    "save_ingested_row_keys", "get_daily_buckets", "get_scope_rankings", "clear_user_aggregates",
+    "save_upload_job", "update_upload_job", "get_upload_job", "claim_upload_job", "get_client_stats",
+)
+
+# "supabase" (default) or "sqlite" for an embedded database file on single-node installs
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").strip().lower()
+
+if STORAGE_BACKEND == "sqlite":
+    from lib.sqlite_database import (save_analysis_results, get_latest_analysis_results, get_latest_results_artifact,
+                                     get_latest_leaderboard, get_latest_analysis_id, get_snapshot_rankings,
+                                     get_snapshot_ranking, get_snapshot_ranking_page, get_snapshot_rankings_at,
+                                     get_latest_snapshot_diff, clear_analysis_results, save_admin_session,
+                                     delete_admin_session, validate_admin_session, get_user_aggregates,
+                                     save_user_aggregates, find_ingested_row_keys, save_ingested_row_keys,
+                                     get_daily_buckets, get_scope_rankings, clear_user_aggregates,
+                                     save_upload_job, update_upload_job, get_upload_job, claim_upload_job,
+                                     get_client_stats)
+elif STORAGE_BACKEND != "supabase":
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+# Every storage call is added to the timed request's Server-Timing header and log line
+for _name in STORAGE_FUNCTIONS:
+    if _name != "get_client_stats":
+        globals()[_name] = timed(f"db.{_name}")(globals()[_name])
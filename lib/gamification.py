@@ -1,216 +1,654 @@
 import pandas as pd
+import numpy as np
 import json
+import hashlib
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import io
 
+from lib.timing import stage, timed_iter, record
+from lib.rubric import get_rubric
+
+def analyze_question_quality_batch(inputs, outputs):
+    """Score whole input/output columns with the question quality rubric"""
+    return get_rubric().score_questions(inputs, outputs)
+
+def question_criteria(*matched):
+    """Build the criteria labels for one scored question from its match per rubric rule"""
+    return get_rubric().question_criteria(matched)
+
 def analyze_question_quality(input_text, output_text):
     """Analyze question quality based on established rubrics"""
     if not input_text or not output_text:
         return {"points": 0, "criteria": []}
     
-    points = 1  # Base point for asking a question
-    criteria = []
+    rubric = get_rubric()
+    scores = rubric.score_questions([input_text], [output_text])
+    return {
+        "points": int(scores["points"][0]),
+        "criteria": rubric.question_criteria([scores[rule_id][0] for rule_id in rubric.rule_ids])
+    }
+
+def count_follow_ups(user_interactions):
+    """Count follow-up questions within one user's interactions"""
+    # Every interaction after the first in a course/conversation counts as a follow-up
+    course_ids = set(_course_key(i.get('course_id')) for i in user_interactions)
+    return len(user_interactions) - len(course_ids)
+
+def detect_follow_up_questions(interactions, user_email):
+    """Detect follow-up questions for a specific user"""
+    user_interactions = [i for i in interactions if i.get('email') == user_email]
+    return count_follow_ups(user_interactions)
+
+def _course_key(course_id):
+    """Normalize a course id so blank cells group together as one conversation"""
+    if course_id is None or (isinstance(course_id, float) and course_id != course_id):
+        return 'unknown'
+    return str(course_id)
+
+def _column(chunk, name, default):
+    """Return a chunk column, or a constant column when the export lacks it"""
+    if name in chunk.columns:
+        return chunk[name]
+    return pd.Series([default] * len(chunk), index=chunk.index, dtype=object)
+
+def _present(values):
+    """Mask of non-blank cells in a column"""
+    return values.notna() & values.astype(bool)
+
+def _scope_values(values):
+    """Trimmed scope cells, None where blank, matching how scope filters are parsed"""
+    trimmed = values.where(_present(values), '').map(str).str.strip()
+    return trimmed.where(trimmed.astype(bool), None).to_numpy(dtype=object)
+
+def new_user_aggregate(name):
+    """Create the running totals kept for one user while folding interactions"""
+    return {
+        "name": name,
+        "totalInteractions": 0,
+        "totalCredits": 0,
+        "questionPoints": 0,
+        # Questions matching each rubric rule
+        **{rule_id: 0 for rule_id in get_rubric().rule_ids},
+        "durationSumMs": 0,
+        "ttftSumMs": 0,
+        "successCount": 0,
+        "courseIds": set(),
+        "courses": set(),
+        "assistants": set()
+    }
+
+# Totals kept per user and calendar day, course and assistant, so windowed and
+# scoped leaderboards only sum or sort buckets
+BUCKET_FIELDS = ["totalInteractions", "totalCredits", "questionPoints", "followUps",
+                 "durationSumMs", "ttftSumMs", "successCount"]
+
+# Scoped leaderboards: scope name -> interaction column that identifies the scope
+SCOPE_COLUMNS = {"course": "course_name", "assistant": "instance_ainame"}
+
+def new_activity_buckets(stored_aggregates=None):
+    """Create the per-day and per-scope user totals folded alongside user aggregates
+    
+    Conversations already in stored aggregates count as seen, so an appended
+    row in one of them is a follow-up on its own day and in its own course.
+    Conversations opened by this upload keep their question row's timestamp,
+    day and scopes, so a chunk holding an earlier row can take the question over.
+    """
+    return {
+        "days": {},
+        "scopes": {},
+        "courseIds": {email: set(aggregate["courseIds"]) for email, aggregate in (stored_aggregates or {}).items()},
+        "questions": {}
+    }
+
+def _add_bucket_totals(buckets, keys, totals):
+    """Add grouped totals onto the buckets with the same keys"""
+    for key, row in zip(keys, totals.to_numpy(dtype=np.int64).tolist()):
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = row
+        else:
+            buckets[key] = [total + value for total, value in zip(bucket, row)]
+
+def _add_follow_up(buckets, key):
+    """Count one more follow-up in a bucket, creating it when this fold has not added to it yet"""
+    bucket = list(buckets.get(key, [0] * len(BUCKET_FIELDS)))
+    bucket[BUCKET_FIELDS.index("followUps")] += 1
+    buckets[key] = bucket
+
+def _fold_activity_buckets(activity, columns, course_ids, created, scope_values):
+    """Add one chunk's per-row totals to the (email, day) and (scope, value, email) buckets"""
+    frame = pd.DataFrame({**columns, **scope_values, "courseId": course_ids,
+                          "created": pd.to_datetime(created, errors='coerce', utc=True, format='ISO8601')})
+    
+    # The earliest row of each (user, conversation) is the question; every later one is a follow-up
+    frame = frame.sort_values('created', kind='stable')
+    first_in_chunk = ~frame.duplicated(['email', 'courseId']).to_numpy()
+    follow_ups = ~first_in_chunk
+    created = frame['created'].dt.tz_localize(None).to_numpy()[first_in_chunk]
+    days = np.datetime_as_string(created.astype('datetime64[D]'), unit='D')
+    scopes = zip(*(frame[scope].to_numpy()[first_in_chunk] for scope in SCOPE_COLUMNS))
+    seen, questions = activity["courseIds"], activity["questions"]
+    handed_over = []
+    for position, email, course_id, row_created, day, row_scopes in zip(
+            np.flatnonzero(first_in_chunk), frame['email'].to_numpy()[first_in_chunk],
+            frame['courseId'].to_numpy()[first_in_chunk], created, days, scopes):
+        courses = seen.setdefault(email, set())
+        opened = questions.setdefault(email, {})
+        if course_id in courses:
+            # Stored conversations and ones whose question is no later than this row keep their question
+            question = opened.get(course_id)
+            if question is None or np.isnat(row_created) or not (np.isnat(question[0]) or row_created < question[0]):
+                follow_ups[position] = True
+                continue
+            handed_over.append((email, question))
+        courses.add(course_id)
+        opened[course_id] = (row_created, None if np.isnat(row_created) else day,
+                             tuple(None if pd.isna(value) else value for value in row_scopes))
+    frame['followUps'] = follow_ups.astype(np.int64)
     
-    # Check for goal-aligned questions (exam prep, class topics)
-    goal_keywords = ['exam', 'test', 'certification', 'comptia', 'class', 'course', 
-                     'assignment', 'homework', 'study', 'cert prep', 'calendar', 'upcoming']
-    if any(keyword in input_text.lower() for keyword in goal_keywords):
-        points += 2
-        criteria.append("Goal-aligned question (+2 pts)")
+    # A question row from an earlier chunk that an earlier row took over from is a follow-up after all
+    for email, (_, day, row_scopes) in handed_over:
+        if day is not None:
+            _add_follow_up(activity["days"], (email, day))
+        for scope, value in zip(SCOPE_COLUMNS, row_scopes):
+            if value is not None:
+                _add_follow_up(activity["scopes"], (scope, value, email))
     
-    # Check for specific topics/keywords
-    topic_keywords = ['subnetting', 'networking', 'security', 'hardware', 'troubleshooting', 
-                      'attendance', 'health check', 'assistant', 'coach', 'tutor']
-    if any(keyword in input_text.lower() for keyword in topic_keywords):
-        points += 1
-        criteria.append("Specific topic/keyword (+1 pt)")
+    # Rows without a course or assistant only count towards the scopes they have
+    for scope in SCOPE_COLUMNS:
+        totals = frame.groupby([scope, 'email'], sort=False)[BUCKET_FIELDS].sum()
+        _add_bucket_totals(activity["scopes"], ((scope, value, email) for value, email in totals.index), totals)
     
-    # Check for structured/long response (>50 words)
-    if len(output_text.split()) > 50:
-        points += 1
-        criteria.append("Detailed response received (+1 pt)")
+    # Rows without a parseable timestamp still count all-time, just not in any window
+    frame = frame[frame['created'].notna()]
+    frame['day'] = frame['created'].dt.tz_localize(None).to_numpy().astype('datetime64[D]')
+    totals = frame.groupby(['email', 'day'], sort=False)[BUCKET_FIELDS].sum()
     
-    return {"points": points, "criteria": criteria}
+    # Only the grouped keys are formatted, once per user and day
+    days = np.datetime_as_string(totals.index.get_level_values('day').to_numpy().astype('datetime64[D]'), unit='D')
+    _add_bucket_totals(activity["days"], zip(totals.index.get_level_values('email'), days.tolist()), totals)
 
-def detect_follow_up_questions(interactions, user_email):
-    """Detect follow-up questions for a specific user"""
-    user_interactions = [i for i in interactions if i.get('email') == user_email]
-    user_interactions.sort(key=lambda x: x.get('created', ''))
+def daily_bucket_records(activity):
+    """Flatten folded daily buckets into records keyed by email and day"""
+    return [{"email": email, "day": day, **dict(zip(BUCKET_FIELDS, values))}
+            for (email, day), values in activity["days"].items()]
+
+def scope_bucket_records(activity, aggregates):
+    """Flatten folded scope buckets into records keyed by scope, scope value and email"""
+    return [{"scope": scope, "scopeValue": value, "email": email, "name": aggregates[email]["name"],
+             **dict(zip(BUCKET_FIELDS, values))}
+            for (scope, value, email), values in activity["scopes"].items()]
+
+def fold_interactions(aggregates, chunk, activity=None):
+    """Fold a DataFrame chunk of interactions into running per-user aggregates
+    
+    When activity is given (see new_activity_buckets), the same rows are also
+    summed into per-user buckets per day, course and assistant.
+    """
+    if chunk.empty or 'email' not in chunk.columns:
+        return aggregates
     
-    follow_ups = 0
+    # Drop rows without an email and filter out perscholas.org domain emails
+    emails = chunk['email']
+    has_email = _present(emails)
+    kept = has_email & ~emails.where(has_email, '').map(str).str.lower().str.contains('perscholas.org', regex=False)
+    chunk = chunk[kept.to_numpy(dtype=bool)]
+    if chunk.empty:
+        return aggregates
+    emails = chunk['email'].map(str).to_numpy(dtype=object)
     
-    # Group by course/conversation and look for sequential interactions
-    course_groups = {}
-    for interaction in user_interactions:
-        course_id = interaction.get('course_id', 'unknown')
-        if course_id not in course_groups:
-            course_groups[course_id] = []
-        course_groups[course_id].append(interaction)
+    question_scores = analyze_question_quality_batch(_column(chunk, 'input', ''), _column(chunk, 'outputs', ''))
+    success = _column(chunk, 'success', '').map(str).str.upper() == 'TRUE'
     
-    # Count follow-ups within each course
-    for course_interactions in course_groups.values():
-        if len(course_interactions) > 1:
-            # Consider interactions within 2 hours as potential follow-ups
-            for i in range(1, len(course_interactions)):
-                follow_ups += 1
+    columns = {
+        "email": emails,
+        "totalInteractions": np.ones(len(chunk), dtype=np.int64),
+        "totalCredits": _column(chunk, 'credits', 0).astype('int64').to_numpy(),
+        "questionPoints": question_scores["points"],
+        **{rule_id: question_scores[rule_id].astype(np.int64) for rule_id in get_rubric().rule_ids},
+        "durationSumMs": _column(chunk, 'query_duration_ms', 0).astype('int64').to_numpy(),
+        "ttftSumMs": _column(chunk, 'ttft', 0).astype('int64').to_numpy(),
+        "successCount": success.to_numpy(dtype=np.int64)
+    }
+    totals = pd.DataFrame(columns).groupby('email', sort=False).sum()
     
-    return follow_ups
+    # A user's display name comes from their first row
+    first_rows = chunk.assign(email=emails).drop_duplicates('email')
+    for email, first, last in zip(first_rows['email'], _column(first_rows, 'first', ''), _column(first_rows, 'last', '')):
+        if email not in aggregates:
+            aggregates[email] = new_user_aggregate(f"{first} {last}".strip() or 'Unknown User')
+    
+    for email, row in zip(totals.index, totals.to_dict('records')):
+        aggregate = aggregates[email]
+        for key, value in row.items():
+            aggregate[key] += int(value)
+    
+    # Distinct conversations, modules and assistants per user
+    course_ids = _column(chunk, 'course_id', None).map(_course_key).to_numpy(dtype=object)
+    if activity is not None:
+        scope_values = {scope: _scope_values(_column(chunk, column, None)) for scope, column in SCOPE_COLUMNS.items()}
+        _fold_activity_buckets(activity, columns, course_ids, _column(chunk, 'created', None).to_numpy(dtype=object),
+                               scope_values)
+    for email, course_id in set(zip(emails, course_ids)):
+        aggregates[email]["courseIds"].add(course_id)
+    for column, key in (('course_name', 'courses'), ('instance_ainame', 'assistants')):
+        values = _column(chunk, column, None)
+        present = _present(values).to_numpy(dtype=bool)
+        for email, value in set(zip(emails[present], values.to_numpy(dtype=object)[present])):
+            aggregates[email][key].add(value)
+    
+    return aggregates
+
+# Columns that identify one interaction for de-duplication across uploads
+ROW_KEY_COLUMNS = ['email', 'created', 'course_id', 'instance_ainame', 'input']
+
+def interaction_row_keys(chunk):
+    """Compute stable de-duplication keys for a chunk of interaction rows"""
+    columns = [_column(chunk, name, '').map(str).to_numpy(dtype=object) for name in ROW_KEY_COLUMNS]
+    return [hashlib.blake2b('\x1f'.join(values).encode('utf-8'), digest_size=16).hexdigest()
+            for values in zip(*columns)]
+
+def merge_user_aggregates(target, source):
+    """Merge per-user aggregates from source into target"""
+    for email, aggregate in source.items():
+        if email not in target:
+            target[email] = aggregate
+            continue
+        merged = target[email]
+        for key, value in aggregate.items():
+            if isinstance(value, set):
+                merged[key] |= value
+            elif key != "name":
+                merged[key] += value
+    return target
+
+def user_aggregate_to_record(aggregate):
+    """Convert a user aggregate into a JSON-serializable record, tagged with the rubric that scored it"""
+    return {**{key: sorted(value) if isinstance(value, set) else value for key, value in aggregate.items()},
+            "rubric": get_rubric().digest}
+
+def user_aggregate_from_record(record):
+    """Rebuild a user aggregate from its stored record"""
+    aggregate = new_user_aggregate(record.get("name", 'Unknown User'))
+    for key, default in aggregate.items():
+        value = record.get(key, default)
+        aggregate[key] = set(value) if isinstance(default, set) else value
+    return aggregate
+
+def finalize_user_score(aggregate):
+    """Turn one user's running aggregate into their score entry"""
+    rubric = get_rubric()
+    total_interactions = aggregate["totalInteractions"]
+    total_points = aggregate["questionPoints"]
+    all_criteria = []
+    for rule_id, _, criterion, _ in rubric.rules:
+        all_criteria += [criterion] * aggregate.get(rule_id, 0)
+    
+    # Follow-up questions bonus
+    follow_ups = total_interactions - len(aggregate["courseIds"])
+    follow_up_points = follow_ups * rubric.follow_up_points
+    total_points += follow_up_points
+    if follow_ups > 0:
+        all_criteria.append(f"Follow-up questions: {follow_ups} (+{follow_up_points} pts)")
+    
+    # Check for different assistants/modules used
+    unique_assistants = len(aggregate["assistants"])
+    unique_courses = len(aggregate["courses"])
+    
+    # User bonuses such as Pathway Pro (3+ different modules)
+    bonuses = {}
+    for bonus_id, met, points, criterion in rubric.user_bonuses({
+            "totalInteractions": total_interactions, "totalCredits": aggregate["totalCredits"],
+            "followUps": follow_ups, "uniqueCourses": unique_courses, "uniqueAssistants": unique_assistants}):
+        bonuses[bonus_id] = met
+        if met:
+            total_points += points
+            all_criteria.append(criterion)
+    
+    # Calculate average response time and quality metrics
+    avg_duration = aggregate["durationSumMs"] / total_interactions if total_interactions else 0
+    avg_ttft = aggregate["ttftSumMs"] / total_interactions if total_interactions else 0
+    
+    # Success rate
+    success_rate = (aggregate["successCount"] / total_interactions) * 100 if total_interactions > 0 else 0
+    
+    return {
+        "name": aggregate["name"],
+        "totalPoints": total_points,
+        "totalInteractions": total_interactions,
+        "totalCredits": aggregate["totalCredits"],
+        "followUps": follow_ups,
+        "uniqueCourses": unique_courses,
+        "uniqueAssistants": unique_assistants,
+        "avgDurationMs": avg_duration,
+        "avgTtftMs": avg_ttft,
+        "successRate": success_rate,
+        **bonuses,
+        "criteriaMet": all_criteria
+    }
 
-def calculate_user_scores(interactions):
+def finalize_user_scores(aggregates):
+    """Turn running per-user aggregates into user scores"""
+    return {email: finalize_user_score(aggregate) for email, aggregate in aggregates.items()}
+
+def calculate_user_scores(interactions, workers=1):
     """Calculate user scores based on gamification rubrics"""
-    user_scores = {}
+    if not isinstance(interactions, pd.DataFrame):
+        interactions = pd.DataFrame.from_records(list(interactions))
     
-    # Get unique users and filter out perscholas.org domain emails
-    unique_users = list(set([i.get('email') for i in interactions if i.get('email')]))
-    unique_users = [email for email in unique_users if 'perscholas.org' not in email.lower()]
+    if workers > 1 and len(interactions) >= PARALLEL_MIN_ROWS and 'email' in interactions.columns:
+        return calculate_user_scores_parallel(interactions, workers)
     
-    for email in unique_users:
-        user_data = [i for i in interactions if i.get('email') == email]
-        
-        # Basic metrics
-        total_interactions = len(user_data)
-        total_credits = sum([int(i.get('credits', 0)) for i in user_data])
-        
-        # Calculate points based on question quality
-        total_points = 0
-        all_criteria = []
-        
-        for row in user_data:
-            result = analyze_question_quality(row.get('input', ''), row.get('outputs', ''))
-            total_points += result['points']
-            all_criteria.extend(result['criteria'])
-        
-        # Follow-up questions bonus
-        follow_ups = detect_follow_up_questions(interactions, email)
-        follow_up_points = follow_ups * 2
-        total_points += follow_up_points
-        if follow_ups > 0:
-            all_criteria.append(f"Follow-up questions: {follow_ups} (+{follow_up_points} pts)")
-        
-        # Check for different assistants/modules used
-        unique_assistants = len(set([i.get('instance_ainame') for i in user_data if i.get('instance_ainame')]))
-        unique_courses = len(set([i.get('course_name') for i in user_data if i.get('course_name')]))
-        
-        # Pathway Pro achievement (3+ different modules)
-        pathway_pro = unique_courses >= 3
-        if pathway_pro:
-            total_points += 5
-            all_criteria.append("Pathway Pro achievement (+5 pts)")
-        
-        # Calculate average response time and quality metrics
-        durations = [int(i.get('query_duration_ms', 0)) for i in user_data]
-        ttfts = [int(i.get('ttft', 0)) for i in user_data]
-        avg_duration = sum(durations) / len(durations) if durations else 0
-        avg_ttft = sum(ttfts) / len(ttfts) if ttfts else 0
-        
-        # Success rate
-        success_count = sum([1 for i in user_data if str(i.get('success', '')).upper() == 'TRUE'])
-        success_rate = (success_count / total_interactions) * 100 if total_interactions > 0 else 0
-        
-        user_scores[email] = {
-            "name": f"{user_data[0].get('first', '')} {user_data[0].get('last', '')}".strip() or 'Unknown User',
-            "totalPoints": total_points,
-            "totalInteractions": total_interactions,
-            "totalCredits": total_credits,
-            "followUps": follow_ups,
-            "uniqueCourses": unique_courses,
-            "uniqueAssistants": unique_assistants,
-            "avgDurationMs": avg_duration,
-            "avgTtftMs": avg_ttft,
-            "successRate": success_rate,
-            "pathwayPro": pathway_pro,
-            "criteriaMet": all_criteria
-        }
-    
-    return user_scores
+    # One grouped pass; each user's metrics come from their own rows only
+    return finalize_user_scores(fold_interactions({}, interactions))
+
+# Exports smaller than this are scored serially; worker start-up would dominate
+PARALLEL_MIN_ROWS = 200000
+
+def _score_shard(shard):
+    """Fold one shard of interactions into partial per-user aggregates"""
+    return fold_interactions({}, shard)
+
+def calculate_user_scores_parallel(interactions, workers):
+    """Calculate user scores by sharding users across worker processes"""
+    shards, emails = _shard_rows(interactions, workers)
+    
+    aggregates = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for partial in executor.map(_score_shard, shards):
+            merge_user_aggregates(aggregates, partial)
+    
+    # Restore first-appearance order so ties rank the same as the serial path
+    ordered = {email: aggregates[email] for email in emails if email in aggregates}
+    return finalize_user_scores(ordered)
+
+def _shard_rows(interactions, workers):
+    """Split interactions into one frame per worker by crc32(email), with emails in first-appearance order"""
+    # Sharding by email keeps each user's follow-up and course state in one shard
+    user_codes, emails = pd.factorize(interactions['email'].map(str))
+    email_shards = np.array([zlib.crc32(email.encode('utf-8')) % workers for email in emails], dtype=np.int64)
+    row_shards = email_shards[user_codes] if len(emails) else np.zeros(len(interactions), dtype=np.int64)
+    return [interactions[row_shards == shard] for shard in range(workers)], emails
+
+def _fold_upload_shard(shard, seen_course_ids, questions):
+    """Fold one shard of an upload chunk into partial aggregates and activity buckets
+    
+    seen_course_ids and questions hold the conversations the shard's users were
+    already seen in, so follow-ups are counted as in the serial fold.
+    """
+    activity = {"days": {}, "scopes": {}, "courseIds": seen_course_ids, "questions": questions}
+    return fold_interactions({}, shard, activity), activity
+
+def _merge_bucket_totals(buckets, source):
+    """Add partial bucket totals onto the buckets with the same keys"""
+    for key, row in source.items():
+        bucket = buckets.get(key)
+        buckets[key] = row if bucket is None else [total + value for total, value in zip(bucket, row)]
+
+def fold_interactions_parallel(aggregates, chunk, activity, executor, workers):
+    """Fold a chunk like fold_interactions, sharding its users across executor's worker processes"""
+    if chunk.empty or 'email' not in chunk.columns:
+        return aggregates
+    
+    shards, emails = _shard_rows(chunk, workers)
+    seen, questions = activity["courseIds"], activity["questions"]
+    futures = []
+    for shard in shards:
+        if shard.empty:
+            continue
+        shard_emails = set(shard['email'].map(str))
+        futures.append(executor.submit(_fold_upload_shard, shard,
+                                       {email: seen[email] for email in shard_emails if email in seen},
+                                       {email: questions[email] for email in shard_emails if email in questions}))
+    
+    # Shards hold disjoint users, so partial results only need adding onto the running totals
+    chunk_aggregates = {}
+    for future in futures:
+        partial, partial_activity = future.result()
+        chunk_aggregates.update(partial)
+        _merge_bucket_totals(activity["days"], partial_activity["days"])
+        _merge_bucket_totals(activity["scopes"], partial_activity["scopes"])
+        seen.update(partial_activity["courseIds"])
+        questions.update(partial_activity["questions"])
+    
+    # New users are added in first-appearance order so ties rank the same as the serial path
+    for email in emails:
+        if email in chunk_aggregates:
+            merge_user_aggregates(aggregates, {email: chunk_aggregates[email]})
+    return aggregates
 
 def identify_achievements(user_scores):
     """Identify achievements for each user"""
-    achievements = {}
+    # Every rubric predicate is evaluated over all users' scores at once
+    return get_rubric().award_achievements(user_scores)
+
+# Read identity and text columns as strings so chunks agree on their types
+CSV_DTYPES = {
+    'email': str, 'first': str, 'last': str, 'course_id': str, 'course_name': str,
+    'instance_ainame': str, 'input': str, 'outputs': str
+}
+
+# Columns the scorer reads; anything else in a wide LMS export is skipped at parse time
+INTERACTION_COLUMNS = [
+    'email', 'first', 'last', 'course_id', 'course_name', 'instance_ainame', 'input', 'outputs',
+    'credits', 'query_duration_ms', 'ttft', 'success', 'created'
+]
+
+# Rows per chunk when streaming an upload
+STREAM_CHUNK_ROWS = 50000
+
+def read_interactions_csv(source, **kwargs):
+    """Parse only the interaction columns the scorer needs from a CSV source"""
+    return pd.read_csv(source, dtype=CSV_DTYPES, usecols=lambda column: column in INTERACTION_COLUMNS, **kwargs)
+
+class InteractionRecords:
+    """Columnar interactions that build row dicts only when iterated or indexed"""
+    
+    __slots__ = ('frame',)
+    
+    def __init__(self, frame):
+        self.frame = frame
+    
+    def __len__(self):
+        return len(self.frame)
     
+    def __iter__(self):
+        columns = list(self.frame.columns)
+        for values in self.frame.itertuples(index=False, name=None):
+            yield dict(zip(columns, values))
+    
+    def __getitem__(self, index):
+        return self.frame.iloc[index].to_dict()
+
+def score_breakdown(scores):
+    """Split a user's total points into the rubric components that produced them"""
+    rubric = get_rubric()
+    criteria = scores["criteriaMet"]
+    follow_up_points = scores["followUps"] * rubric.follow_up_points
+    bonus_points = {f"{bonus_id}Points": points if scores.get(bonus_id) else 0
+                    for bonus_id, _, points, _ in rubric.bonuses}
+    return {
+        "questionPoints": scores["totalPoints"] - follow_up_points - sum(bonus_points.values()),
+        "followUpPoints": follow_up_points,
+        **bonus_points,
+        **{breakdown: criteria.count(criterion) for _, _, criterion, breakdown in rubric.rules},
+        "uniqueAssistants": scores["uniqueAssistants"],
+        "avgDurationMs": scores["avgDurationMs"],
+        "avgTtftMs": scores["avgTtftMs"]
+    }
+
+def build_analysis_results(user_scores):
+    """Rank scored users and compute summary statistics"""
+    # Identify achievements
+    with stage("achievements"):
+        achievements = identify_achievements(user_scores)
+    
+    with stage("rank"):
+        return _rank_analysis_results(user_scores, achievements)
+
+def _rank_analysis_results(user_scores, achievements):
+    """Build the ranking, summary statistics and score breakdowns from scored users"""
+    # Create ranking data
+    ranking_data = []
     for email, scores in user_scores.items():
-        user_achievements = []
-        
-        # Deep Diver: 5+ follow-up questions
-        if scores['followUps'] >= 5:
-            user_achievements.append("🧠 Deep Diver")
-        
-        # Study Strategist: 3+ goal-aligned questions (estimated from high points)
-        if scores['totalPoints'] >= 15:  # Rough estimate for goal-aligned questions
-            user_achievements.append("📚 Study Strategist")
-        
-        # Pathway Pro: 3+ unique courses
-        if scores['uniqueCourses'] >= 3:
-            user_achievements.append("🎓 Pathway Pro")
-        
-        # Bug Hunter: 3+ troubleshooting questions (estimated)
-        # This would need more sophisticated analysis of question content
-        
-        achievements[email] = user_achievements
+        ranking_data.append({
+            "email": email,
+            "name": scores["name"],
+            "totalPoints": scores["totalPoints"],
+            "totalInteractions": scores["totalInteractions"],
+            "totalCredits": scores["totalCredits"],
+            "followUps": scores["followUps"],
+            "uniqueCourses": scores["uniqueCourses"],
+            "successRate": scores["successRate"],
+            "achievements": achievements.get(email, [])
+        })
+    
+    # Sort by total points
+    ranking_data.sort(key=lambda x: x["totalPoints"], reverse=True)
+    
+    # Add ranks
+    for i, user in enumerate(ranking_data):
+        user["rank"] = i + 1
     
-    return achievements
+    # Calculate summary stats
+    total_users = len(ranking_data)
+    total_interactions = sum([user["totalInteractions"] for user in ranking_data])
+    avg_points = sum([user["totalPoints"] for user in ranking_data]) / total_users if total_users > 0 else 0
+    
+    # Count achievements
+    achievement_counts = {}
+    for user in ranking_data:
+        for achievement in user["achievements"]:
+            achievement_counts[achievement] = achievement_counts.get(achievement, 0) + 1
+    
+    summary_stats = {
+        "totalUsers": total_users,
+        "totalInteractions": total_interactions,
+        "averagePoints": round(avg_points, 1),
+        "achievementCounts": achievement_counts,
+        "topPerformer": ranking_data[0] if ranking_data else None
+    }
+    
+    return {
+        "summaryStats": summary_stats,
+        "rankingData": ranking_data,
+        "scoreBreakdowns": {email: score_breakdown(scores) for email, scores in user_scores.items()}
+    }
 
-def process_csv_data(csv_content):
-    """Process CSV data and return analysis results"""
+def process_csv_data(csv_content, workers=1):
+    """Process CSV data and return analysis results
+    
+    With workers > 1, exports of at least PARALLEL_MIN_ROWS rows are scored
+    in parallel across that many processes.
+    """
     try:
         # Parse CSV content
-        df = pd.read_csv(io.StringIO(csv_content))
-        interactions = df.to_dict('records')
+        with stage("parse"):
+            df = read_interactions_csv(io.StringIO(csv_content))
+        record(rows=len(df))
         
         # Calculate user scores
-        user_scores = calculate_user_scores(interactions)
-        
-        # Identify achievements
-        achievements = identify_achievements(user_scores)
+        with stage("score"):
+            user_scores = calculate_user_scores(df, workers=workers)
         
-        # Create ranking data
-        ranking_data = []
-        for email, scores in user_scores.items():
-            ranking_data.append({
-                "email": email,
-                "name": scores["name"],
-                "totalPoints": scores["totalPoints"],
-                "totalInteractions": scores["totalInteractions"],
-                "totalCredits": scores["totalCredits"],
-                "followUps": scores["followUps"],
-                "uniqueCourses": scores["uniqueCourses"],
-                "successRate": scores["successRate"],
-                "achievements": achievements.get(email, [])
-            })
+        # Interactions stay columnar; row dicts are only built if rawData is iterated
+        results = build_analysis_results(user_scores)
+        results["rawData"] = InteractionRecords(df)
+        results["rawDataCount"] = len(df)
+        return results
         
-        # Sort by total points
-        ranking_data.sort(key=lambda x: x["totalPoints"], reverse=True)
-        
-        # Add ranks
-        for i, user in enumerate(ranking_data):
-            user["rank"] = i + 1
+    except Exception as e:
+        print(f"Error processing CSV data: {e}")
+        raise
+
+def process_csv_stream(csv_stream, chunksize=STREAM_CHUNK_ROWS):
+    """Process a CSV file-like object chunk by chunk and return analysis results"""
+    try:
+        # Memory is bounded by the number of users, not the number of rows
+        aggregates = {}
+        row_count = 0
+        for chunk in timed_iter("parse", read_interactions_csv(csv_stream, chunksize=chunksize)):
+            with stage("fold"):
+                fold_interactions(aggregates, chunk)
+            row_count += len(chunk)
+        record(rows=row_count)
         
-        # Calculate summary stats
-        total_users = len(ranking_data)
-        total_interactions = sum([user["totalInteractions"] for user in ranking_data])
-        avg_points = sum([user["totalPoints"] for user in ranking_data]) / total_users if total_users > 0 else 0
+        with stage("finalize"):
+            user_scores = finalize_user_scores(aggregates)
+        results = build_analysis_results(user_scores)
+        results["rawDataCount"] = row_count
+        return results
         
-        # Count achievements
-        achievement_counts = {}
-        for user in ranking_data:
-            for achievement in user["achievements"]:
-                achievement_counts[achievement] = achievement_counts.get(achievement, 0) + 1
+    except Exception as e:
+        print(f"Error processing CSV stream: {e}")
+        raise
+
+def process_csv_upload(csv_stream, stored_aggregates=None, find_known_row_keys=None, chunksize=STREAM_CHUNK_ROWS,
+                       progress=None, workers=1):
+    """Fold a CSV export into per-user aggregates and return analysis results
+    
+    With no stored aggregates this is a full rebuild. Rows that repeat within the
+    upload are scored once. In append mode, rows whose keys find_known_row_keys
+    reports as already ingested are skipped too, and only the delta is merged
+    into stored_aggregates.
+    The new rows' per-user buckets are returned per day as changedDailyBuckets
+    and per course and assistant as changedScopeBuckets. progress, if given, is
+    called with the number of rows read so far after each chunk. With workers > 1,
+    once PARALLEL_MIN_ROWS rows have been read the remaining chunks are folded
+    in parallel across that many processes.
+    """
+    executor = None
+    try:
+        delta = {}
+        activity = new_activity_buckets(stored_aggregates)
+        new_row_keys = []
+        seen_row_keys = set()
+        row_count = 0
+        for chunk in timed_iter("parse", read_interactions_csv(csv_stream, chunksize=chunksize)):
+            row_count += len(chunk)
+            with stage("dedupe"):
+                row_keys = interaction_row_keys(chunk)
+                
+                # Rows repeated within the upload are scored once in either mode
+                known = find_known_row_keys(row_keys) if find_known_row_keys is not None else ()
+                fresh = []
+                for key in row_keys:
+                    is_new = key not in known and key not in seen_row_keys
+                    fresh.append(is_new)
+                    seen_row_keys.add(key)
+                chunk = chunk[np.array(fresh, dtype=bool)]
+                new_row_keys.extend(key for key, is_new in zip(row_keys, fresh) if is_new)
+            
+            with stage("fold"):
+                if workers > 1 and row_count >= PARALLEL_MIN_ROWS:
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=workers)
+                    fold_interactions_parallel(delta, chunk, activity, executor, workers)
+                else:
+                    fold_interactions(delta, chunk, activity)
+            if progress is not None:
+                progress(row_count)
+        record(rows=row_count, newRows=len(new_row_keys))
         
-        summary_stats = {
-            "totalUsers": total_users,
-            "totalInteractions": total_interactions,
-            "averagePoints": round(avg_points, 1),
-            "achievementCounts": achievement_counts,
-            "topPerformer": ranking_data[0] if ranking_data else None
-        }
+        with stage("finalize"):
+            aggregates = merge_user_aggregates(stored_aggregates if stored_aggregates is not None else {}, delta)
+            user_scores = finalize_user_scores(aggregates)
         
-        return {
-            "summaryStats": summary_stats,
-            "rankingData": ranking_data,
-            "rawData": interactions
-        }
+        results = build_analysis_results(user_scores)
+        results["rawDataCount"] = row_count
+        results["newRowCount"] = len(new_row_keys)
+        results["newRowKeys"] = new_row_keys
+        with stage("buckets"):
+            results["changedAggregates"] = {email: user_aggregate_to_record(aggregates[email]) for email in delta}
+            results["changedDailyBuckets"] = daily_bucket_records(activity)
+            results["changedScopeBuckets"] = scope_bucket_records(activity, aggregates)
+        return results
         
     except Exception as e:
-        print(f"Error processing CSV data: {e}")
+        print(f"Error processing CSV upload: {e}")
         raise
-
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,140 @@
+"""
+Health reports: liveness by default; with deep mode a timed database round trip plus in-process metrics
+"""
+
+import time
+from datetime import datetime
+
+from lib.auth import get_token_cache_stats
+from lib.cache import get_cache_stats
+from lib.database import get_latest_analysis_id, get_client_stats
+from lib.metrics import (ENDPOINTS, LATENCY_BUCKETS, request_metrics, request_counts, latency_histograms,
+                         last_upload, process_metrics)
+
+SERVICE_NAME = "Per Scholas Azari Leaderboard API"
+SERVICE_VERSION = "1.0.0"
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def wants_deep(query):
+    """Whether a health request asked for deep mode (?deep=1), which Prometheus output implies"""
+    return query.get('deep', [''])[0].lower() in ('1', 'true') or wants_prometheus(query)
+
+def wants_prometheus(query):
+    """Whether a health request asked for Prometheus text (?format=prometheus)"""
+    return query.get('format', [''])[0].lower() == 'prometheus'
+
+def ping_database():
+    """Time one lightweight database round trip (the latest snapshot id lookup)"""
+    start = time.perf_counter()
+    try:
+        snapshot_id = get_latest_analysis_id()
+        return {"ok": True, "latencyMs": round((time.perf_counter() - start) * 1000, 1),
+                "latestSnapshotId": snapshot_id}
+    except Exception as e:
+        print(f"Error pinging database: {e}")
+        return {"ok": False, "latencyMs": round((time.perf_counter() - start) * 1000, 1), "error": str(e)}
+
+def _hit_rate(hits, lookups):
+    return round(hits / lookups, 4) if lookups else None
+
+def cache_metrics():
+    """Results cache counters with hit rates; revalidations count as hits since they skip the full fetch"""
+    caches = {}
+    for name, stats in get_cache_stats().items():
+        lookups = stats["hits"] + stats["revalidations"] + stats["misses"]
+        caches[name] = {**stats, "hitRate": _hit_rate(stats["hits"] + stats["revalidations"], lookups)}
+    return caches
+
+def token_cache_metrics():
+    """Verified token cache counters with their hit rate"""
+    stats = get_token_cache_stats()
+    return {**stats, "hitRate": _hit_rate(stats["hits"], stats["hits"] + stats["misses"])}
+
+def health_report(deep=False):
+    """Build the health payload; deep mode pings the database and adds this process's metrics"""
+    report = {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "service": SERVICE_NAME,
+        "version": SERVICE_VERSION,
+        "endpoints": dict(ENDPOINTS)
+    }
+    if not deep:
+        return report
+
+    database = ping_database()
+    report.update({
+        "status": "healthy" if database["ok"] else "unhealthy",
+        "database": {**database, "client": get_client_stats()},
+        "requests": request_metrics(),
+        "caches": cache_metrics(),
+        "tokenCache": token_cache_metrics(),
+        "lastUpload": last_upload(),
+        "process": process_metrics()
+    })
+    return report
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}" if labels else ""
+
+def _metric(lines, name, kind, help_text, samples):
+    """Append one metric family; samples are (labels dict, value) pairs"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(**labels)} {value}")
+
+def render_prometheus(report):
+    """Render a deep health report in the Prometheus text exposition format"""
+    lines = []
+    database = report["database"]
+    _metric(lines, "leaderboard_up", "gauge", "Whether the last health check reached the database.",
+            [({}, 1 if database["ok"] else 0)])
+    _metric(lines, "leaderboard_database_ping_seconds", "gauge", "Latency of the health check database round trip.",
+            [({}, database["latencyMs"] / 1000)])
+    _metric(lines, "leaderboard_database_clients_created_total", "counter", "Database clients created.",
+            [({}, database["client"]["clientsCreated"])])
+    _metric(lines, "leaderboard_database_retries_total", "counter", "Database requests retried.",
+            [({}, database["client"]["retries"])])
+
+    _metric(lines, "leaderboard_requests_total", "counter", "Requests served by this process.",
+            [({"endpoint": endpoint, "method": method, "status": status}, count)
+             for (endpoint, method, status), count in sorted(request_counts().items())])
+
+    name = "leaderboard_request_duration_seconds"
+    lines.append(f"# HELP {name} Request latency served by this process.")
+    lines.append(f"# TYPE {name} histogram")
+    for endpoint, histogram in latency_histograms().items():
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+        for bound, count in zip(bounds, histogram["buckets"]):
+            lines.append(f"{name}_bucket{_labels(endpoint=endpoint, le=bound)} {count}")
+        lines.append(f"{name}_sum{_labels(endpoint=endpoint)} {histogram['sum']}")
+        lines.append(f"{name}_count{_labels(endpoint=endpoint)} {histogram['count']}")
+
+    _metric(lines, "leaderboard_cache_events_total", "counter", "Results cache lookups and invalidations.",
+            [({"cache": cache, "event": event}, stats[event]) for cache, stats in report["caches"].items()
+             for event in ("hits", "revalidations", "misses", "invalidations")])
+    _metric(lines, "leaderboard_token_cache_events_total", "counter", "Verified token cache lookups.",
+            [({"event": event}, report["tokenCache"][event]) for event in ("hits", "misses", "evictions")])
+
+    upload = report["lastUpload"]
+    if upload is not None:
+        finished = datetime.fromisoformat(upload["finishedAt"])
+        _metric(lines, "leaderboard_last_upload_rows", "gauge", "Rows in the last upload this process saved.",
+                [({"mode": upload["mode"]}, upload["rows"])])
+        _metric(lines, "leaderboard_last_upload_duration_seconds", "gauge", "Duration of the last upload this process saved.",
+                [({"mode": upload["mode"]}, upload["durationMs"] / 1000)])
+        _metric(lines, "leaderboard_last_upload_timestamp_seconds", "gauge", "When the last upload this process saved finished.",
+                [({}, (finished - datetime(1970, 1, 1)).total_seconds())])
+
+    process = report["process"]
+    if process["rssMB"] is not None:
+        _metric(lines, "process_resident_memory_bytes", "gauge", "Resident memory size in bytes.",
+                [({}, int(process["rssMB"] * 2**20))])
+    _metric(lines, "process_max_resident_memory_bytes", "gauge", "Peak resident memory size in bytes.",
+            [({}, int(process["maxRssMB"] * 2**20))])
+    _metric(lines, "process_start_time_seconds", "gauge", "Start time of the process since the Unix epoch.",
+            [({}, process["startedAt"])])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,309 @@
+"""
+Background upload jobs: an upload is spooled to disk, queued, scored and published off the request
+Run queued jobs from a separate process with: python -m lib.jobs
+"""
+
+import os
+import sys
+import time
+import uuid
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from lib.database import save_upload_job, update_upload_job, get_upload_job, claim_upload_job
+from lib.uploads import load_stored_aggregates, score_upload, save_upload, upload_response
+from lib.timing import collect_timings, log_event
+
+# "thread" runs jobs in this process; "queue" leaves them for a `python -m lib.jobs` worker
+UPLOAD_JOB_RUNNER = os.environ.get("UPLOAD_JOB_RUNNER", "thread").strip().lower()
+
+# Where upload bodies are spooled until their job runs; queue workers must share this directory
+UPLOAD_JOB_DIR = os.environ.get("UPLOAD_JOB_DIR", tempfile.gettempdir())
+
+# Seconds between progress writes while a job is scoring
+JOB_PROGRESS_INTERVAL = float(os.environ.get("JOB_PROGRESS_INTERVAL", "1"))
+
+# Seconds a queue worker sleeps when there is nothing to claim
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+
+# Seconds between heartbeat writes while a job is scoring or saving
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get("JOB_HEARTBEAT_INTERVAL", "15"))
+
+# Seconds without a heartbeat after which a scoring or saving job is taken as abandoned by its worker
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "300"))
+
+# Seconds a synchronous upload waits for the jobs queued before it to finish
+SYNC_UPLOAD_WAIT_SECONDS = float(os.environ.get("SYNC_UPLOAD_WAIT_SECONDS", "300"))
+
+# Seconds between claim attempts while a synchronous upload waits its turn
+SYNC_UPLOAD_POLL_INTERVAL = float(os.environ.get("SYNC_UPLOAD_POLL_INTERVAL", "0.5"))
+
+UPLOAD_BUSY_ERROR = "Another upload is still being processed; try again later or upload with ?async=1"
+
+# Job stages in order; a job ends in published or failed
+JOB_STAGES = ('queued', 'scoring', 'saving', 'published', 'failed')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+class UploadBusyError(Exception):
+    """A synchronous upload's turn did not come within SYNC_UPLOAD_WAIT_SECONDS"""
+
+def wants_job(query):
+    """Whether an upload request asked to run as a background job (?async=1)"""
+    return query.get('async', [''])[0].lower() in ('1', 'true')
+
+def new_job_path():
+    """Create an empty spool file for a job's upload body and return its path"""
+    descriptor, path = tempfile.mkstemp(prefix="upload-job-", suffix=".csv", dir=UPLOAD_JOB_DIR)
+    os.close(descriptor)
+    return path
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+def _queue_upload_job(mode, path, bytes_total, synchronous):
+    """Save a new queued job row and return it"""
+    now = _now()
+    return save_upload_job({
+        "id": uuid.uuid4().hex,
+        "mode": mode,
+        "stage": "queued",
+        "payload_path": path,
+        "bytes_total": bytes_total,
+        "bytes_processed": 0,
+        "rows_processed": 0,
+        "created_at": now,
+        "updated_at": now,
+        "synchronous": synchronous
+    })
+
+def create_upload_job(path, mode):
+    """Queue a job for an upload spooled to path and return its row"""
+    return _queue_upload_job(mode, path, os.path.getsize(path), False)
+
+def create_synchronous_upload_job(mode, bytes_total):
+    """Queue a job for an upload its own request scores and saves once the job is claimed"""
+    return _queue_upload_job(mode, None, bytes_total, True)
+
+def spool_upload_job(csv_stream, mode):
+    """Spool an upload stream (bytes or text) to disk and queue a job for it"""
+    path = new_job_path()
+    try:
+        with open(path, 'wb') as spool:
+            while True:
+                chunk = csv_stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                spool.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        return create_upload_job(path, mode)
+    except Exception:
+        os.unlink(path)
+        raise
+
+def job_accepted_response(job):
+    """Build the JSON payload returned when an upload is accepted as a job"""
+    return {
+        "success": True,
+        "message": "Upload accepted for background processing",
+        "jobId": job["id"],
+        "mode": job["mode"],
+        "stage": job["stage"],
+        "statusUrl": f"/api/data/jobs?id={job['id']}"
+    }
+
+def get_job_executor():
+    """Get the thread that runs jobs in this process, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-job")
+        return _executor
+
+def start_upload_job():
+    """Have this process run queued jobs unless a separate queue worker handles them"""
+    if UPLOAD_JOB_RUNNER == 'thread':
+        get_job_executor().submit(run_worker, once=True)
+
+def claim_next_job(job_id=None):
+    """Claim the oldest queued job, or None while another job is scoring or saving
+
+    Only one job is scored at a time, since each one merges onto the aggregates the
+    previous one saved. A job whose heartbeat is older than JOB_STALE_SECONDS was
+    abandoned: it is queued again if it was still scoring, or failed if it was saving.
+    A synchronous upload's job is only claimed by its own request, passing job_id.
+    """
+    stale_before = (datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)).isoformat()
+    return claim_upload_job(stale_before, job_id)
+
+def wait_for_upload_turn(job_id):
+    """Claim a synchronous upload's job once the jobs queued before it have finished"""
+    deadline = time.monotonic() + SYNC_UPLOAD_WAIT_SECONDS
+    while claim_next_job(job_id) is None:
+        if time.monotonic() >= deadline:
+            raise UploadBusyError(UPLOAD_BUSY_ERROR)
+        time.sleep(SYNC_UPLOAD_POLL_INTERVAL)
+
+def release_synchronous_upload_job(job_id, error=None):
+    """Fail a synchronous upload's job unless its request published it"""
+    try:
+        job = get_upload_job(job_id)
+    except Exception as e:
+        print(f"Error fetching upload job {job_id}: {e}")
+        return
+    if job is not None and job["stage"] not in ('published', 'failed'):
+        fail_upload_job(job_id, error or "Upload request ended before its results were saved")
+
+@contextmanager
+def synchronous_upload_job(mode, bytes_total):
+    """Queue an upload answered inline as a job and hold its claim while the block scores and saves it
+
+    Inline uploads go through the same queue and claim as background jobs, so no two
+    uploads ever score or save at once. The block runs once the jobs queued before it
+    have finished and saves with finish_upload_job; a job it leaves unpublished fails.
+    Jobs queued behind it are started when it ends.
+    """
+    job = create_synchronous_upload_job(mode, bytes_total)
+    error = None
+    try:
+        with job_heartbeat(job["id"]):
+            wait_for_upload_turn(job["id"])
+            yield job
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        release_synchronous_upload_job(job["id"], error)
+        start_upload_job()
+
+@contextmanager
+def job_heartbeat(job_id):
+    """Write the job's heartbeat every JOB_HEARTBEAT_INTERVAL seconds while the block runs"""
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                update_upload_job(job_id, {"heartbeat_at": _now()})
+            except Exception as e:
+                print(f"Error writing upload job {job_id} heartbeat: {e}")
+
+    thread = threading.Thread(target=beat, name=f"upload-job-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+def score_upload_job(job_id, path, mode, stored_aggregates=None):
+    """Score a job's spooled upload, recording progress (picklable entry point for worker processes)"""
+    started = _now()
+    update_upload_job(job_id, {"stage": "scoring", "started_at": started, "updated_at": started})
+
+    with open(path, 'rb') as csv_stream:
+        last_write = [time.monotonic()]
+
+        def progress(rows_processed):
+            # Throttled so a fast upload does not turn into a write per chunk
+            if time.monotonic() - last_write[0] < JOB_PROGRESS_INTERVAL:
+                return
+            last_write[0] = time.monotonic()
+            update_upload_job(job_id, {"rows_processed": rows_processed, "bytes_processed": csv_stream.tell(),
+                                       "updated_at": _now()})
+
+        analysis_results = score_upload(csv_stream, mode, stored_aggregates, progress)
+        bytes_processed = csv_stream.tell()
+
+    update_upload_job(job_id, {"stage": "saving", "rows_processed": analysis_results["rawDataCount"],
+                               "bytes_processed": bytes_processed, "updated_at": _now()})
+    return analysis_results
+
+def finish_upload_job(job_id, analysis_results, mode):
+    """Save a scored job's results, publishing its snapshot, and mark it published"""
+    saved_result = save_upload(analysis_results, mode)
+    now = _now()
+    update_upload_job(job_id, {
+        "stage": "published",
+        "updated_at": now,
+        "finished_at": now,
+        "result": {**upload_response(analysis_results, mode), "snapshotId": saved_result["id"]}
+    })
+    return saved_result
+
+def fail_upload_job(job_id, error):
+    """Mark a job failed with its error message"""
+    now = _now()
+    try:
+        update_upload_job(job_id, {"stage": "failed", "error": str(error), "updated_at": now, "finished_at": now})
+    except Exception as e:
+        print(f"Error marking upload job {job_id} failed: {e}")
+
+def run_upload_job(job_id, path, mode):
+    """Load stored state, score and publish one job, removing its spooled upload afterwards"""
+    with collect_timings() as timings, job_heartbeat(job_id):
+        try:
+            stored_aggregates = load_stored_aggregates(mode)
+            analysis_results = score_upload_job(job_id, path, mode, stored_aggregates)
+            finish_upload_job(job_id, analysis_results, mode)
+        except Exception as e:
+            print(f"Error running upload job {job_id}: {e}")
+            fail_upload_job(job_id, e)
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+        log_event("upload_job", timings, jobId=job_id, mode=mode)
+
+def _timestamp(value):
+    """Parse a stored timestamp as naive UTC, or None"""
+    if not value:
+        return None
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+
+def job_status(job):
+    """Build the JSON payload returned when polling a job"""
+    created_at = _timestamp(job["created_at"])
+    started_at = _timestamp(job.get("started_at"))
+    finished_at = _timestamp(job.get("finished_at"))
+    bytes_total = job["bytes_total"]
+    bytes_processed = job["bytes_processed"]
+
+    # Bytes are the only measure known up front, so the ETA extrapolates the scoring rate over them
+    eta_seconds = None
+    if job["stage"] == 'scoring' and started_at is not None and 0 < bytes_processed < bytes_total:
+        elapsed = (datetime.utcnow() - started_at).total_seconds()
+        eta_seconds = round(elapsed * (bytes_total - bytes_processed) / bytes_processed, 1)
+
+    return {
+        "jobId": job["id"],
+        "mode": job["mode"],
+        "stage": job["stage"],
+        "rowsProcessed": job["rows_processed"],
+        "bytesProcessed": bytes_processed,
+        "bytesTotal": bytes_total,
+        "progress": round(bytes_processed / bytes_total, 4) if bytes_total else 0.0,
+        "etaSeconds": eta_seconds,
+        "createdAt": created_at.isoformat(),
+        "startedAt": started_at.isoformat() if started_at else None,
+        "finishedAt": finished_at.isoformat() if finished_at else None,
+        "error": job.get("error"),
+        "result": job.get("result")
+    }
+
+def run_worker(poll_interval=JOB_POLL_INTERVAL, once=False):
+    """Claim and run queued jobs until stopped; with once, return when none can be claimed"""
+    while True:
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        print(f"Running upload job {job['id']} ({job['mode']}, {job['bytes_total']} bytes)")
+        run_upload_job(job["id"], job["payload_path"], job["mode"])
+
+if __name__ == "__main__":
+    run_worker(once="--once" in sys.argv[1:])
@@ -0,0 +1,420 @@
+import json
+import hashlib
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import islice
+from lib.rubric import get_rubric
+
+# Sort keys accepted by the results API; "rank" is the stored leaderboard order
+SORT_KEYS = ("rank", "totalPoints", "totalInteractions", "totalCredits", "followUps", "uniqueCourses", "successRate")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+DEFAULT_SEARCH_RESULTS = 10
+MAX_SEARCH_RESULTS = 50
+
+# snapshot_rankings column for each ranking entry field, in ranking entry order
+RANKING_ROW_COLUMNS = (
+    ("email", "email"), ("name", "name"), ("totalPoints", "total_points"),
+    ("totalInteractions", "total_interactions"), ("totalCredits", "total_credits"),
+    ("followUps", "follow_ups"), ("uniqueCourses", "unique_courses"), ("successRate", "success_rate"),
+    ("achievements", "achievements"), ("rank", "rank"),
+)
+
+def ranking_entry_to_row(snapshot_id, entry):
+    """Flatten a ranking entry into a snapshot_rankings row"""
+    return {"snapshot_id": snapshot_id, **{column: entry[field] for field, column in RANKING_ROW_COLUMNS}}
+
+def ranking_row_to_entry(row):
+    """Rebuild a ranking entry from a snapshot_rankings row"""
+    return {field: row[column] for field, column in RANKING_ROW_COLUMNS}
+
+# user_daily_buckets column for each daily bucket field
+DAILY_BUCKET_ROW_COLUMNS = (
+    ("email", "email"), ("day", "day"), ("totalInteractions", "total_interactions"),
+    ("totalCredits", "total_credits"), ("questionPoints", "question_points"), ("followUps", "follow_ups"),
+    ("durationSumMs", "duration_sum_ms"), ("ttftSumMs", "ttft_sum_ms"), ("successCount", "success_count"),
+)
+
+# Bucket fields that add up across uploads, days and scopes
+BUCKET_TOTALS = [field for field, _ in DAILY_BUCKET_ROW_COLUMNS[2:]]
+
+# scope_rankings column for each scope bucket field; rows are ranked within (scope, scope value)
+SCOPE_ROW_COLUMNS = (
+    ("scope", "scope"), ("scopeValue", "scope_value"), ("email", "email"), ("name", "name"),
+    *DAILY_BUCKET_ROW_COLUMNS[2:], ("rank", "rank"),
+)
+
+# Filters for scoped leaderboards; each matches the scope names used by lib.gamification
+SCOPES = ("course", "assistant")
+
+# Named windows, in days ending today (UTC)
+WINDOW_DAYS = {"week": 7, "month": 30}
+
+def bucket_record_to_row(snapshot_id, record):
+    """Flatten a daily bucket record into a user_daily_buckets row written with a snapshot"""
+    return {"snapshot_id": snapshot_id, **{column: record[field] for field, column in DAILY_BUCKET_ROW_COLUMNS}}
+
+def bucket_row_to_record(row):
+    """Rebuild a daily bucket record from a user_daily_buckets row"""
+    return {field: row[column] for field, column in DAILY_BUCKET_ROW_COLUMNS}
+
+def scope_record_to_row(snapshot_id, record):
+    """Flatten a ranked scope bucket record into a scope_rankings row written with a snapshot"""
+    return {"snapshot_id": snapshot_id, **{column: record[field] for field, column in SCOPE_ROW_COLUMNS}}
+
+def scope_row_to_record(row):
+    """Rebuild a ranked scope bucket record from a scope_rankings row"""
+    return {field: row[column] for field, column in SCOPE_ROW_COLUMNS}
+
+def normalize_search_key(value):
+    """Normalize an email, name or query for case-insensitive matching"""
+    return " ".join(str(value).lower().split())
+
+def build_learner_index(ranking_data, score_breakdowns=None):
+    """Index learners by normalized email and by sorted name/email prefixes"""
+    emails = {}
+    prefix_entries = set()
+    for position, user in enumerate(ranking_data):
+        email = normalize_search_key(user["email"])
+        emails.setdefault(email, position)
+        
+        # Full name, each name part and the email all match by prefix
+        name = normalize_search_key(user["name"])
+        for key in {email, email.split("@")[0], name, *name.split(" ")}:
+            if key:
+                prefix_entries.add((key, position))
+    
+    prefix_entries = sorted(prefix_entries)
+    breakdowns = score_breakdowns or {}
+    return {
+        "emails": emails,
+        "prefixKeys": [key for key, _ in prefix_entries],
+        "prefixPositions": [position for _, position in prefix_entries],
+        "breakdowns": [breakdowns.get(user["email"]) for user in ranking_data]
+    }
+
+def build_leaderboard_index(ranking_data, score_breakdowns=None):
+    """Precompute an order per sort key, rank-ordered members per achievement and learner lookups"""
+    positions = range(len(ranking_data))
+    
+    # Highest value first; ties keep leaderboard rank order
+    sort_orders = {"rank": list(positions)}
+    for key in SORT_KEYS[1:]:
+        sort_orders[key] = sorted(positions, key=lambda position: (-ranking_data[position][key], position))
+    
+    achievements = {}
+    for position, user in enumerate(ranking_data):
+        for achievement in user.get("achievements", []):
+            achievements.setdefault(achievement, []).append(position)
+    
+    return {
+        "sortOrders": sort_orders,
+        "achievements": achievements,
+        "learners": build_learner_index(ranking_data, score_breakdowns)
+    }
+
+def prepare_leaderboard(leaderboard, load_entries=None, load_learner=None):
+    """Add lookup structures a warm instance keeps next to a cached leaderboard
+    
+    Only the index is kept warm. Ranking entries are read when a page or lookup
+    needs them: load_entries(positions) returns the entries at those rank-order
+    positions and load_learner(email, position) the entry of one learner. Both
+    default to the leaderboard's in-memory rankingData.
+    """
+    ranking_data = leaderboard.get("rankingData")
+    leaderboard["achievementSets"] = {name: frozenset(members)
+                                      for name, members in leaderboard["index"]["achievements"].items()}
+    leaderboard["loadEntries"] = load_entries or (lambda positions: [ranking_data[position] for position in positions])
+    leaderboard["loadLearner"] = load_learner or (lambda email, position: ranking_data[position])
+    return leaderboard
+
+def _page_positions(positions, offset, limit, descending):
+    """Slice a precomputed order in either direction without copying it"""
+    if descending:
+        return positions[offset:offset + limit]
+    end = len(positions) - offset
+    return positions[max(end - limit, 0):max(end, 0)][::-1]
+
+def paginate_leaderboard(leaderboard, offset=0, limit=DEFAULT_PAGE_SIZE, sort="rank", order="desc", achievement=None):
+    """Return one page of ranking entries and the number of matching entries
+    
+    Unfiltered pages and achievement pages in rank order slice a precomputed
+    order directly. Other sorts combined with an achievement filter walk the
+    sort order and skip non-members until the page is full.
+    """
+    index = leaderboard["index"]
+    descending = order != "asc"
+    positions = index["sortOrders"][sort]
+    
+    if achievement is None:
+        total = len(positions)
+        page = _page_positions(positions, offset, limit, descending)
+    elif sort == "rank":
+        members = index["achievements"].get(achievement, [])
+        total = len(members)
+        page = _page_positions(members, offset, limit, descending)
+    else:
+        members = leaderboard["achievementSets"].get(achievement, frozenset())
+        total = len(members)
+        ordered = positions if descending else reversed(positions)
+        page = list(islice((position for position in ordered if position in members), offset, offset + limit))
+    
+    return leaderboard["loadEntries"](page), total
+
+def page_etag(leaderboard_id, params):
+    """Build a strong ETag for one page; it only changes with the snapshot or the parameters"""
+    digest = hashlib.sha256(json.dumps([leaderboard_id, params], sort_keys=True).encode()).hexdigest()
+    return '"' + digest[:32] + '"'
+
+def find_learner(leaderboard, email):
+    """Look up one learner's ranking entry and score breakdown by email"""
+    learners = leaderboard["index"]["learners"]
+    position = learners["emails"].get(normalize_search_key(email))
+    if position is None:
+        return None
+    return {"entry": leaderboard["loadLearner"](email, position), "breakdown": learners["breakdowns"][position]}
+
+def search_learners(leaderboard, query, limit=DEFAULT_SEARCH_RESULTS):
+    """Find learners whose name or email starts with query, best rank first"""
+    learners = leaderboard["index"]["learners"]
+    prefix = normalize_search_key(query)
+    keys = learners["prefixKeys"]
+    if not prefix:
+        return []
+    
+    # Entries sort by (key, position), so each matching key's run is already in rank order;
+    # binary search hops from run to run and merging them stops after limit learners
+    positions = learners["prefixPositions"]
+    runs = []
+    start = bisect_left(keys, prefix)
+    while start < len(keys) and keys[start].startswith(prefix):
+        stop = bisect_right(keys, keys[start], start)
+        runs.append(map(positions.__getitem__, range(start, stop)))
+        start = stop
+    
+    # A learner matching by several keys comes out of the merge once per key, back to back
+    matches = []
+    for position in heapq.merge(*runs):
+        if not matches or matches[-1] != position:
+            matches.append(position)
+            if len(matches) == limit:
+                break
+    return leaderboard["loadEntries"](matches)
+
+def compute_snapshot_diff(previous_snapshot_id, previous_ranking, current_ranking):
+    """Diff two rankings in one hash join over email
+    
+    Movers are learners in both snapshots whose rank, points or achievements
+    changed, biggest climbers first. rankDelta is positive when a learner moved up.
+    """
+    previous_by_email = {entry["email"]: entry for entry in previous_ranking}
+    movers = []
+    new_entrants = []
+    for entry in current_ranking:
+        previous = previous_by_email.pop(entry["email"], None)
+        if previous is None:
+            new_entrants.append({"email": entry["email"], "name": entry["name"],
+                                 "rank": entry["rank"], "totalPoints": entry["totalPoints"]})
+            continue
+        
+        earned = set(previous.get("achievements", []))
+        new_achievements = [name for name in entry.get("achievements", []) if name not in earned]
+        rank_delta = previous["rank"] - entry["rank"]
+        points_delta = entry["totalPoints"] - previous["totalPoints"]
+        if rank_delta or points_delta or new_achievements:
+            movers.append({
+                "email": entry["email"],
+                "name": entry["name"],
+                "rank": entry["rank"],
+                "previousRank": previous["rank"],
+                "rankDelta": rank_delta,
+                "totalPoints": entry["totalPoints"],
+                "pointsDelta": points_delta,
+                "newAchievements": new_achievements
+            })
+    
+    movers.sort(key=lambda mover: (-mover["rankDelta"], -mover["pointsDelta"], mover["rank"]))
+    
+    # Whoever was not matched by the join has dropped out
+    drop_outs = sorted(({"email": entry["email"], "name": entry["name"], "previousRank": entry["rank"],
+                         "totalPoints": entry["totalPoints"]} for entry in previous_by_email.values()),
+                       key=lambda entry: entry["previousRank"])
+    
+    return {
+        "previousSnapshotId": previous_snapshot_id,
+        "movers": movers,
+        "newEntrants": new_entrants,
+        "dropOuts": drop_outs
+    }
+
+def movers_view(diff, limit=DEFAULT_PAGE_SIZE):
+    """Trim each list of a stored snapshot diff to limit entries, keeping the full counts"""
+    return {
+        "previousSnapshotId": diff["previousSnapshotId"],
+        "movers": diff["movers"][:limit],
+        "newEntrants": diff["newEntrants"][:limit],
+        "dropOuts": diff["dropOuts"][:limit],
+        "totals": {name: len(diff[name]) for name in ("movers", "newEntrants", "dropOuts")}
+    }
+
+def bucket_ranking_entry(email, name, totals):
+    """Build a ranking entry from one user's summed bucket totals
+    
+    Points are question points plus the rubric's follow-up points. The rubric's
+    user bonuses are earned on all-time totals, so windowed and scoped totals
+    leave them out.
+    """
+    interactions = totals["totalInteractions"]
+    return {
+        "email": email,
+        "name": name,
+        "totalPoints": totals["questionPoints"] + totals["followUps"] * get_rubric().follow_up_points,
+        "totalInteractions": interactions,
+        "totalCredits": totals["totalCredits"],
+        "followUps": totals["followUps"],
+        "successRate": (totals["successCount"] / interactions) * 100 if interactions > 0 else 0
+    }
+
+def rank_bucket_entries(ranking_data):
+    """Sort bucket ranking entries by points and number their ranks in place"""
+    # Ties keep email order so the same buckets always rank the same way
+    ranking_data.sort(key=lambda entry: entry["email"])
+    ranking_data.sort(key=lambda entry: entry["totalPoints"], reverse=True)
+    for position, entry in enumerate(ranking_data):
+        entry["rank"] = position + 1
+    return ranking_data
+
+def build_window_leaderboard(bucket_records, names):
+    """Sum a window's daily buckets per user and rank them
+    
+    Points are question points plus follow-up points earned inside the window;
+    all-time user bonuses such as Pathway Pro are not part of any window.
+    """
+    totals = {}
+    for record in bucket_records:
+        total = totals.get(record["email"])
+        if total is None:
+            total = totals[record["email"]] = dict.fromkeys(BUCKET_TOTALS, 0)
+            total["activeDays"] = 0
+        for field in BUCKET_TOTALS:
+            total[field] += record[field]
+        total["activeDays"] += 1
+    
+    return rank_bucket_entries([
+        {**bucket_ranking_entry(email, names.get(email, 'Unknown User'), total), "activeDays": total["activeDays"]}
+        for email, total in totals.items()
+    ])
+
+def rank_scope_records(scope_records):
+    """Rank the scope bucket records of one course or assistant, returning them in rank order"""
+    entries = rank_bucket_entries([{**bucket_ranking_entry(record["email"], record["name"], record), "record": record}
+                                   for record in scope_records])
+    return [{**entry["record"], "rank": entry["rank"]} for entry in entries]
+
+def scope_record_to_entry(record):
+    """Build the ranking entry served for a ranked scope bucket record"""
+    return {**bucket_ranking_entry(record["email"], record["name"], record), "rank": record["rank"]}
+
+def parse_page_params(query):
+    """Validate pagination query parameters, raising ValueError on bad input"""
+    def single(name, default=None):
+        values = query.get(name)
+        return values[0] if values else default
+    
+    try:
+        offset = int(single("offset", 0))
+        limit = int(single("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("offset and limit must be integers")
+    if offset < 0 or limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"offset must be >= 0 and limit between 1 and {MAX_PAGE_SIZE}")
+    
+    sort = single("sort", "rank")
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+    
+    order = single("order", "desc")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+    
+    return {"offset": offset, "limit": limit, "sort": sort, "order": order, "achievement": single("achievement")}
+
+def parse_movers_params(query):
+    """Validate the movers view limit, raising ValueError on bad input"""
+    try:
+        limit = int(query.get("limit", [DEFAULT_PAGE_SIZE])[0])
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return {"view": "movers", "limit": limit}
+
+def parse_window_params(query, today=None):
+    """Validate a time window as an inclusive from/to day range, raising ValueError on bad input
+    
+    window=week or window=month ends today (UTC); from/to (YYYY-MM-DD) pick a custom range.
+    """
+    def single(name, default=None):
+        values = query.get(name)
+        return values[0] if values else default
+    
+    def day(name, value):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise ValueError(f"{name} must be a date in YYYY-MM-DD format")
+    
+    today = today or datetime.utcnow().date()
+    window = single("window")
+    if window is not None:
+        if window not in WINDOW_DAYS:
+            raise ValueError(f"window must be one of: {', '.join(WINDOW_DAYS)}")
+        if "from" in query or "to" in query:
+            raise ValueError("window cannot be combined with from/to")
+        start, end = today - timedelta(days=WINDOW_DAYS[window] - 1), today
+    elif "from" in query:
+        start = day("from", single("from"))
+        end = day("to", single("to")) if "to" in query else today
+    else:
+        raise ValueError("window or from is required")
+    
+    if start > end:
+        raise ValueError("from must not be after to")
+    
+    try:
+        offset = int(single("offset", 0))
+        limit = int(single("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("offset and limit must be integers")
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    
+    return {"view": "window", "window": window, "from": start.isoformat(), "to": end.isoformat(),
+            "offset": offset, "limit": limit}
+
+def parse_scope_params(query):
+    """Validate a course or assistant filter with its page, raising ValueError on bad input"""
+    scopes = [scope for scope in SCOPES if scope in query]
+    if len(scopes) != 1:
+        raise ValueError(f"exactly one of {', '.join(SCOPES)} is required")
+    scope = scopes[0]
+    scope_value = query[scope][0].strip()
+    if not scope_value:
+        raise ValueError(f"{scope} must not be empty")
+    
+    try:
+        offset = int(query.get("offset", [0])[0])
+        limit = int(query.get("limit", [DEFAULT_PAGE_SIZE])[0])
+    except ValueError:
+        raise ValueError("offset and limit must be integers")
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    
+    return {"scope": scope, scope: scope_value, "offset": offset, "limit": limit}
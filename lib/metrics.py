@@ -0,0 +1,152 @@
+"""
+In-process request, upload and memory metrics reported by the health endpoint
+Counters live in the process that served the requests, so each serverless instance reports its own
+"""
+
+import os
+import sys
+import time
+import resource
+import threading
+from datetime import datetime
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Routes the API serves; requests to any other path are counted together as "other"
+ENDPOINTS = {
+    "auth": "/api/auth/login",
+    "logout": "/api/auth/logout",
+    "upload": "/api/data/upload",
+    "jobs": "/api/data/jobs",
+    "results": "/api/data/results",
+    "learner": "/api/data/learner",
+    "clear": "/api/data/clear",
+    "health": "/api/health"
+}
+
+_ENDPOINT_PATHS = frozenset(ENDPOINTS.values())
+
+_lock = threading.Lock()
+_started_at = time.time()
+# (endpoint, method, status) -> count
+_request_counts = {}
+# endpoint -> [count per bucket plus +Inf, sum of seconds, count]
+_latencies = {}
+_last_upload = [None]
+
+def endpoint_label(path):
+    """Label a request path by its route, so unknown paths cannot grow the metrics without bound"""
+    path = path.rstrip("/")
+    return path if path in _ENDPOINT_PATHS else "other"
+
+def observe_request(method, path, status, seconds):
+    """Count a finished request and add its latency to the endpoint's histogram"""
+    endpoint = endpoint_label(path)
+    bucket = next((index for index, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+    with _lock:
+        key = (endpoint, method, status)
+        _request_counts[key] = _request_counts.get(key, 0) + 1
+        histogram = _latencies.get(endpoint)
+        if histogram is None:
+            histogram = _latencies[endpoint] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+        histogram[0][bucket] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+def observe_upload(mode, rows, new_rows, seconds):
+    """Remember the most recent upload this process saved"""
+    with _lock:
+        _last_upload[0] = {
+            "mode": mode,
+            "rows": rows,
+            "newRows": new_rows,
+            "durationMs": round(seconds * 1000, 1),
+            "finishedAt": datetime.utcnow().isoformat()
+        }
+
+def last_upload():
+    """The most recent upload this process saved, or None"""
+    with _lock:
+        return dict(_last_upload[0]) if _last_upload[0] is not None else None
+
+def _histogram_quantile(buckets, count, quantile):
+    """Upper bound (seconds) of the bucket holding the quantile, or None past the last bound"""
+    rank = quantile * count
+    cumulative = 0
+    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+        cumulative += bucket_count
+        if cumulative >= rank:
+            return bound
+    return None
+
+def request_metrics():
+    """Request counts by status and latency summaries per endpoint"""
+    with _lock:
+        counts = dict(_request_counts)
+        latencies = {endpoint: (list(buckets), total, count) for endpoint, (buckets, total, count) in _latencies.items()}
+
+    report = {}
+    for (endpoint, method, status), count in sorted(counts.items()):
+        entry = report.setdefault(endpoint, {"requests": 0, "byStatus": {}})
+        entry["requests"] += count
+        entry["byStatus"][str(status)] = entry["byStatus"].get(str(status), 0) + count
+    for endpoint, (buckets, total, count) in latencies.items():
+        # Percentiles are bucket upper bounds, so they are conservative to within one bucket
+        quantiles = {name: _histogram_quantile(buckets, count, quantile)
+                     for name, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+        report[endpoint]["latencyMs"] = {
+            "avg": round(total / count * 1000, 1),
+            **{name: round(bound * 1000, 1) if bound is not None else None for name, bound in quantiles.items()}
+        }
+    return report
+
+def latency_histograms():
+    """Cumulative latency histogram, sum and count per endpoint, as Prometheus reports them"""
+    with _lock:
+        latencies = {endpoint: (list(buckets), total, count) for endpoint, (buckets, total, count) in _latencies.items()}
+    histograms = {}
+    for endpoint, (buckets, total, count) in sorted(latencies.items()):
+        cumulative, running = [], 0
+        for bucket_count in buckets:
+            running += bucket_count
+            cumulative.append(running)
+        histograms[endpoint] = {"buckets": cumulative, "sum": total, "count": count}
+    return histograms
+
+def request_counts():
+    """Request counts keyed by (endpoint, method, status)"""
+    with _lock:
+        return dict(_request_counts)
+
+def max_rss_mb():
+    """Peak resident memory of this process in MB"""
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10, 1)
+
+def rss_mb():
+    """Current resident memory of this process in MB, or None where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def process_metrics():
+    """Memory and uptime of this process"""
+    return {
+        "pid": os.getpid(),
+        "uptimeSeconds": round(time.time() - _started_at, 1),
+        "startedAt": _started_at,
+        "rssMB": rss_mb(),
+        "maxRssMB": max_rss_mb()
+    }
+
+def reset_metrics():
+    """Drop all request and upload metrics"""
+    with _lock:
+        _request_counts.clear()
+        _latencies.clear()
+        _last_upload[0] = None
@@ -0,0 +1,121 @@
+"""
+Read-only PostgREST client over http.client, so read paths never load the Supabase SDK
+Implements the select subset of the supabase-py query builder that lib.database uses
+"""
+
+import gzip
+import json
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode, quote
+
+class PostgrestError(Exception):
+    """A request PostgREST answered with an error status"""
+
+    def __init__(self, status, message):
+        super().__init__(f"PostgREST error {status}: {message}")
+        self.status = status
+
+class PostgrestResponse:
+    """Decoded rows of a select, exposed as .data like supabase-py responses"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+class SelectQuery:
+    """Chainable select on one table"""
+
+    def __init__(self, reader, table):
+        self._reader = reader
+        self._table = table
+        self._params = []
+        self._order = []
+
+    def select(self, columns):
+        self._params.append(("select", "".join(columns.split())))
+        return self
+
+    def _filter(self, column, operator, value):
+        self._params.append((column, f"{operator}.{value}"))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def in_(self, column, values):
+        # Quoted so values containing commas or parentheses stay whole
+        quoted = ",".join('"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"' for value in values)
+        return self._filter(column, "in", f"({quoted})")
+
+    def order(self, column, desc=False):
+        self._order.append(f"{column}.{'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, count):
+        self._params.append(("limit", str(count)))
+        return self
+
+    def range(self, start, end):
+        self._params.extend([("offset", str(start)), ("limit", str(end - start + 1))])
+        return self
+
+    def execute(self):
+        params = self._params + ([("order", ",".join(self._order))] if self._order else [])
+        return PostgrestResponse(self._reader.get(f"/rest/v1/{quote(self._table)}", params))
+
+class PostgrestReader:
+    """Select-only PostgREST client keeping one keep-alive connection per thread"""
+
+    def __init__(self, url, key, timeout):
+        parts = urlsplit(url)
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._host = parts.hostname
+        self._port = parts.port
+        self._base_path = parts.path.rstrip("/")
+        self._timeout = timeout
+        self._headers = {"apikey": key, "Authorization": f"Bearer {key}", "Accept": "application/json",
+                         "Accept-Encoding": "gzip"}
+        self._local = threading.local()
+
+    def table(self, name):
+        return SelectQuery(self, name)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connection_class(self._host, self._port, timeout=self._timeout)
+            self._local.connection = connection
+        return connection
+
+    def get(self, path, params):
+        """GET rows from a PostgREST path and decode them"""
+        connection = self._connection()
+        try:
+            connection.request("GET", f"{self._base_path}{path}?{urlencode(params)}", headers=self._headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            # The next request opens a fresh connection instead of reusing a broken one
+            connection.close()
+            self._local.connection = None
+            raise
+
+        if response.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        if response.status >= 400:
+            raise PostgrestError(response.status, body.decode("utf-8", "replace")[:500])
+        return json.loads(body) if body else []
@@ -0,0 +1,246 @@
+"""
+Declarative scoring rubric compiled once into column-wise evaluators
+Set RUBRIC_CONFIG to a JSON file in the DEFAULT_RUBRIC shape to change the rules without a code change
+"""
+
+import os
+import re
+import math
+import json
+import hashlib
+import threading
+
+DEFAULT_RUBRIC = {
+    # Every answered question earns this before its rule bonuses
+    "questionPoints": 1,
+    # Per-row rules: a keyword set matched anywhere in the lowercased field, or a word-count threshold
+    "questionRules": [
+        {
+            "id": "goalAligned",
+            "field": "input",
+            "keywords": ["exam", "test", "certification", "comptia", "class", "course",
+                         "assignment", "homework", "study", "cert prep", "calendar", "upcoming"],
+            "points": 2,
+            "criterion": "Goal-aligned question (+2 pts)",
+            "breakdown": "goalAlignedQuestions"
+        },
+        {
+            "id": "specificTopic",
+            "field": "input",
+            "keywords": ["subnetting", "networking", "security", "hardware", "troubleshooting",
+                         "attendance", "health check", "assistant", "coach", "tutor"],
+            "points": 1,
+            "criterion": "Specific topic/keyword (+1 pt)",
+            "breakdown": "specificTopicQuestions"
+        },
+        {
+            "id": "detailedResponse",
+            "field": "outputs",
+            "moreThanWords": 50,
+            "points": 1,
+            "criterion": "Detailed response received (+1 pt)",
+            "breakdown": "detailedResponses"
+        }
+    ],
+    # Points per follow-up question (every interaction after the first in a conversation)
+    "followUpPoints": 2,
+    # Per-user bonuses; "when" maps a score metric to the minimum it must reach
+    "userBonuses": [
+        {"id": "pathwayPro", "when": {"uniqueCourses": 3}, "points": 5,
+         "criterion": "Pathway Pro achievement (+5 pts)"}
+    ],
+    # Achievements awarded from the final scores, in display order
+    "achievements": [
+        {"name": "🧠 Deep Diver", "when": {"followUps": 5}},
+        {"name": "📚 Study Strategist", "when": {"totalPoints": 15}},
+        {"name": "🎓 Pathway Pro", "when": {"uniqueCourses": 3}}
+    ]
+}
+
+# Path of a JSON rubric replacing DEFAULT_RUBRIC; empty uses the default
+RUBRIC_CONFIG = os.environ.get("RUBRIC_CONFIG", "")
+
+# Text columns question rules can read
+QUESTION_FIELDS = ("input", "outputs")
+
+# Metrics bonuses can test (before bonus points are added) and achievements can test (final scores)
+BONUS_METRICS = ("totalInteractions", "totalCredits", "followUps", "uniqueCourses", "uniqueAssistants")
+ACHIEVEMENT_METRICS = BONUS_METRICS + ("totalPoints", "successRate")
+
+# Joins a column's rows for scanning; keywords may not contain it
+_ROW_SEPARATOR = "\x00"
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+_active = [None]
+
+def _text_column(values):
+    """Return values as an object-dtype Series so string ops use Python semantics"""
+    import pandas as pd
+    if isinstance(values, pd.Series):
+        values = values.to_numpy(dtype=object)
+    return pd.Series(values, dtype=object)
+
+def _rows_matching(pattern, text, starts, rows):
+    """Mask of rows with a pattern match, scanning all rows joined into one string"""
+    import numpy as np
+    hits = np.zeros(rows, dtype=bool)
+    positions = np.fromiter((match.start() for match in pattern.finditer(text)), dtype=np.int64)
+    hits[np.searchsorted(starts, positions, side='right') - 1] = True
+    return hits
+
+def _predicate(when, metrics, context):
+    """Validate a {metric: minimum} condition and return it as (metric, minimum) pairs"""
+    if not isinstance(when, dict) or not when:
+        raise ValueError(f"{context} needs a non-empty 'when' of metric minimums")
+    for metric, minimum in when.items():
+        if metric not in metrics:
+            raise ValueError(f"{context} tests unknown metric '{metric}'; use one of {', '.join(metrics)}")
+        if not isinstance(minimum, (int, float)) or not math.isfinite(minimum):
+            raise ValueError(f"{context} needs a finite numeric minimum for '{metric}'")
+    return tuple(when.items())
+
+def _compile_achievements(achievements):
+    """Build one function that checks every achievement predicate in a single pass over the users"""
+    def award_achievements(user_scores):
+        return {email: [name for name, when in achievements if all(scores[m] >= v for m, v in when)]
+                for email, scores in user_scores.items()}
+    return award_achievements
+
+class CompiledRubric:
+    """A rubric config compiled into one evaluator for question rows and one for users"""
+
+    def __init__(self, config, digest):
+        self.config = config
+        self.digest = digest
+        self.question_points = config.get("questionPoints", 1)
+        self.follow_up_points = config.get("followUpPoints", 0)
+
+        # Rule order fixes the order criteria are listed in
+        self.rules = []
+        # field -> [(rule id, pattern)], each pattern one alternation over the rule's keywords
+        self.keyword_scans = {}
+        # field -> (word cap, [(rule id, threshold)]); one capped split per row serves every threshold
+        self.word_counts = {}
+        for rule in config.get("questionRules", []):
+            rule_id, field = rule.get("id"), rule.get("field")
+            if not rule_id or field not in QUESTION_FIELDS:
+                raise ValueError(f"Question rule {rule_id!r} needs an id and a field in {QUESTION_FIELDS}")
+            if "keywords" in rule:
+                keywords = [str(keyword).lower() for keyword in rule["keywords"]]
+                if not keywords or not all(keywords) or any(_ROW_SEPARATOR in keyword for keyword in keywords):
+                    raise ValueError(f"Question rule '{rule_id}' needs non-empty keywords")
+                pattern = re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+                self.keyword_scans.setdefault(field, []).append((rule_id, pattern))
+            elif "moreThanWords" in rule:
+                threshold = int(rule["moreThanWords"])
+                cap, thresholds = self.word_counts.get(field, (0, []))
+                self.word_counts[field] = (max(cap, threshold), thresholds + [(rule_id, threshold)])
+            else:
+                raise ValueError(f"Question rule '{rule_id}' needs 'keywords' or 'moreThanWords'")
+            self.rules.append((rule_id, rule.get("points", 0), rule.get("criterion", rule_id),
+                               rule.get("breakdown", f"{rule_id}Questions")))
+        self.rule_ids = [rule_id for rule_id, _, _, _ in self.rules]
+        if len(set(self.rule_ids)) != len(self.rule_ids):
+            raise ValueError("Question rule ids must be unique")
+
+        self.bonuses = []
+        for bonus in config.get("userBonuses", []):
+            bonus_id = bonus.get("id")
+            if not bonus_id:
+                raise ValueError(f"User bonus {bonus_id!r} needs an id")
+            self.bonuses.append((bonus_id, _predicate(bonus.get("when"), BONUS_METRICS, f"Bonus '{bonus_id}'"),
+                                 bonus.get("points", 0), bonus.get("criterion", bonus_id)))
+        self.achievements = []
+        for achievement in config.get("achievements", []):
+            name = achievement.get("name")
+            if not name:
+                raise ValueError(f"Achievement {name!r} needs a name")
+            self.achievements.append((name, _predicate(achievement.get("when"), ACHIEVEMENT_METRICS,
+                                                       f"Achievement '{name}'")))
+        # A plain loop beats gathering the scores into arrays, since they arrive as per-user dicts
+        self.award_achievements = _compile_achievements(self.achievements)
+
+    def score_questions(self, inputs, outputs):
+        """Score whole input/output columns: points plus a match mask per question rule"""
+        # Only scoring needs numpy; read endpoints import the rubric for its point values alone
+        import numpy as np
+        texts = {"input": _text_column(inputs), "outputs": _text_column(outputs)}
+
+        # Rows without both a question and an answer earn nothing
+        answered = (texts["input"].notna() & texts["outputs"].notna() &
+                    texts["input"].astype(bool) & texts["outputs"].astype(bool))
+        rows = len(answered)
+        matched = {}
+
+        # Each field is joined once and every keyword set scans it in C, instead of one regex call per row
+        for field, scans in self.keyword_scans.items():
+            lowered = texts[field].where(answered, '').map(str).str.lower().tolist()
+            lengths = np.fromiter(map(len, lowered), dtype=np.int64, count=rows)
+            starts = np.cumsum(lengths + 1) - lengths - 1
+            text = _ROW_SEPARATOR.join(lowered)
+            for rule_id, pattern in scans:
+                matched[rule_id] = _rows_matching(pattern, text, starts, rows)
+
+        # split() with a cap stops splitting once a row passes the largest threshold
+        for field, (cap, thresholds) in self.word_counts.items():
+            values = texts[field].where(answered, '').map(str).tolist()
+            counts = np.fromiter((len(value.split(None, cap)) for value in values), dtype=np.int64, count=rows)
+            for rule_id, threshold in thresholds:
+                matched[rule_id] = counts > threshold
+
+        answered = answered.to_numpy(dtype=bool)
+        points = answered.astype(np.int64) * self.question_points
+        for rule_id, rule_points, _, _ in self.rules:
+            matched[rule_id] = matched[rule_id] & answered
+            points += rule_points * matched[rule_id].astype(np.int64)
+        return {"points": points, **matched}
+
+    def question_criteria(self, matched):
+        """Criteria labels for one scored question, given its match per rule in rule order"""
+        return [criterion for (_, _, criterion, _), hit in zip(self.rules, matched) if hit]
+
+    def user_bonuses(self, metrics):
+        """Bonuses a user's metrics qualify for, as (id, met, points, criterion)"""
+        return [(bonus_id, all(metrics[metric] >= minimum for metric, minimum in when), points, criterion)
+                for bonus_id, when, points, criterion in self.bonuses]
+
+def rubric_digest(config):
+    """Stable hash of a rubric config, so equal configs share one compiled rubric"""
+    canonical = json.dumps(config, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def compile_rubric(config):
+    """Compile a rubric config, reusing the compiled rubric of an identical config"""
+    digest = rubric_digest(config)
+    rubric = _compiled.get(digest)
+    if rubric is None:
+        with _compiled_lock:
+            rubric = _compiled.get(digest)
+            if rubric is None:
+                rubric = _compiled[digest] = CompiledRubric(json.loads(json.dumps(config)), digest)
+    return rubric
+
+def load_rubric_config(path=None):
+    """Read the rubric config from RUBRIC_CONFIG (or path), falling back to DEFAULT_RUBRIC"""
+    path = path if path is not None else RUBRIC_CONFIG
+    if not path:
+        return DEFAULT_RUBRIC
+    try:
+        with open(path, encoding="utf-8") as config_file:
+            return json.load(config_file)
+    except Exception as e:
+        print(f"Error loading rubric config {path}: {e}")
+        raise
+
+def get_rubric():
+    """The active compiled rubric, loaded and compiled on first use"""
+    rubric = _active[0]
+    if rubric is None:
+        rubric = _active[0] = compile_rubric(load_rubric_config())
+    return rubric
+
+def use_rubric(config=None):
+    """Make config the active rubric, or go back to the configured one when None"""
+    _active[0] = compile_rubric(config) if config is not None else None
+    return get_rubric()
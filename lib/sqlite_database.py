@@ -0,0 +1,587 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from lib.artifacts import render_results_body, build_results_artifact
+from lib.leaderboard import (build_leaderboard_index, ranking_entry_to_row, ranking_row_to_entry, RANKING_ROW_COLUMNS,
+                             DAILY_BUCKET_ROW_COLUMNS, SCOPE_ROW_COLUMNS)
+
+# Database file for the embedded backend (":memory:" is per-thread and only useful in tests)
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "gamification.db")
+
+# Same batch sizes as the Supabase backend
+STATE_WRITE_BATCH_SIZE = 1000
+ROW_KEY_LOOKUP_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    summary_stats TEXT NOT NULL,
+    raw_data_count INTEGER DEFAULT 0,
+    user_count INTEGER DEFAULT 0,
+    response_body BLOB,
+    response_gzip BLOB,
+    response_br BLOB,
+    content_hash TEXT,
+    leaderboard_index TEXT,
+    snapshot_diff TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshot_rankings (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    name TEXT,
+    total_points INTEGER NOT NULL,
+    total_interactions INTEGER,
+    total_credits INTEGER,
+    follow_ups INTEGER,
+    unique_courses INTEGER,
+    success_rate REAL,
+    achievements TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (snapshot_id, rank)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_snapshot_rankings_email ON snapshot_rankings(snapshot_id, email);
+CREATE TABLE IF NOT EXISTS admin_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    token TEXT UNIQUE NOT NULL,
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_aggregates (
+    email TEXT PRIMARY KEY,
+    aggregate TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ingested_rows (
+    row_key TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS user_daily_buckets (
+    email TEXT NOT NULL,
+    day TEXT NOT NULL,
+    total_interactions INTEGER NOT NULL,
+    total_credits INTEGER NOT NULL,
+    question_points INTEGER NOT NULL,
+    follow_ups INTEGER NOT NULL,
+    duration_sum_ms INTEGER NOT NULL,
+    ttft_sum_ms INTEGER NOT NULL,
+    success_count INTEGER NOT NULL,
+    PRIMARY KEY (email, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS scope_rankings (
+    scope TEXT NOT NULL,
+    scope_value TEXT NOT NULL,
+    email TEXT NOT NULL,
+    name TEXT NOT NULL,
+    total_interactions INTEGER NOT NULL,
+    total_credits INTEGER NOT NULL,
+    question_points INTEGER NOT NULL,
+    follow_ups INTEGER NOT NULL,
+    duration_sum_ms INTEGER NOT NULL,
+    ttft_sum_ms INTEGER NOT NULL,
+    success_count INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (scope, scope_value, email)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id TEXT PRIMARY KEY,
+    mode TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    payload_path TEXT,
+    bytes_total INTEGER NOT NULL DEFAULT 0,
+    bytes_processed INTEGER NOT NULL DEFAULT 0,
+    rows_processed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    updated_at TEXT NOT NULL,
+    finished_at TEXT,
+    heartbeat_at TEXT,
+    error TEXT,
+    result TEXT,
+    synchronous INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_admin_sessions_expires_at ON admin_sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_queue ON upload_jobs(stage, created_at);
+CREATE INDEX IF NOT EXISTS idx_user_daily_buckets_day ON user_daily_buckets(day);
+CREATE INDEX IF NOT EXISTS idx_scope_rankings_rank ON scope_rankings(scope, scope_value, rank);
+"""
+
+# Columns added after a table was first created: (table, column, type)
+ADDED_COLUMNS = (
+    ("snapshots", "snapshot_diff", "TEXT"),
+    ("upload_jobs", "heartbeat_at", "TEXT"),
+)
+
+# The latest snapshot is the highest id, so every "latest" read is a primary key seek
+LATEST_ID_SQL = "SELECT id FROM snapshots ORDER BY id DESC LIMIT 1"
+LATEST_RESULTS_SQL = "SELECT id, created_at, summary_stats, raw_data_count FROM snapshots ORDER BY id DESC LIMIT 1"
+LATEST_ARTIFACT_SQL = ("SELECT id, response_body, response_gzip, response_br, content_hash "
+                       "FROM snapshots ORDER BY id DESC LIMIT 1")
+LATEST_LEADERBOARD_SQL = "SELECT id, created_at, leaderboard_index FROM snapshots ORDER BY id DESC LIMIT 1"
+LATEST_DIFF_SQL = "SELECT id, created_at, snapshot_diff FROM snapshots ORDER BY id DESC LIMIT 1"
+INSERT_SNAPSHOT_SQL = ("INSERT INTO snapshots (created_at, summary_stats, raw_data_count, user_count, "
+                       "response_body, response_gzip, response_br, content_hash, leaderboard_index, snapshot_diff) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+RANKING_COLUMNS = [column for _, column in RANKING_ROW_COLUMNS]
+INSERT_RANKING_SQL = (f"INSERT INTO snapshot_rankings (snapshot_id, {', '.join(RANKING_COLUMNS)}) "
+                      f"VALUES ({', '.join('?' * (len(RANKING_COLUMNS) + 1))})")
+SELECT_RANKINGS_SQL = (f"SELECT {', '.join(RANKING_COLUMNS)} FROM snapshot_rankings "
+                       "WHERE snapshot_id = ? ORDER BY rank")
+SELECT_RANKING_SQL = (f"SELECT {', '.join(RANKING_COLUMNS)} FROM snapshot_rankings "
+                      "WHERE snapshot_id = ? AND email = ? LIMIT 1")
+SELECT_RANKING_PAGE_SQL = (f"SELECT {', '.join(RANKING_COLUMNS)} FROM snapshot_rankings "
+                           "WHERE snapshot_id = ? AND rank BETWEEN ? AND ? ORDER BY rank")
+INSERT_SESSION_SQL = "INSERT INTO admin_sessions (token, created_at, expires_at) VALUES (?, ?, ?)"
+VALIDATE_SESSION_SQL = "SELECT 1 FROM admin_sessions WHERE token = ? AND expires_at > ?"
+UPSERT_AGGREGATE_SQL = ("INSERT INTO user_aggregates (email, aggregate, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(email) DO UPDATE SET aggregate = excluded.aggregate, "
+                        "updated_at = excluded.updated_at")
+INSERT_ROW_KEY_SQL = "INSERT OR IGNORE INTO ingested_rows (row_key, created_at) VALUES (?, ?)"
+DAILY_BUCKET_COLUMNS = [column for _, column in DAILY_BUCKET_ROW_COLUMNS]
+UPSERT_DAILY_BUCKET_SQL = (f"INSERT OR REPLACE INTO user_daily_buckets ({', '.join(DAILY_BUCKET_COLUMNS)}) "
+                           f"VALUES ({', '.join('?' * len(DAILY_BUCKET_COLUMNS))})")
+SELECT_DAILY_BUCKETS_SQL = (f"SELECT {', '.join(DAILY_BUCKET_COLUMNS)} FROM user_daily_buckets "
+                            "WHERE day BETWEEN ? AND ? ORDER BY day, email")
+UPLOAD_JOB_COLUMNS = ["id", "mode", "stage", "payload_path", "bytes_total", "bytes_processed", "rows_processed",
+                      "created_at", "started_at", "updated_at", "heartbeat_at", "finished_at", "error", "result",
+                      "synchronous"]
+SELECT_UPLOAD_JOB_SQL = f"SELECT {', '.join(UPLOAD_JOB_COLUMNS)} FROM upload_jobs WHERE id = ?"
+# Jobs whose worker stopped heartbeating: scoring ones run again, saving ones may have half-saved and fail,
+# and a synchronous upload's job fails with its request
+FAIL_STALE_SYNCHRONOUS_JOBS_SQL = ("UPDATE upload_jobs SET stage = 'failed', error = ?, updated_at = ?, "
+                                   "finished_at = ? WHERE synchronous AND stage IN ('queued', 'scoring', 'saving') "
+                                   "AND COALESCE(heartbeat_at, updated_at) < ?")
+REQUEUE_STALE_JOBS_SQL = ("UPDATE upload_jobs SET stage = 'queued', started_at = NULL, heartbeat_at = NULL, "
+                          "updated_at = ? WHERE stage = 'scoring' AND COALESCE(heartbeat_at, updated_at) < ?")
+FAIL_STALE_JOBS_SQL = ("UPDATE upload_jobs SET stage = 'failed', error = ?, updated_at = ?, finished_at = ? "
+                       "WHERE stage = 'saving' AND COALESCE(heartbeat_at, updated_at) < ?")
+CLAIM_UPLOAD_JOB_SQL = ("UPDATE upload_jobs SET stage = 'scoring', started_at = ?, updated_at = ?, heartbeat_at = ? "
+                        "WHERE id = (SELECT id FROM upload_jobs WHERE stage = 'queued' ORDER BY created_at LIMIT 1) "
+                        "AND synchronous = ? AND id = COALESCE(?, id) "
+                        "AND NOT EXISTS (SELECT 1 FROM upload_jobs WHERE stage IN ('scoring', 'saving')) "
+                        f"RETURNING {', '.join(UPLOAD_JOB_COLUMNS)}")
+STALE_SAVING_ERROR = "Worker stopped while saving; upload the file again"
+STALE_SYNCHRONOUS_ERROR = "Upload request stopped before finishing; upload the file again"
+SCOPE_COLUMNS = [column for _, column in SCOPE_ROW_COLUMNS]
+UPSERT_SCOPE_SQL = (f"INSERT OR REPLACE INTO scope_rankings ({', '.join(SCOPE_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(SCOPE_COLUMNS))})")
+SELECT_SCOPE_SQL = (f"SELECT {', '.join(SCOPE_COLUMNS)} FROM scope_rankings "
+                    "WHERE scope = ? AND scope_value = ? ORDER BY rank")
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_initialized_paths = set()
+
+# Connections opened per thread; reads after the first reuse the thread's connection
+connection_stats = {"created": 0, "reused": 0}
+
+def get_connection():
+    """Return this thread's connection, opening it (and creating the schema) on first use"""
+    connection = getattr(_local, "connection", None)
+    if connection is not None and _local.path == SQLITE_PATH:
+        connection_stats["reused"] += 1
+        return connection
+    
+    close_connection()
+    
+    # sqlite3 caches compiled statements per connection, so the constant SQL above is prepared once
+    connection = sqlite3.connect(SQLITE_PATH, timeout=5.0, cached_statements=64)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    with _schema_lock:
+        if SQLITE_PATH not in _initialized_paths or SQLITE_PATH == ":memory:":
+            connection.executescript(SCHEMA)
+            _add_missing_columns(connection)
+            _initialized_paths.add(SQLITE_PATH)
+    
+    _local.connection = connection
+    _local.path = SQLITE_PATH
+    connection_stats["created"] += 1
+    return connection
+
+def _add_missing_columns(connection):
+    """Bring database files created by an older schema up to date"""
+    for table, column, column_type in ADDED_COLUMNS:
+        existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    connection.commit()
+
+def close_connection():
+    """Close this thread's connection so the next call reopens SQLITE_PATH"""
+    connection = getattr(_local, "connection", None)
+    if connection is not None:
+        connection.close()
+        _local.connection = None
+
+def get_client_stats():
+    """Get counters for connection creation and reuse"""
+    return {
+        "clientsCreated": connection_stats["created"],
+        "clientsReused": connection_stats["reused"],
+        "retries": 0
+    }
+
+def save_analysis_results(results_data):
+    """Save a results snapshot, its per-user rankings and its pre-rendered response to SQLite
+    
+    The snapshot, its rankings, the upload's daily and scope buckets
+    (results_data["dailyBuckets"], ["scopeRankings"]) and its aggregates and
+    row keys (["changedAggregates"], ["newRowKeys"]) are written in one
+    transaction, so readers never see a partially written upload. With
+    results_data["replaceState"] the new buckets, aggregates and row keys
+    replace every stored one.
+    """
+    created_at = datetime.utcnow().isoformat()
+    ranking_data = results_data["rankingData"]
+    raw_data_count = results_data.get("rawDataCount", len(results_data.get("rawData", [])))
+    
+    # Render and compress the public response once, at write time
+    body = render_results_body(results_data["summaryStats"], ranking_data, created_at, raw_data_count)
+    artifact = build_results_artifact(body)
+    index = build_leaderboard_index(ranking_data, results_data.get("scoreBreakdowns"))
+    
+    try:
+        connection = get_connection()
+        with connection:
+            snapshot_id = connection.execute(INSERT_SNAPSHOT_SQL, (
+                created_at, json.dumps(results_data["summaryStats"]), raw_data_count, len(ranking_data),
+                artifact["body"], artifact["gzip"], artifact["br"], artifact["contentHash"],
+                json.dumps(index), json.dumps(results_data.get("snapshotDiff")))).lastrowid
+            connection.executemany(INSERT_RANKING_SQL, (_ranking_values(snapshot_id, entry) for entry in ranking_data))
+            if results_data.get("replaceState"):
+                for table in ("user_daily_buckets", "scope_rankings", "user_aggregates", "ingested_rows"):
+                    connection.execute(f"DELETE FROM {table}")
+            connection.executemany(UPSERT_DAILY_BUCKET_SQL, ([record[field] for field, _ in DAILY_BUCKET_ROW_COLUMNS]
+                                                             for record in results_data.get("dailyBuckets", [])))
+            connection.executemany(UPSERT_SCOPE_SQL, ([record[field] for field, _ in SCOPE_ROW_COLUMNS]
+                                                      for record in results_data.get("scopeRankings", [])))
+            aggregates = results_data.get("changedAggregates", {})
+            connection.executemany(UPSERT_AGGREGATE_SQL, ((email, json.dumps(record), created_at)
+                                                          for email, record in aggregates.items()))
+            connection.executemany(INSERT_ROW_KEY_SQL, ((key, created_at)
+                                                        for key in results_data.get("newRowKeys", [])))
+        return {"id": snapshot_id, "created_at": created_at, "status": "published"}
+    except Exception as e:
+        print(f"Error saving analysis results: {e}")
+        raise
+
+def _ranking_values(snapshot_id, entry):
+    """Parameters for INSERT_RANKING_SQL from one ranking entry"""
+    row = ranking_entry_to_row(snapshot_id, entry)
+    row["achievements"] = json.dumps(row["achievements"])
+    return (snapshot_id, *(row[column] for column in RANKING_COLUMNS))
+
+def _ranking_entry(values):
+    """Ranking entry from one row of RANKING_COLUMNS values"""
+    row = dict(zip(RANKING_COLUMNS, values))
+    row["achievements"] = json.loads(row["achievements"])
+    return ranking_row_to_entry(row)
+
+def get_snapshot_rankings(snapshot_id):
+    """Get a snapshot's ranking entries in rank order"""
+    try:
+        return [_ranking_entry(values) for values in get_connection().execute(SELECT_RANKINGS_SQL, (snapshot_id,))]
+    except Exception as e:
+        print(f"Error fetching snapshot rankings: {e}")
+        raise
+
+def get_snapshot_ranking(snapshot_id, email):
+    """Get one learner's ranking entry in a snapshot, or None"""
+    try:
+        values = get_connection().execute(SELECT_RANKING_SQL, (snapshot_id, email)).fetchone()
+        return _ranking_entry(values) if values is not None else None
+    except Exception as e:
+        print(f"Error fetching snapshot ranking: {e}")
+        raise
+
+def get_snapshot_ranking_page(snapshot_id, first_rank, last_rank):
+    """Get a snapshot's ranking entries with first_rank <= rank <= last_rank, in rank order"""
+    try:
+        rows = get_connection().execute(SELECT_RANKING_PAGE_SQL, (snapshot_id, first_rank, last_rank))
+        return [_ranking_entry(values) for values in rows]
+    except Exception as e:
+        print(f"Error fetching snapshot ranking page: {e}")
+        raise
+
+def get_snapshot_rankings_at(snapshot_id, ranks):
+    """Get a snapshot's ranking entries at the given ranks, in rank order"""
+    connection = get_connection()
+    rankings = []
+    
+    try:
+        unique_ranks = sorted(set(ranks))
+        for start in range(0, len(unique_ranks), ROW_KEY_LOOKUP_BATCH_SIZE):
+            batch = unique_ranks[start:start + ROW_KEY_LOOKUP_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            rows = connection.execute(f"SELECT {', '.join(RANKING_COLUMNS)} FROM snapshot_rankings "
+                                      f"WHERE snapshot_id = ? AND rank IN ({placeholders}) ORDER BY rank",
+                                      (snapshot_id, *batch))
+            rankings.extend(_ranking_entry(values) for values in rows)
+        return rankings
+    except Exception as e:
+        print(f"Error fetching snapshot rankings by rank: {e}")
+        raise
+
+def get_latest_analysis_results():
+    """Get the most recent analysis results from SQLite"""
+    try:
+        row = get_connection().execute(LATEST_RESULTS_SQL).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "summaryStats": json.loads(row[2]),
+            "rankingData": get_snapshot_rankings(row[0]),
+            "createdAt": row[1],
+            "rawDataCount": row[3]
+        }
+    except Exception as e:
+        print(f"Error fetching analysis results: {e}")
+        raise
+
+def get_latest_results_artifact():
+    """Get the pre-rendered response of the most recent analysis results"""
+    try:
+        row = get_connection().execute(LATEST_ARTIFACT_SQL).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "body": bytes(row[1]), "gzip": row[2], "br": row[3], "contentHash": row[4]}
+    except Exception as e:
+        print(f"Error fetching results artifact: {e}")
+        raise
+
+def get_latest_leaderboard():
+    """Get the most recent snapshot's precomputed sort, achievement and learner index"""
+    try:
+        row = get_connection().execute(LATEST_LEADERBOARD_SQL).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "createdAt": row[1],
+            "index": json.loads(row[2]) if row[2] else build_leaderboard_index(get_snapshot_rankings(row[0]))
+        }
+    except Exception as e:
+        print(f"Error fetching leaderboard: {e}")
+        raise
+
+def get_latest_snapshot_diff():
+    """Get the rank-movement diff stored with the most recent snapshot"""
+    try:
+        row = get_connection().execute(LATEST_DIFF_SQL).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "createdAt": row[1], "diff": json.loads(row[2]) if row[2] else None}
+    except Exception as e:
+        print(f"Error fetching snapshot diff: {e}")
+        raise
+
+def get_latest_analysis_id():
+    """Get the id of the most recent analysis results, or None when there are none"""
+    try:
+        row = get_connection().execute(LATEST_ID_SQL).fetchone()
+        return row[0] if row is not None else None
+    except Exception as e:
+        print(f"Error fetching latest analysis id: {e}")
+        raise
+
+def clear_analysis_results():
+    """Clear all snapshots (and, by cascade, their rankings) and the buckets saved with them from SQLite"""
+    try:
+        connection = get_connection()
+        with connection:
+            connection.execute("DELETE FROM snapshots")
+            connection.execute("DELETE FROM user_daily_buckets")
+            connection.execute("DELETE FROM scope_rankings")
+        return True
+    except Exception as e:
+        print(f"Error clearing analysis results: {e}")
+        raise
+
+def save_admin_session(token, expires_at):
+    """Save admin session token to SQLite"""
+    created_at = datetime.utcnow().isoformat()
+    
+    try:
+        connection = get_connection()
+        with connection:
+            connection.execute(INSERT_SESSION_SQL, (token, created_at, expires_at.isoformat()))
+        return {"token": token, "created_at": created_at, "expires_at": expires_at.isoformat()}
+    except Exception as e:
+        print(f"Error saving admin session: {e}")
+        raise
+
+def delete_admin_session(token):
+    """Delete an admin session token from SQLite"""
+    try:
+        connection = get_connection()
+        with connection:
+            connection.execute("DELETE FROM admin_sessions WHERE token = ?", (token,))
+        return True
+    except Exception as e:
+        print(f"Error deleting admin session: {e}")
+        raise
+
+def validate_admin_session(token):
+    """Validate admin session token"""
+    try:
+        # ISO timestamps compare correctly as text
+        row = get_connection().execute(VALIDATE_SESSION_SQL, (token, datetime.utcnow().isoformat())).fetchone()
+        return row is not None
+    except Exception as e:
+        print(f"Error validating admin session: {e}")
+        return False
+
+def get_user_aggregates():
+    """Get the stored per-user aggregate records keyed by email"""
+    try:
+        rows = get_connection().execute("SELECT email, aggregate FROM user_aggregates")
+        return {email: json.loads(aggregate) for email, aggregate in rows}
+    except Exception as e:
+        print(f"Error fetching user aggregates: {e}")
+        raise
+
+def save_user_aggregates(aggregate_records):
+    """Upsert per-user aggregate records keyed by email"""
+    updated_at = datetime.utcnow().isoformat()
+    rows = [(email, json.dumps(record), updated_at) for email, record in aggregate_records.items()]
+    
+    try:
+        connection = get_connection()
+        with connection:
+            connection.executemany(UPSERT_AGGREGATE_SQL, rows)
+        return len(rows)
+    except Exception as e:
+        print(f"Error saving user aggregates: {e}")
+        raise
+
+def find_ingested_row_keys(row_keys):
+    """Return the subset of row keys that earlier uploads already ingested"""
+    connection = get_connection()
+    known = set()
+    
+    try:
+        unique_keys = list(dict.fromkeys(row_keys))
+        for start in range(0, len(unique_keys), ROW_KEY_LOOKUP_BATCH_SIZE):
+            batch = unique_keys[start:start + ROW_KEY_LOOKUP_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            rows = connection.execute(f"SELECT row_key FROM ingested_rows WHERE row_key IN ({placeholders})", batch)
+            known.update(row[0] for row in rows)
+        return known
+    except Exception as e:
+        print(f"Error looking up ingested rows: {e}")
+        raise
+
+def save_ingested_row_keys(row_keys):
+    """Record row keys so re-sent rows are not counted again"""
+    created_at = datetime.utcnow().isoformat()
+    
+    try:
+        connection = get_connection()
+        with connection:
+            connection.executemany(INSERT_ROW_KEY_SQL, ((key, created_at) for key in row_keys))
+        return len(row_keys)
+    except Exception as e:
+        print(f"Error saving ingested row keys: {e}")
+        raise
+
+def get_daily_buckets(start_day, end_day):
+    """Get the per-user daily buckets from start_day to end_day inclusive"""
+    fields = [field for field, _ in DAILY_BUCKET_ROW_COLUMNS]
+    try:
+        rows = get_connection().execute(SELECT_DAILY_BUCKETS_SQL, (start_day, end_day))
+        return [dict(zip(fields, row)) for row in rows]
+    except Exception as e:
+        print(f"Error fetching daily buckets: {e}")
+        raise
+
+def get_scope_rankings(scope, scope_value):
+    """Get the ranked bucket records of one course or assistant in rank order"""
+    fields = [field for field, _ in SCOPE_ROW_COLUMNS]
+    try:
+        rows = get_connection().execute(SELECT_SCOPE_SQL, (scope, scope_value))
+        return [dict(zip(fields, row)) for row in rows]
+    except Exception as e:
+        print(f"Error fetching scope rankings: {e}")
+        raise
+
+def clear_user_aggregates():
+    """Clear stored per-user aggregates and ingested row keys; daily and scope buckets go with the snapshots"""
+    try:
+        connection = get_connection()
+        with connection:
+            connection.execute("DELETE FROM user_aggregates")
+            connection.execute("DELETE FROM ingested_rows")
+        return True
+    except Exception as e:
+        print(f"Error clearing user aggregates: {e}")
+        raise
+
+def _upload_job_row(values):
+    """Build an upload job row from selected column values"""
+    job = dict(zip(UPLOAD_JOB_COLUMNS, values))
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["synchronous"] = bool(job["synchronous"])
+    return job
+
+def save_upload_job(job):
+    """Insert an upload job row"""
+    columns = [column for column in UPLOAD_JOB_COLUMNS if column in job]
+    values = [json.dumps(job[column]) if column == "result" else job[column] for column in columns]
+    try:
+        connection = get_connection()
+        with connection:
+            connection.execute(f"INSERT INTO upload_jobs ({', '.join(columns)}) "
+                               f"VALUES ({', '.join('?' * len(columns))})", values)
+        return job
+    except Exception as e:
+        print(f"Error saving upload job: {e}")
+        raise
+
+def update_upload_job(job_id, changes):
+    """Update columns of an upload job row"""
+    columns = [column for column in UPLOAD_JOB_COLUMNS if column in changes]
+    values = [json.dumps(changes[column]) if column == "result" else changes[column] for column in columns]
+    try:
+        connection = get_connection()
+        with connection:
+            connection.execute(f"UPDATE upload_jobs SET {', '.join(f'{column} = ?' for column in columns)} "
+                               "WHERE id = ?", (*values, job_id))
+        return True
+    except Exception as e:
+        print(f"Error updating upload job: {e}")
+        raise
+
+def get_upload_job(job_id):
+    """Get an upload job row, or None when there is no such job"""
+    try:
+        row = get_connection().execute(SELECT_UPLOAD_JOB_SQL, (job_id,)).fetchone()
+        return _upload_job_row(row) if row is not None else None
+    except Exception as e:
+        print(f"Error fetching upload job: {e}")
+        raise
+
+def claim_upload_job(stale_before, job_id=None):
+    """Move the oldest queued upload job to scoring and return it, or None when none can be claimed
+    
+    In one transaction, jobs whose heartbeat is older than stale_before are
+    requeued (scoring) or failed (saving, or synchronous), and nothing is claimed
+    while another job is still scoring or saving. A synchronous upload's job is
+    only claimed when its request passes job_id.
+    """
+    now = datetime.utcnow().isoformat()
+    try:
+        connection = get_connection()
+        with connection:
+            connection.execute(FAIL_STALE_SYNCHRONOUS_JOBS_SQL, (STALE_SYNCHRONOUS_ERROR, now, now, stale_before))
+            connection.execute(REQUEUE_STALE_JOBS_SQL, (now, stale_before))
+            connection.execute(FAIL_STALE_JOBS_SQL, (STALE_SAVING_ERROR, now, now, stale_before))
+            row = connection.execute(CLAIM_UPLOAD_JOB_SQL, (now, now, now, job_id is not None, job_id)).fetchone()
+        return _upload_job_row(row) if row is not None else None
+    except Exception as e:
+        print(f"Error claiming upload job: {e}")
+        raise
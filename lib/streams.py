@@ -0,0 +1,29 @@
+import io
+
+class RequestBodyReader(io.RawIOBase):
+    """Read at most Content-Length bytes from a request stream, chunk by chunk"""
+    
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._remaining = length
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        
+        data = self._stream.read(min(len(buffer), self._remaining))
+        if not data:
+            self._remaining = 0
+            return 0
+        
+        size = len(data)
+        buffer[:size] = data
+        self._remaining -= size
+        return size
+
+def open_request_body(stream, length, buffer_size=io.DEFAULT_BUFFER_SIZE * 8):
+    """Wrap a request stream so readers like pandas can consume it incrementally"""
+    return io.BufferedReader(RequestBodyReader(stream, length), buffer_size=buffer_size)
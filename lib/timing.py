@@ -0,0 +1,170 @@
+"""
+Per-request stage timers, Server-Timing headers and structured JSON log lines
+Timers only record when a request or job is being timed, so library calls elsewhere cost one lookup
+"""
+
+import os
+import json
+import time
+import functools
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+from lib.metrics import observe_request, max_rss_mb
+
+# Set to 0 to stop writing one JSON log line per request
+REQUEST_LOG = os.environ.get("REQUEST_LOG", "1") != "0"
+
+# Requests faster than this many milliseconds are not logged
+REQUEST_LOG_MIN_MS = float(os.environ.get("REQUEST_LOG_MIN_MS", "0"))
+
+_current = contextvars.ContextVar("timings", default=None)
+_exhausted = object()
+
+class Timings:
+    """Stage durations and counters collected for one request or job"""
+
+    __slots__ = ("started", "stages", "fields")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # name -> [seconds, calls]; repeated stages such as database calls accumulate
+        self.stages = {}
+        self.fields = {}
+
+    def add(self, name, seconds, calls=1):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def merge(self, other):
+        """Add another collection's stages and counters, e.g. from a worker process"""
+        for name, (seconds, calls) in other.stages.items():
+            self.add(name, seconds, calls)
+        self.fields.update(other.fields)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+@contextmanager
+def collect_timings():
+    """Time everything run inside the block into a fresh Timings"""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+def current_timings():
+    """The Timings being collected in this context, or None"""
+    return _current.get()
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the block to the named stage"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+def timed(name):
+    """Decorate a function so each call is added to the named stage"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _current.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def timed_iter(name, iterable):
+    """Yield from iterable, adding the time spent producing each item to the named stage"""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, _exhausted)
+        if item is _exhausted:
+            return
+        yield item
+
+def record(**fields):
+    """Attach counters such as row counts to the current request's log line"""
+    timings = _current.get()
+    if timings is not None:
+        timings.fields.update(fields)
+
+def run_timed(func, *args):
+    """Call func with timing on and return (result, timings) (picklable entry point for worker processes)"""
+    with collect_timings() as timings:
+        result = func(*args)
+    return result, timings
+
+def server_timing_header(timings):
+    """Format collected stages as a Server-Timing header value"""
+    metrics = []
+    for name, (seconds, calls) in timings.stages.items():
+        metric = f"{name};dur={seconds * 1000:.1f}"
+        if calls > 1:
+            metric += f';desc="{calls} calls"'
+        metrics.append(metric)
+    metrics.append(f"total;dur={timings.elapsed() * 1000:.1f}")
+    return ", ".join(metrics)
+
+def timing_headers(timings):
+    """Server-Timing plus the header that lets cross-origin pages read it"""
+    return {"Server-Timing": server_timing_header(timings), "Timing-Allow-Origin": "*"}
+
+def log_event(event, timings=None, **fields):
+    """Write one structured JSON log line"""
+    line = {"event": event, "time": round(time.time(), 3), **fields}
+    if timings is not None:
+        line["durationMs"] = round(timings.elapsed() * 1000, 1)
+        line["stages"] = {name: round(seconds * 1000, 1) for name, (seconds, _) in timings.stages.items()}
+        line.update(timings.fields)
+    line["maxRssMB"] = max_rss_mb()
+    print(json.dumps(line, default=str), flush=True)
+
+def finish_request(method, path, status, timings):
+    """Count a finished request, then log it unless request logging is off or it was fast enough to skip"""
+    elapsed = timings.elapsed()
+    observe_request(method, path, status, elapsed)
+    if REQUEST_LOG and elapsed * 1000 >= REQUEST_LOG_MIN_MS:
+        log_event("request", timings, method=method, path=path, status=status)
+
+class TimedRequestHandler(BaseHTTPRequestHandler):
+    """Request handler that times each request, sends Server-Timing and logs one JSON line"""
+
+    def handle_one_request(self):
+        self._status = None
+        with collect_timings() as timings:
+            super().handle_one_request()
+            if self._status is not None:
+                finish_request(self.command, urlparse(getattr(self, "path", None) or "").path, self._status, timings)
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        timings = _current.get()
+        if timings is not None:
+            for key, value in timing_headers(timings).items():
+                self.send_header(key, value)
+        super().end_headers()
@@ -0,0 +1,120 @@
+import os
+from lib.cache import invalidate_results_cache
+from lib.metrics import observe_upload
+from lib.timing import current_timings
+from lib.leaderboard import compute_snapshot_diff, rank_scope_records, BUCKET_TOTALS
+from lib.rubric import get_rubric, rubric_digest, DEFAULT_RUBRIC
+from lib.database import (save_analysis_results, get_user_aggregates, find_ingested_row_keys,
+                          get_latest_analysis_id, get_snapshot_rankings, get_daily_buckets, get_scope_rankings)
+
+# Upload modes: replace rebuilds the leaderboard, append merges only new rows
+UPLOAD_MODES = ('replace', 'append')
+
+# Processes an upload's users are sharded across once it reaches PARALLEL_MIN_ROWS rows (1 scores serially)
+SCORING_SHARD_WORKERS = int(os.environ.get("SCORING_SHARD_WORKERS", str(os.cpu_count() or 1)))
+
+class RubricMismatchError(ValueError):
+    """Stored aggregates were scored under a different rubric than the active one"""
+
+def check_aggregate_rubric(records):
+    """Raise RubricMismatchError unless every stored aggregate record was scored by the active rubric
+    
+    Records saved before digests were stored were scored by DEFAULT_RUBRIC.
+    """
+    active = get_rubric().digest
+    default = rubric_digest(DEFAULT_RUBRIC)
+    stale = sum(1 for record in records.values() if record.get("rubric", default) != active)
+    if stale:
+        raise RubricMismatchError(f"{stale} stored learner aggregates were scored with a different rubric; "
+                                  "upload in replace mode to re-score them")
+
+def load_stored_aggregates(mode):
+    """Load the per-user aggregates an append upload merges into (None for replace)"""
+    if mode != 'append':
+        return None
+    
+    from lib.gamification import user_aggregate_from_record
+    records = get_user_aggregates()
+    check_aggregate_rubric(records)
+    return {email: user_aggregate_from_record(record) for email, record in records.items()}
+
+def score_upload(csv_stream, mode, stored_aggregates=None, progress=None):
+    """Score an uploaded CSV, skipping already-ingested rows in append mode"""
+    # pandas is loaded with the scorer, so endpoints that only save or clear results never import it
+    from lib.gamification import process_csv_upload
+    
+    return process_csv_upload(csv_stream, stored_aggregates,
+                              find_ingested_row_keys if mode == 'append' else None, progress=progress,
+                              workers=SCORING_SHARD_WORKERS)
+
+def score_upload_file(path, mode, stored_aggregates=None):
+    """Score an upload spooled to disk (picklable entry point for worker processes)"""
+    with open(path, 'rb') as csv_stream:
+        return score_upload(csv_stream, mode, stored_aggregates)
+
+def attach_snapshot_diff(analysis_results):
+    """Diff the new ranking against the latest published snapshot, if there is one"""
+    previous_id = get_latest_analysis_id()
+    if previous_id is not None:
+        analysis_results["snapshotDiff"] = compute_snapshot_diff(
+            previous_id, get_snapshot_rankings(previous_id), analysis_results["rankingData"])
+    return analysis_results
+
+def merge_stored_daily_buckets(bucket_records, mode):
+    """Add an append upload's daily buckets onto the stored buckets for the same user and day"""
+    if mode != 'append' or not bucket_records:
+        return bucket_records
+    
+    days = [record["day"] for record in bucket_records]
+    stored = {(record["email"], record["day"]): record for record in get_daily_buckets(min(days), max(days))}
+    return [add_bucket_totals(record, stored.get((record["email"], record["day"]))) for record in bucket_records]
+
+def add_bucket_totals(record, previous):
+    """Add a stored bucket's totals onto a new bucket record for the same key"""
+    if previous is None:
+        return record
+    return {**record, **{field: record[field] + previous[field] for field in BUCKET_TOTALS}}
+
+def rank_stored_scope_buckets(scope_records, mode):
+    """Merge an upload's course and assistant buckets with the stored ones and re-rank each touched scope"""
+    by_scope = {}
+    for record in scope_records:
+        by_scope.setdefault((record["scope"], record["scopeValue"]), []).append(record)
+    
+    ranked = []
+    for (scope, scope_value), records in by_scope.items():
+        if mode == 'append':
+            # Learners the upload did not touch keep their totals but may change rank
+            merged = {stored["email"]: stored for stored in get_scope_rankings(scope, scope_value)}
+            for record in records:
+                merged[record["email"]] = add_bucket_totals(record, merged.get(record["email"]))
+            records = list(merged.values())
+        ranked.extend(rank_scope_records(records))
+    return ranked
+
+def save_upload(analysis_results, mode):
+    """Save aggregate state and the new results snapshot, then drop cached results"""
+    attach_snapshot_diff(analysis_results)
+    # Aggregates, row keys and daily and scope buckets are written and published with the snapshot, so a
+    # failed save leaves the stored state as it was; unless appending they replace all stored ones
+    analysis_results["dailyBuckets"] = merge_stored_daily_buckets(analysis_results["changedDailyBuckets"], mode)
+    analysis_results["scopeRankings"] = rank_stored_scope_buckets(analysis_results["changedScopeBuckets"], mode)
+    analysis_results["replaceState"] = mode != 'append'
+    saved_result = save_analysis_results(analysis_results)
+    invalidate_results_cache()
+    
+    # The request or job timings started when the upload arrived, so they cover the whole upload
+    timings = current_timings()
+    observe_upload(mode, analysis_results["rawDataCount"], analysis_results["newRowCount"],
+                   timings.elapsed() if timings is not None else 0.0)
+    return saved_result
+
+def upload_response(analysis_results, mode):
+    """Build the JSON payload returned for a processed upload"""
+    return {
+        "success": True,
+        "message": "Data processed and saved successfully",
+        "mode": mode,
+        "newRows": analysis_results["newRowCount"],
+        "summary": analysis_results["summaryStats"]
+    }
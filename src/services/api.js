@@ -54,6 +54,13 @@ class ApiService {
   }
 
   logout() {
+    if (this.token) {
+      // End the server-side session too; the local token is dropped either way
+      fetch(`${API_BASE_URL}/auth/logout`, {
+        method: 'POST',
+        headers: this.getHeaders(),
+      }).catch((error) => console.error('Logout error:', error));
+    }
     this.token = null;
     localStorage.removeItem('adminToken');
   }
@@ -78,12 +85,124 @@ class ApiService {
     }
   }
 
+  // Fetch one sorted/filtered page of the leaderboard from the server
+  async getResultsPage({ offset = 0, limit = 50, sort = 'rank', order = 'desc', achievement } = {}) {
+    try {
+      const params = new URLSearchParams({ offset, limit, sort, order });
+      if (achievement) {
+        params.set('achievement', achievement);
+      }
+
+      const response = await fetch(`${API_BASE_URL}/data/results?${params}`, {
+        method: 'GET',
+        headers: this.getHeaders(),
+      });
+
+      const data = await this.handleResponse(response);
+      return data.success ? data.data : null;
+    } catch (error) {
+      console.error('Get results page error:', error);
+      throw error;
+    }
+  }
+
+  // Fetch who climbed, joined or dropped off since the previous upload
+  async getMovers({ limit = 50 } = {}) {
+    try {
+      const params = new URLSearchParams({ view: 'movers', limit });
+
+      const response = await fetch(`${API_BASE_URL}/data/results?${params}`, {
+        method: 'GET',
+        headers: this.getHeaders(),
+      });
+
+      if (response.status === 404) {
+        return null;
+      }
+
+      const data = await this.handleResponse(response);
+      return data.success ? data.data : null;
+    } catch (error) {
+      console.error('Get movers error:', error);
+      throw error;
+    }
+  }
+
+  // Fetch the leaderboard for a time window: { window: 'week' | 'month' } or { from, to }
+  async getWindowLeaderboard({ window, from, to, offset = 0, limit = 50 } = {}) {
+    try {
+      const params = new URLSearchParams({ view: 'window', offset, limit });
+      if (window) params.set('window', window);
+      if (from) params.set('from', from);
+      if (to) params.set('to', to);
+
+      const response = await fetch(`${API_BASE_URL}/data/results?${params}`, {
+        method: 'GET',
+        headers: this.getHeaders(),
+      });
+
+      const data = await this.handleResponse(response);
+      return data.success ? data.data : null;
+    } catch (error) {
+      console.error('Get window leaderboard error:', error);
+      throw error;
+    }
+  }
+
+  // Fetch the leaderboard of one course or AI assistant: { course } or { assistant }
+  async getScopedLeaderboard({ course, assistant, offset = 0, limit = 50 } = {}) {
+    try {
+      const params = new URLSearchParams({ offset, limit });
+      if (course) params.set('course', course);
+      if (assistant) params.set('assistant', assistant);
+
+      const response = await fetch(`${API_BASE_URL}/data/results?${params}`, {
+        method: 'GET',
+        headers: this.getHeaders(),
+      });
+
+      if (response.status === 404) {
+        return null;
+      }
+
+      const data = await this.handleResponse(response);
+      return data.success ? data.data : null;
+    } catch (error) {
+      console.error('Get scoped leaderboard error:', error);
+      throw error;
+    }
+  }
+
+  // Look up one learner by email, or search learners by name/email prefix
+  async findLearner({ email, q, limit } = {}) {
+    try {
+      const params = new URLSearchParams();
+      if (email) params.set('email', email);
+      if (q) params.set('q', q);
+      if (limit) params.set('limit', limit);
+
+      const response = await fetch(`${API_BASE_URL}/data/learner?${params}`, {
+        method: 'GET',
+        headers: this.getHeaders(),
+      });
+
+      const data = await this.handleResponse(response);
+      return data.success ? data.data : null;
+    } catch (error) {
+      console.error('Find learner error:', error);
+      throw error;
+    }
+  }
+
   async uploadData(csvData) {
     try {
       const response = await fetch(`${API_BASE_URL}/data/upload`, {
         method: 'POST',
-        headers: this.getHeaders(true), // Include auth
-        body: JSON.stringify({ csvData }),
+        headers: {
+          ...this.getHeaders(true), // Include auth
+          'Content-Type': 'text/csv', // Send the raw file so it is streamed server-side
+        },
+        body: csvData,
       });
 
       return await this.handleResponse(response);
@@ -93,6 +212,41 @@ class ApiService {
     }
   }
 
+  async uploadDataAsync(csvData, mode = 'replace') {
+    try {
+      const params = new URLSearchParams({ mode, async: '1' });
+      const response = await fetch(`${API_BASE_URL}/data/upload?${params}`, {
+        method: 'POST',
+        headers: {
+          ...this.getHeaders(true), // Include auth
+          'Content-Type': 'text/csv',
+        },
+        body: csvData,
+      });
+
+      return await this.handleResponse(response);
+    } catch (error) {
+      console.error('Upload data async error:', error);
+      throw error;
+    }
+  }
+
+  async getUploadJob(jobId) {
+    try {
+      const params = new URLSearchParams({ id: jobId });
+      const response = await fetch(`${API_BASE_URL}/data/jobs?${params}`, {
+        method: 'GET',
+        headers: this.getHeaders(true), // Include auth
+      });
+
+      const data = await this.handleResponse(response);
+      return data.success ? data.data : null;
+    } catch (error) {
+      console.error('Get upload job error:', error);
+      throw error;
+    }
+  }
+
   async clearData() {
     try {
       const response = await fetch(`${API_BASE_URL}/data/clear`, {
@@ -107,9 +261,9 @@ class ApiService {
     }
   }
 
-  async healthCheck() {
+  async healthCheck(deep = false) {
     try {
-      const response = await fetch(`${API_BASE_URL}/health`, {
+      const response = await fetch(`${API_BASE_URL}/health${deep ? '?deep=1' : ''}`, {
         method: 'GET',
         headers: this.getHeaders(),
       });
@@ -7,7 +7,60 @@ CREATE TABLE IF NOT EXISTS analysis_results (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     summary_stats JSONB NOT NULL,
     ranking_data JSONB NOT NULL,
-    raw_data_count INTEGER DEFAULT 0
+    raw_data_count INTEGER DEFAULT 0,
+    -- Pre-rendered /api/data/results body with base64 gzip/brotli variants
+    response_body TEXT,
+    response_gzip TEXT,
+    response_br TEXT,
+    content_hash TEXT,
+    -- Precomputed sort orders and achievement membership for paginated reads
+    leaderboard_index JSONB
+);
+
+-- Columns added after the initial schema; safe to re-run on existing projects
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS response_body TEXT;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS response_gzip TEXT;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS response_br TEXT;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS leaderboard_index JSONB;
+
+-- Leaderboard snapshots, one per upload. Rows are inserted as pending and flipped to
+-- published once all of their rankings are written; readers only see published rows.
+-- Supersedes analysis_results, which is kept only so existing data can be migrated below.
+CREATE TABLE IF NOT EXISTS snapshots (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'published')),
+    summary_stats JSONB NOT NULL,
+    raw_data_count INTEGER DEFAULT 0,
+    user_count INTEGER DEFAULT 0,
+    -- Pre-rendered /api/data/results body with base64 gzip/brotli variants
+    response_body TEXT,
+    response_gzip TEXT,
+    response_br TEXT,
+    content_hash TEXT,
+    -- Precomputed sort orders and achievement membership for paginated reads
+    leaderboard_index JSONB,
+    -- Rank movement against the previous snapshot (movers, new entrants, drop-outs)
+    snapshot_diff JSONB
+);
+
+ALTER TABLE snapshots ADD COLUMN IF NOT EXISTS snapshot_diff JSONB;
+
+-- One row per learner per snapshot
+CREATE TABLE IF NOT EXISTS snapshot_rankings (
+    snapshot_id BIGINT NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    name TEXT,
+    total_points INTEGER NOT NULL,
+    total_interactions INTEGER,
+    total_credits BIGINT,
+    follow_ups INTEGER,
+    unique_courses INTEGER,
+    success_rate DOUBLE PRECISION,
+    achievements JSONB NOT NULL DEFAULT '[]',
+    PRIMARY KEY (snapshot_id, rank)
 );
 
 -- Table to store admin sessions
@@ -18,30 +71,303 @@ CREATE TABLE IF NOT EXISTS admin_sessions (
     expires_at TIMESTAMP WITH TIME ZONE NOT NULL
 );
 
+-- Table to store running per-user aggregates for append uploads
+CREATE TABLE IF NOT EXISTS user_aggregates (
+    email TEXT PRIMARY KEY,
+    aggregate JSONB NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Table to store keys of ingested interaction rows for de-duplication
+CREATE TABLE IF NOT EXISTS ingested_rows (
+    row_key TEXT PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Aggregates and row keys of an upload still being saved, staged with its pending
+-- snapshot; publish_snapshot moves them into user_aggregates and ingested_rows
+CREATE TABLE IF NOT EXISTS pending_user_aggregates (
+    snapshot_id BIGINT NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    email TEXT NOT NULL,
+    aggregate JSONB NOT NULL,
+    PRIMARY KEY (snapshot_id, email)
+);
+
+CREATE TABLE IF NOT EXISTS pending_ingested_rows (
+    snapshot_id BIGINT NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    row_key TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, row_key)
+);
+
+-- Table to store per-user, per-day totals that windowed leaderboards sum. Each upload
+-- writes its buckets with its pending snapshot; publish_snapshot drops the rows they
+-- supersede as it publishes, so readers only see buckets up to the published snapshot.
+CREATE TABLE IF NOT EXISTS user_daily_buckets (
+    snapshot_id BIGINT NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    email TEXT NOT NULL,
+    day DATE NOT NULL,
+    total_interactions INTEGER NOT NULL,
+    total_credits INTEGER NOT NULL,
+    question_points INTEGER NOT NULL,
+    follow_ups INTEGER NOT NULL,
+    duration_sum_ms BIGINT NOT NULL,
+    ttft_sum_ms BIGINT NOT NULL,
+    success_count INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, email, day)
+);
+
+-- Table to store per-user totals within each course and AI assistant, ranked per scope.
+-- Like daily buckets, rows are written with the upload's pending snapshot and published by it.
+CREATE TABLE IF NOT EXISTS scope_rankings (
+    snapshot_id BIGINT NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    scope TEXT NOT NULL CHECK (scope IN ('course', 'assistant')),
+    scope_value TEXT NOT NULL,
+    email TEXT NOT NULL,
+    name TEXT NOT NULL,
+    total_interactions INTEGER NOT NULL,
+    total_credits INTEGER NOT NULL,
+    question_points INTEGER NOT NULL,
+    follow_ups INTEGER NOT NULL,
+    duration_sum_ms BIGINT NOT NULL,
+    ttft_sum_ms BIGINT NOT NULL,
+    success_count INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, scope, scope_value, email)
+);
+
+-- Table to queue and track background upload jobs
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id TEXT PRIMARY KEY,
+    mode TEXT NOT NULL,
+    stage TEXT NOT NULL CHECK (stage IN ('queued', 'scoring', 'saving', 'published', 'failed')),
+    -- Spooled CSV on the server that accepted the upload; the worker must share its filesystem
+    payload_path TEXT,
+    bytes_total BIGINT NOT NULL DEFAULT 0,
+    bytes_processed BIGINT NOT NULL DEFAULT 0,
+    rows_processed BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    started_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    -- Written periodically by the worker running the job; a stale heartbeat means it was abandoned
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    error TEXT,
+    result JSONB,
+    -- Queued by a synchronous upload request, which claims and runs the job itself
+    synchronous BOOLEAN NOT NULL DEFAULT FALSE
+);
+
 -- Index for faster queries
 CREATE INDEX IF NOT EXISTS idx_analysis_results_created_at ON analysis_results(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_snapshots_published ON snapshots(id DESC) WHERE status = 'published';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_snapshot_rankings_email ON snapshot_rankings(snapshot_id, email);
+CREATE INDEX IF NOT EXISTS idx_user_daily_buckets_day ON user_daily_buckets(day);
+CREATE INDEX IF NOT EXISTS idx_scope_rankings_rank ON scope_rankings(scope, scope_value, rank);
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_queue ON upload_jobs(stage, created_at);
 CREATE INDEX IF NOT EXISTS idx_admin_sessions_token ON admin_sessions(token);
 CREATE INDEX IF NOT EXISTS idx_admin_sessions_expires_at ON admin_sessions(expires_at);
 
 -- Enable Row Level Security (RLS)
 ALTER TABLE analysis_results ENABLE ROW LEVEL SECURITY;
+ALTER TABLE snapshots ENABLE ROW LEVEL SECURITY;
+ALTER TABLE snapshot_rankings ENABLE ROW LEVEL SECURITY;
 ALTER TABLE admin_sessions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE user_aggregates ENABLE ROW LEVEL SECURITY;
+ALTER TABLE ingested_rows ENABLE ROW LEVEL SECURITY;
+ALTER TABLE pending_user_aggregates ENABLE ROW LEVEL SECURITY;
+ALTER TABLE pending_ingested_rows ENABLE ROW LEVEL SECURITY;
+ALTER TABLE user_daily_buckets ENABLE ROW LEVEL SECURITY;
+ALTER TABLE scope_rankings ENABLE ROW LEVEL SECURITY;
+ALTER TABLE upload_jobs ENABLE ROW LEVEL SECURITY;
 
 -- Policy to allow public read access to analysis_results
+DROP POLICY IF EXISTS "Allow public read access to analysis_results" ON analysis_results;
 CREATE POLICY "Allow public read access to analysis_results" 
 ON analysis_results FOR SELECT 
 USING (true);
 
 -- Policy to allow all operations on analysis_results (for API)
+DROP POLICY IF EXISTS "Allow all operations on analysis_results" ON analysis_results;
 CREATE POLICY "Allow all operations on analysis_results" 
 ON analysis_results FOR ALL 
 USING (true);
 
+-- Policy to allow public read access to published snapshots
+DROP POLICY IF EXISTS "Allow public read access to snapshots" ON snapshots;
+CREATE POLICY "Allow public read access to snapshots" 
+ON snapshots FOR SELECT 
+USING (status = 'published');
+
+-- Policy to allow all operations on snapshots (for API)
+DROP POLICY IF EXISTS "Allow all operations on snapshots" ON snapshots;
+CREATE POLICY "Allow all operations on snapshots" 
+ON snapshots FOR ALL 
+USING (true);
+
+-- Policy to allow all operations on snapshot_rankings (for API)
+DROP POLICY IF EXISTS "Allow all operations on snapshot_rankings" ON snapshot_rankings;
+CREATE POLICY "Allow all operations on snapshot_rankings" 
+ON snapshot_rankings FOR ALL 
+USING (true);
+
 -- Policy to allow all operations on admin_sessions (for API)
+DROP POLICY IF EXISTS "Allow all operations on admin_sessions" ON admin_sessions;
 CREATE POLICY "Allow all operations on admin_sessions" 
 ON admin_sessions FOR ALL 
 USING (true);
 
+-- Policy to allow all operations on user_aggregates (for API)
+DROP POLICY IF EXISTS "Allow all operations on user_aggregates" ON user_aggregates;
+CREATE POLICY "Allow all operations on user_aggregates" 
+ON user_aggregates FOR ALL 
+USING (true);
+
+-- Policy to allow all operations on ingested_rows (for API)
+DROP POLICY IF EXISTS "Allow all operations on ingested_rows" ON ingested_rows;
+CREATE POLICY "Allow all operations on ingested_rows" 
+ON ingested_rows FOR ALL 
+USING (true);
+
+-- Policy to allow all operations on pending_user_aggregates (for API)
+DROP POLICY IF EXISTS "Allow all operations on pending_user_aggregates" ON pending_user_aggregates;
+CREATE POLICY "Allow all operations on pending_user_aggregates" 
+ON pending_user_aggregates FOR ALL 
+USING (true);
+
+-- Policy to allow all operations on pending_ingested_rows (for API)
+DROP POLICY IF EXISTS "Allow all operations on pending_ingested_rows" ON pending_ingested_rows;
+CREATE POLICY "Allow all operations on pending_ingested_rows" 
+ON pending_ingested_rows FOR ALL 
+USING (true);
+
+-- Policy to allow all operations on user_daily_buckets (for API)
+DROP POLICY IF EXISTS "Allow all operations on user_daily_buckets" ON user_daily_buckets;
+CREATE POLICY "Allow all operations on user_daily_buckets" 
+ON user_daily_buckets FOR ALL 
+USING (true);
+
+-- Policy to allow all operations on scope_rankings (for API)
+DROP POLICY IF EXISTS "Allow all operations on scope_rankings" ON scope_rankings;
+CREATE POLICY "Allow all operations on scope_rankings" 
+ON scope_rankings FOR ALL 
+USING (true);
+
+-- Policy to allow all operations on upload_jobs (for API)
+DROP POLICY IF EXISTS "Allow all operations on upload_jobs" ON upload_jobs;
+CREATE POLICY "Allow all operations on upload_jobs" 
+ON upload_jobs FOR ALL 
+USING (true);
+
+-- One-time migration of existing analysis_results rows into snapshots; a no-op once
+-- any snapshot exists. Rows saved by the original code hold ranking_data and
+-- summary_stats as JSON-encoded strings (JSONB string scalars), so those are unwrapped.
+INSERT INTO snapshots (id, created_at, status, summary_stats, raw_data_count, user_count,
+                       response_body, response_gzip, response_br, content_hash, leaderboard_index)
+SELECT id, created_at, 'published',
+       CASE WHEN jsonb_typeof(summary_stats) = 'string' THEN (summary_stats #>> '{}')::JSONB ELSE summary_stats END,
+       raw_data_count,
+       jsonb_array_length(CASE WHEN jsonb_typeof(ranking_data) = 'string' THEN (ranking_data #>> '{}')::JSONB
+                               ELSE ranking_data END),
+       response_body, response_gzip, response_br, content_hash, leaderboard_index
+FROM analysis_results
+WHERE NOT EXISTS (SELECT 1 FROM snapshots);
+
+INSERT INTO snapshot_rankings (snapshot_id, rank, email, name, total_points, total_interactions,
+                               total_credits, follow_ups, unique_courses, success_rate, achievements)
+SELECT a.id, (entry->>'rank')::INTEGER, entry->>'email', entry->>'name', (entry->>'totalPoints')::INTEGER,
+       (entry->>'totalInteractions')::INTEGER, (entry->>'totalCredits')::BIGINT, (entry->>'followUps')::INTEGER,
+       (entry->>'uniqueCourses')::INTEGER, (entry->>'successRate')::DOUBLE PRECISION,
+       COALESCE(entry->'achievements', '[]'::JSONB)
+FROM analysis_results a,
+     jsonb_array_elements(CASE WHEN jsonb_typeof(a.ranking_data) = 'string' THEN (a.ranking_data #>> '{}')::JSONB
+                               ELSE a.ranking_data END) AS entry
+WHERE EXISTS (SELECT 1 FROM snapshots s WHERE s.id = a.id)
+  AND NOT EXISTS (SELECT 1 FROM snapshot_rankings r WHERE r.snapshot_id = a.id)
+ON CONFLICT DO NOTHING;
+
+SELECT setval(pg_get_serial_sequence('snapshots', 'id'), GREATEST((SELECT MAX(id) FROM snapshots), 1));
+
+-- Publish a pending snapshot in one transaction: drop the stored daily buckets and
+-- scope rankings its own rows supersede (every older one when p_replace), move its
+-- staged aggregates and row keys into user_aggregates and ingested_rows (replacing
+-- every stored one when p_replace) and flip it to published. An append re-ranks each
+-- scope it touches in full, so it supersedes every older row of those scopes.
+-- Every upload, synchronous or not, is saved under a claimed upload job and only one
+-- job is claimed at a time, so older pending snapshots belong to jobs that stopped
+-- mid-save. They are dropped too, before their buckets fall under the published id.
+CREATE OR REPLACE FUNCTION publish_snapshot(p_snapshot_id BIGINT, p_replace BOOLEAN)
+RETURNS void AS $$
+BEGIN
+    DELETE FROM snapshots WHERE status = 'pending' AND id < p_snapshot_id;
+
+    IF p_replace THEN
+        DELETE FROM user_daily_buckets WHERE snapshot_id < p_snapshot_id;
+        DELETE FROM scope_rankings WHERE snapshot_id < p_snapshot_id;
+        DELETE FROM user_aggregates;
+        DELETE FROM ingested_rows;
+    ELSE
+        DELETE FROM user_daily_buckets old USING user_daily_buckets new
+        WHERE new.snapshot_id = p_snapshot_id AND old.snapshot_id < p_snapshot_id
+          AND old.email = new.email AND old.day = new.day;
+        DELETE FROM scope_rankings old
+        WHERE old.snapshot_id < p_snapshot_id
+          AND EXISTS (SELECT 1 FROM scope_rankings new
+                      WHERE new.snapshot_id = p_snapshot_id
+                        AND new.scope = old.scope AND new.scope_value = old.scope_value);
+    END IF;
+
+    INSERT INTO user_aggregates (email, aggregate, updated_at)
+    SELECT email, aggregate, NOW() FROM pending_user_aggregates WHERE snapshot_id = p_snapshot_id
+    ON CONFLICT (email) DO UPDATE SET aggregate = EXCLUDED.aggregate, updated_at = EXCLUDED.updated_at;
+    INSERT INTO ingested_rows (row_key, created_at)
+    SELECT row_key, NOW() FROM pending_ingested_rows WHERE snapshot_id = p_snapshot_id
+    ON CONFLICT (row_key) DO NOTHING;
+    DELETE FROM pending_user_aggregates WHERE snapshot_id = p_snapshot_id;
+    DELETE FROM pending_ingested_rows WHERE snapshot_id = p_snapshot_id;
+
+    UPDATE snapshots SET status = 'published' WHERE id = p_snapshot_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Snapshot % no longer exists', p_snapshot_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Claim the oldest queued upload job for one worker. Jobs are scored one at a time,
+-- since each merges onto the aggregates the previous one saved, so nothing is claimed
+-- while another job is scoring or saving. A synchronous upload's job is only claimed by
+-- its own request, passing p_job_id, once it is the oldest queued job. Jobs whose
+-- heartbeat is older than p_stale_before were abandoned: scoring ones are queued again,
+-- saving ones may have saved part of their state and are failed, and a synchronous
+-- upload's job fails with its request. The advisory lock serializes claims.
+CREATE OR REPLACE FUNCTION claim_upload_job(p_stale_before TIMESTAMPTZ, p_now TIMESTAMPTZ, p_job_id TEXT DEFAULT NULL)
+RETURNS SETOF upload_jobs AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('claim_upload_job'));
+
+    UPDATE upload_jobs
+    SET stage = 'failed', error = 'Upload request stopped before finishing; upload the file again',
+        updated_at = p_now, finished_at = p_now
+    WHERE synchronous AND stage IN ('queued', 'scoring', 'saving')
+      AND COALESCE(heartbeat_at, updated_at) < p_stale_before;
+    UPDATE upload_jobs SET stage = 'queued', started_at = NULL, heartbeat_at = NULL, updated_at = p_now
+    WHERE stage = 'scoring' AND COALESCE(heartbeat_at, updated_at) < p_stale_before;
+    UPDATE upload_jobs
+    SET stage = 'failed', error = 'Worker stopped while saving; upload the file again',
+        updated_at = p_now, finished_at = p_now
+    WHERE stage = 'saving' AND COALESCE(heartbeat_at, updated_at) < p_stale_before;
+
+    IF EXISTS (SELECT 1 FROM upload_jobs WHERE stage IN ('scoring', 'saving')) THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    UPDATE upload_jobs SET stage = 'scoring', started_at = p_now, updated_at = p_now, heartbeat_at = p_now
+    WHERE id = (SELECT id FROM upload_jobs WHERE stage = 'queued' ORDER BY created_at LIMIT 1)
+      AND synchronous = (p_job_id IS NOT NULL) AND id = COALESCE(p_job_id, id)
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Clean up expired sessions function
 CREATE OR REPLACE FUNCTION cleanup_expired_sessions()
 RETURNS void AS $$
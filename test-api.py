@@ -99,19 +99,2477 @@ test@example.com,Test,User,Sample question,Sample answer,5,Test Course,test-101,
         print(f"❌ Gamification logic test failed: {e}")
         return False
 
+def _legacy_analyze_question_quality(input_text, output_text):
+    """Reference copy of the original per-row question rubric"""
+    if not input_text or not output_text:
+        return {"points": 0, "criteria": []}
+    points = 1
+    criteria = []
+    goal_keywords = ['exam', 'test', 'certification', 'comptia', 'class', 'course',
+                     'assignment', 'homework', 'study', 'cert prep', 'calendar', 'upcoming']
+    if any(keyword in input_text.lower() for keyword in goal_keywords):
+        points += 2
+        criteria.append("Goal-aligned question (+2 pts)")
+    topic_keywords = ['subnetting', 'networking', 'security', 'hardware', 'troubleshooting',
+                      'attendance', 'health check', 'assistant', 'coach', 'tutor']
+    if any(keyword in input_text.lower() for keyword in topic_keywords):
+        points += 1
+        criteria.append("Specific topic/keyword (+1 pt)")
+    if len(output_text.split()) > 50:
+        points += 1
+        criteria.append("Detailed response received (+1 pt)")
+    return {"points": points, "criteria": criteria}
+
+def _legacy_calculate_user_scores(interactions):
+    """Reference copy of the original per-user rescanning scorer"""
+    analyze_question_quality = _legacy_analyze_question_quality
+    
+    def legacy_follow_ups(user_email):
+        user_interactions = [i for i in interactions if i.get('email') == user_email]
+        user_interactions.sort(key=lambda x: x.get('created', ''))
+        course_groups = {}
+        for interaction in user_interactions:
+            course_groups.setdefault(interaction.get('course_id', 'unknown'), []).append(interaction)
+        return sum(len(group) - 1 for group in course_groups.values() if len(group) > 1)
+    
+    user_scores = {}
+    unique_users = list(set([i.get('email') for i in interactions if i.get('email')]))
+    unique_users = [email for email in unique_users if 'perscholas.org' not in email.lower()]
+    for email in unique_users:
+        user_data = [i for i in interactions if i.get('email') == email]
+        total_points = 0
+        all_criteria = []
+        for row in user_data:
+            result = analyze_question_quality(row.get('input', ''), row.get('outputs', ''))
+            total_points += result['points']
+            all_criteria.extend(result['criteria'])
+        follow_ups = legacy_follow_ups(email)
+        total_points += follow_ups * 2
+        if follow_ups > 0:
+            all_criteria.append(f"Follow-up questions: {follow_ups} (+{follow_ups * 2} pts)")
+        unique_assistants = len(set([i.get('instance_ainame') for i in user_data if i.get('instance_ainame')]))
+        unique_courses = len(set([i.get('course_name') for i in user_data if i.get('course_name')]))
+        if unique_courses >= 3:
+            total_points += 5
+            all_criteria.append("Pathway Pro achievement (+5 pts)")
+        durations = [int(i.get('query_duration_ms', 0)) for i in user_data]
+        ttfts = [int(i.get('ttft', 0)) for i in user_data]
+        success_count = sum([1 for i in user_data if str(i.get('success', '')).upper() == 'TRUE'])
+        user_scores[email] = {
+            "name": f"{user_data[0].get('first', '')} {user_data[0].get('last', '')}".strip() or 'Unknown User',
+            "totalPoints": total_points,
+            "totalInteractions": len(user_data),
+            "totalCredits": sum([int(i.get('credits', 0)) for i in user_data]),
+            "followUps": follow_ups,
+            "uniqueCourses": unique_courses,
+            "uniqueAssistants": unique_assistants,
+            "avgDurationMs": sum(durations) / len(durations),
+            "avgTtftMs": sum(ttfts) / len(ttfts),
+            "successRate": (success_count / len(user_data)) * 100,
+            "pathwayPro": unique_courses >= 3,
+            "criteriaMet": all_criteria
+        }
+    return user_scores
+
+def test_question_quality_batch():
+    """Test the batch rubric against the original per-row rubric"""
+    print("\nTesting batch question quality...")
+    
+    try:
+        from lib.gamification import analyze_question_quality, analyze_question_quality_batch, question_criteria
+        
+        cases = [
+            ("How do I prepare for AWS certification exam?", "Here's a guide " * 30),
+            ("Explain SUBNETTING to me", "Short answer"),
+            ("What's the Cert Prep calendar?", "word\u00a0" * 60),
+            ("hello", "one\ttwo\nthree " * 20),
+            ("", "an answer"),
+            ("a question", ""),
+            (None, "an answer"),
+            ("Is my tutor the health check assistant?", " ".join(["w"] * 51)),
+            ("contest", " ".join(["w"] * 50)),
+        ]
+        scores = analyze_question_quality_batch([c[0] for c in cases], [c[1] for c in cases])
+        for index, (input_text, output_text) in enumerate(cases):
+            expected = _legacy_analyze_question_quality(input_text, output_text)
+            batch = {
+                "points": int(scores["points"][index]),
+                "criteria": question_criteria(scores["goalAligned"][index], scores["specificTopic"][index],
+                                              scores["detailedResponse"][index])
+            }
+            if batch != expected or analyze_question_quality(input_text, output_text) != expected:
+                print(f"❌ Rubric mismatch for case {index}: {batch} != {expected}")
+                return False
+        
+        print(f"✅ Batch rubric matches per-row rubric on {len(cases)} cases")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Batch question quality test failed: {e}")
+        return False
+
+def _sample_cohort_csv(users=40, rows=600, seed=7):
+    """Build a small deterministic LMS-shaped CSV for scoring tests"""
+    import random
+    rng = random.Random(seed)
+    questions = [
+        "How should I study for the CompTIA exam?",
+        "Explain subnetting for my networking class",
+        "What is on the calendar for upcoming assignments?",
+        "Help me troubleshoot this hardware issue",
+        "hello",
+        "Can my tutor review my homework?",
+    ]
+    courses = [("IT-101", "IT Support"), ("NET-201", "Networking"), ("SEC-301", "Security"), ("CLD-401", "Cloud")]
+    lines = ["email,first,last,input,outputs,credits,course_name,course_id,instance_ainame,success,query_duration_ms,ttft,created"]
+    for n in range(rows):
+        user = rng.randrange(users)
+        domain = "perscholas.org" if user % 13 == 0 else "example.com"
+        course_id, course_name = rng.choice(courses)
+        words = rng.choice([5, 30, 51, 120])
+        lines.append(",".join([
+            f"learner{user}@{domain}", f"First{user}", f"Last{user}",
+            f'"{rng.choice(questions)}"', " ".join(["word"] * words),
+            str(rng.randint(1, 9)), course_name, course_id,
+            rng.choice(["Azari", "Coach", "Tutor"]), rng.choice(["TRUE", "FALSE"]),
+            str(rng.randint(500, 5000)), str(rng.randint(50, 900)),
+            f"2024-01-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00Z",
+        ]))
+    return "\n".join(lines)
+
+def _comparable_ranking(ranking_data):
+    """Order ranking entries canonically, ignoring tie order between equal scores"""
+    entries = [{k: v for k, v in user.items() if k != "rank"} for user in ranking_data]
+    return sorted(entries, key=lambda user: (-user["totalPoints"], user["email"]))
+
+def test_scoring_parity():
+    """Test the grouped scoring engine against the original per-user scan"""
+    print("\nTesting scoring parity...")
+    
+    try:
+        import io
+        import pandas as pd
+        from lib.gamification import calculate_user_scores, process_csv_data, identify_achievements
+        
+        csv_content = _sample_cohort_csv()
+        interactions = pd.read_csv(io.StringIO(csv_content)).to_dict('records')
+        
+        expected = _legacy_calculate_user_scores(interactions)
+        actual = calculate_user_scores(interactions)
+        if set(expected) != set(actual):
+            print("❌ User sets differ")
+            return False
+        for email, scores in expected.items():
+            got = dict(actual[email])
+            want = dict(scores)
+            if sorted(got.pop("criteriaMet")) != sorted(want.pop("criteriaMet")) or got != want:
+                print(f"❌ Scores differ for {email}")
+                return False
+        if identify_achievements(expected) != identify_achievements(actual):
+            print("❌ Achievements differ")
+            return False
+        
+        results = process_csv_data(csv_content)
+        ranking = results["rankingData"]
+        if [user["rank"] for user in ranking] != list(range(1, len(ranking) + 1)):
+            print("❌ Ranks are not sequential")
+            return False
+        if [user["totalPoints"] for user in ranking] != sorted([s["totalPoints"] for s in expected.values()], reverse=True):
+            print("❌ Ranking order differs")
+            return False
+        
+        # Rebuild the expected ranking with the legacy scores and compare
+        achievements = identify_achievements(expected)
+        legacy_ranking = [{
+            "email": email,
+            "name": scores["name"],
+            "totalPoints": scores["totalPoints"],
+            "totalInteractions": scores["totalInteractions"],
+            "totalCredits": scores["totalCredits"],
+            "followUps": scores["followUps"],
+            "uniqueCourses": scores["uniqueCourses"],
+            "successRate": scores["successRate"],
+            "achievements": achievements.get(email, [])
+        } for email, scores in expected.items()]
+        if _comparable_ranking(ranking) != _comparable_ranking(legacy_ranking):
+            print("❌ rankingData differs")
+            return False
+        
+        summary = results["summaryStats"]
+        legacy_counts = {}
+        for user in legacy_ranking:
+            for achievement in user["achievements"]:
+                legacy_counts[achievement] = legacy_counts.get(achievement, 0) + 1
+        expected_summary = {
+            "totalUsers": len(legacy_ranking),
+            "totalInteractions": sum(user["totalInteractions"] for user in legacy_ranking),
+            "averagePoints": round(sum(user["totalPoints"] for user in legacy_ranking) / len(legacy_ranking), 1),
+            "achievementCounts": legacy_counts
+        }
+        if {k: v for k, v in summary.items() if k != "topPerformer"} != expected_summary:
+            print("❌ summaryStats differ")
+            return False
+        if summary["topPerformer"]["totalPoints"] != ranking[0]["totalPoints"]:
+            print("❌ Top performer differs")
+            return False
+        
+        print(f"✅ Scoring parity holds for {len(expected)} users")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Scoring parity test failed: {e}")
+        return False
+
+def test_streaming_ingestion():
+    """Test chunked CSV ingestion against whole-file processing"""
+    print("\nTesting streaming ingestion...")
+    
+    try:
+        import io
+        from lib.gamification import process_csv_data, process_csv_stream
+        from lib.streams import open_request_body
+        
+        csv_content = _sample_cohort_csv()
+        expected = process_csv_data(csv_content)
+        body = csv_content.encode('utf-8')
+        
+        # Small chunks force users to span several chunks
+        streamed = process_csv_stream(open_request_body(io.BytesIO(body + b"trailing bytes"), len(body)), chunksize=37)
+        
+        if streamed["rankingData"] != expected["rankingData"]:
+            print("❌ Streamed rankingData differs")
+            return False
+        if streamed["summaryStats"] != expected["summaryStats"]:
+            print("❌ Streamed summaryStats differ")
+            return False
+        if streamed["rawDataCount"] != len(expected["rawData"]):
+            print("❌ Streamed row count differs")
+            return False
+        
+        print(f"✅ Streaming matches whole-file processing over {streamed['rawDataCount']} rows")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Streaming ingestion test failed: {e}")
+        return False
+
+def test_append_uploads():
+    """Test append uploads merge only new rows into stored aggregates"""
+    print("\nTesting append uploads...")
+    
+    try:
+        import io
+        import json
+        import pandas as pd
+        from lib.gamification import process_csv_upload, user_aggregate_from_record, ROW_KEY_COLUMNS
+        
+        frame = pd.read_csv(io.StringIO(_sample_cohort_csv()), dtype=str).drop_duplicates(subset=ROW_KEY_COLUMNS)
+        first_export = frame.iloc[:400].to_csv(index=False)
+        # The second weekly export re-sends rows that were already uploaded
+        second_export = frame.iloc[250:].to_csv(index=False)
+        expected = process_csv_upload(io.StringIO(frame.to_csv(index=False)))
+        
+        # Stand-in for the stored aggregate and row key tables
+        stored_records = {}
+        stored_keys = set()
+        
+        first = process_csv_upload(io.StringIO(first_export))
+        stored_records.update(json.loads(json.dumps(first["changedAggregates"])))
+        stored_keys.update(first["newRowKeys"])
+        
+        stored = {email: user_aggregate_from_record(record) for email, record in stored_records.items()}
+        second = process_csv_upload(io.StringIO(second_export), stored,
+                                    lambda keys: stored_keys.intersection(keys), chunksize=64)
+        
+        if second["newRowCount"] != len(frame) - 400:
+            print(f"❌ Expected {len(frame) - 400} new rows, got {second['newRowCount']}")
+            return False
+        if second["rankingData"] != expected["rankingData"] or second["summaryStats"] != expected["summaryStats"]:
+            print("❌ Appended leaderboard differs from a full recompute")
+            return False
+        
+        # A replace upload also scores rows repeated within it once
+        doubled = pd.concat([frame, frame.iloc[:100]]).to_csv(index=False)
+        replaced = process_csv_upload(io.StringIO(doubled), chunksize=64)
+        if replaced["newRowCount"] != len(frame) or replaced["rankingData"] != expected["rankingData"] \
+                or replaced["summaryStats"] != expected["summaryStats"]:
+            print("❌ Rows repeated within a replace upload were scored twice")
+            return False
+        
+        # Re-sending the same export changes nothing
+        stored_keys.update(second["newRowKeys"])
+        stored_records.update(json.loads(json.dumps(second["changedAggregates"])))
+        stored = {email: user_aggregate_from_record(record) for email, record in stored_records.items()}
+        repeat = process_csv_upload(io.StringIO(second_export), stored, lambda keys: stored_keys.intersection(keys))
+        if repeat["newRowCount"] != 0 or repeat["rankingData"] != expected["rankingData"]:
+            print("❌ Re-sent rows were counted again")
+            return False
+        
+        print(f"✅ Append uploads match a full recompute over {len(frame)} rows")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Append uploads test failed: {e}")
+        return False
+
+def test_parallel_scoring():
+    """Test sharded multi-process scoring against serial scoring"""
+    print("\nTesting parallel scoring...")
+    
+    try:
+        import io
+        import json
+        import lib.gamification as gamification
+        
+        def canonical(records):
+            return sorted(json.dumps(record, sort_keys=True) for record in records)
+        
+        csv_content = _sample_cohort_csv()
+        serial = gamification.process_csv_data(csv_content)
+        
+        serial_upload = gamification.process_csv_upload(io.StringIO(csv_content), chunksize=100)
+        
+        # Uploads shard each chunk once the threshold is reached, carrying users' conversations across chunks
+        threshold = gamification.PARALLEL_MIN_ROWS
+        gamification.PARALLEL_MIN_ROWS = 0
+        try:
+            parallel = gamification.process_csv_data(csv_content, workers=3)
+            parallel_upload = gamification.process_csv_upload(io.StringIO(csv_content), chunksize=100, workers=3)
+        finally:
+            gamification.PARALLEL_MIN_ROWS = threshold
+        
+        if parallel["rankingData"] != serial["rankingData"] or parallel["summaryStats"] != serial["summaryStats"]:
+            print("❌ Parallel results differ from serial results")
+            return False
+        
+        if (parallel_upload["rankingData"] != serial_upload["rankingData"]
+                or parallel_upload["changedAggregates"] != serial_upload["changedAggregates"]
+                or list(parallel_upload["changedAggregates"]) != list(serial_upload["changedAggregates"])):
+            print("❌ Sharded upload scores differ from serial upload scores")
+            return False
+        if (canonical(parallel_upload["changedDailyBuckets"]) != canonical(serial_upload["changedDailyBuckets"])
+                or canonical(parallel_upload["changedScopeBuckets"]) != canonical(serial_upload["changedScopeBuckets"])):
+            print("❌ Sharded upload buckets differ from serial upload buckets")
+            return False
+        
+        print("✅ Parallel scoring matches serial scoring, including sharded uploads")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Parallel scoring test failed: {e}")
+        return False
+
+def test_columnar_records():
+    """Test rawData stays columnar and builds row dicts on demand"""
+    print("\nTesting columnar interaction records...")
+    
+    try:
+        from lib.gamification import process_csv_data, InteractionRecords
+        
+        csv_content = _sample_cohort_csv().replace("email,", "lms_session_id,email,", 1)
+        csv_content = "\n".join([csv_content.split("\n")[0]] +
+                                [f"s{n}," + line for n, line in enumerate(csv_content.split("\n")[1:])])
+        results = process_csv_data(csv_content)
+        raw_data = results["rawData"]
+        
+        if not isinstance(raw_data, InteractionRecords) or len(raw_data) != results["rawDataCount"]:
+            print("❌ rawData is not a columnar record set")
+            return False
+        if "lms_session_id" in raw_data.frame.columns:
+            print("❌ Unused export columns were parsed")
+            return False
+        first = next(iter(raw_data))
+        if first != raw_data[0] or first["email"] != raw_data.frame["email"].iloc[0]:
+            print("❌ On-demand row dicts are inconsistent")
+            return False
+        
+        print(f"✅ rawData holds {len(raw_data)} rows in {len(raw_data.frame.columns)} columns")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Columnar records test failed: {e}")
+        return False
+
+def test_results_cache():
+    """Test the warm-instance results cache and ETag matching"""
+    print("\nTesting results cache...")
+    
+    try:
+        import lib.cache as cache
+        from lib.artifacts import build_results_artifact
+        
+        calls = {"results": 0, "id": 0}
+        state = {"id": 1}
+        
+        def fake_results():
+            calls["results"] += 1
+            body = f'{{"success":true,"data":{{"version":{state["id"]}}}}}'.encode()
+            return {"id": state["id"], **build_results_artifact(body)}
+        
+        def fake_latest_id():
+            calls["id"] += 1
+            return state["id"]
+        
+        originals = (cache.get_latest_results_artifact, cache.get_latest_analysis_id, cache.RESULTS_CACHE_TTL)
+        cache.get_latest_results_artifact, cache.get_latest_analysis_id = fake_results, fake_latest_id
+        try:
+            cache.invalidate_results_cache()
+            cache.RESULTS_CACHE_TTL = 60
+            first = cache.get_cached_results()
+            second = cache.get_cached_results()
+            if calls != {"results": 1, "id": 0} or second is not first:
+                print(f"❌ Fresh entries should not touch the database: {calls}")
+                return False
+            
+            # Once stale, an unchanged id only costs an id lookup
+            cache.RESULTS_CACHE_TTL = 0
+            if cache.get_cached_results() is not first or calls != {"results": 1, "id": 1}:
+                print(f"❌ Unchanged id should revalidate the entry: {calls}")
+                return False
+            
+            state["id"] = 2
+            refreshed = cache.get_cached_results()
+            if refreshed["id"] != 2 or refreshed["etag"] == first["etag"]:
+                print("❌ New id should refresh the entry and its ETag")
+                return False
+            
+            cache.RESULTS_CACHE_TTL = 60
+            cache.invalidate_results_cache()
+            cache.get_cached_results()
+            if calls["results"] != 3:
+                print("❌ Invalidation should force a fetch")
+                return False
+        finally:
+            cache.get_latest_results_artifact, cache.get_latest_analysis_id, cache.RESULTS_CACHE_TTL = originals
+            cache.invalidate_results_cache()
+        
+        etag = refreshed["etag"]
+        if not (cache.etag_matches(etag, etag) and cache.etag_matches(f'"x", W/{etag}', etag)
+                and cache.etag_matches("*", etag) and not cache.etag_matches('"other"', etag)):
+            print("❌ ETag matching is wrong")
+            return False
+        
+        # Every content-coding of the response revalidates it
+        if not (cache.etag_matches(etag[:-1] + '-br"', etag) and cache.etag_matches(f'W/{etag[:-1]}-gz"', etag)) \
+                or cache.etag_matches(etag[:-1] + '-zz"', etag):
+            print("❌ Encoded ETag variants are not matched")
+            return False
+        
+        print("✅ Results cache serves, revalidates and invalidates correctly")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Results cache test failed: {e}")
+        return False
+
+def test_results_artifact():
+    """Test pre-rendered results artifacts and content negotiation"""
+    print("\nTesting results artifacts...")
+    
+    try:
+        import gzip
+        import json
+        from lib.gamification import process_csv_data
+        from lib.artifacts import (render_results_body, build_results_artifact, artifact_to_record,
+                                   artifact_from_record, choose_encoding, brotli)
+        
+        results = process_csv_data(_sample_cohort_csv())
+        body = render_results_body(results["summaryStats"], results["rankingData"], "2024-01-15T10:30:00", 600)
+        payload = json.loads(body)
+        if not payload["success"] or payload["data"]["rankingData"] != results["rankingData"]:
+            print("❌ Rendered body does not match the results")
+            return False
+        
+        artifact = artifact_from_record(json.loads(json.dumps(artifact_to_record(build_results_artifact(body)))))
+        if artifact["body"] != body or gzip.decompress(artifact["gzip"]) != body:
+            print("❌ Stored artifact does not round-trip")
+            return False
+        if brotli is not None and brotli.decompress(artifact["br"]) != body:
+            print("❌ Brotli variant does not round-trip")
+            return False
+        
+        best = "br" if brotli is not None else "gzip"
+        cases = [
+            ("gzip, deflate, br", best),
+            ("gzip", "gzip"),
+            ("br;q=0, gzip;q=0.5", "gzip"),
+            ("identity", None),
+            (None, None),
+            ("*", best),
+        ]
+        for header, expected in cases:
+            if choose_encoding(header, artifact) != expected:
+                print(f"❌ Wrong encoding for Accept-Encoding {header!r}")
+                return False
+        
+        print(f"✅ Artifact is {len(body)} bytes, {len(artifact['gzip'])} gzipped")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Results artifact test failed: {e}")
+        return False
+
+def test_leaderboard_pages():
+    """Test precomputed sort orders against sorting the full ranking"""
+    print("\nTesting leaderboard pages...")
+    
+    try:
+        import json
+        from lib.gamification import process_csv_data
+        from lib.leaderboard import (build_leaderboard_index, prepare_leaderboard, paginate_leaderboard,
+                                     parse_page_params, SORT_KEYS)
+        
+        ranking = process_csv_data(_sample_cohort_csv(users=120, rows=1500))["rankingData"]
+        index = json.loads(json.dumps(build_leaderboard_index(ranking)))
+        leaderboard = prepare_leaderboard({"id": 1, "createdAt": "now", "rankingData": ranking, "index": index})
+        achievements = [None] + sorted({a for user in ranking for a in user["achievements"]}) + ["🦄 Nobody"]
+        
+        checked = 0
+        for sort in SORT_KEYS:
+            key = "rank" if sort == "rank" else sort
+            for achievement in achievements:
+                matching = [u for u in ranking if achievement is None or achievement in u["achievements"]]
+                expected_desc = sorted(matching, key=lambda u: (u["rank"] if key == "rank" else -u[key], u["rank"]))
+                for order, expected in (("desc", expected_desc), ("asc", expected_desc[::-1])):
+                    for offset, limit in ((0, 10), (7, 25), (len(ranking) - 3, 10), (len(ranking) + 5, 10)):
+                        page, total = paginate_leaderboard(leaderboard, offset, limit, sort, order, achievement)
+                        if total != len(matching) or page != expected[offset:offset + limit]:
+                            print(f"❌ Wrong page for sort={sort} order={order} achievement={achievement} offset={offset}")
+                            return False
+                        checked += 1
+        
+        for bad in ({"limit": ["0"]}, {"offset": ["-1"]}, {"sort": ["email"]}, {"order": ["up"]}, {"limit": ["ten"]}):
+            try:
+                parse_page_params(bad)
+                print(f"❌ Accepted invalid parameters {bad}")
+                return False
+            except ValueError:
+                pass
+        
+        print(f"✅ {checked} leaderboard pages match a full sort")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Leaderboard pages test failed: {e}")
+        return False
+
+def test_learner_lookup():
+    """Test indexed learner lookup and prefix search against scanning the ranking"""
+    print("\nTesting learner lookup...")
+    
+    try:
+        import json
+        from lib.gamification import process_csv_data
+        from lib.leaderboard import build_leaderboard_index, prepare_leaderboard, find_learner, search_learners
+        
+        results = process_csv_data(_sample_cohort_csv(users=120, rows=1500))
+        ranking = results["rankingData"]
+        index = json.loads(json.dumps(build_leaderboard_index(ranking, results["scoreBreakdowns"])))
+        leaderboard = prepare_leaderboard({"id": 1, "createdAt": "now", "rankingData": ranking, "index": index})
+        
+        for user in ranking:
+            learner = find_learner(leaderboard, "  " + user["email"].upper())
+            if learner is None or learner["entry"] is not user:
+                print(f"❌ Lookup failed for {user['email']}")
+                return False
+            breakdown = learner["breakdown"]
+            if breakdown["questionPoints"] + breakdown["followUpPoints"] + breakdown["pathwayProPoints"] != user["totalPoints"]:
+                print(f"❌ Breakdown does not add up for {user['email']}")
+                return False
+        if find_learner(leaderboard, "nobody@example.com") is not None:
+            print("❌ Unknown email was found")
+            return False
+        
+        for query in ("first1", "LAST11", "learner10@", "first7 last", "zzz", "l"):
+            prefix = query.lower()
+            expected = [u for u in ranking
+                        if any(key.startswith(prefix) for key in
+                               (u["email"].lower(), u["email"].lower().split("@")[0], u["name"].lower(), *u["name"].lower().split()))]
+            for limit in (1, 7, 50):
+                if search_learners(leaderboard, query, limit=limit) != expected[:limit]:
+                    print(f"❌ Search mismatch for {query!r} with limit {limit}")
+                    return False
+        
+        print(f"✅ Indexed lookups match a scan over {len(ranking)} learners")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Learner lookup test failed: {e}")
+        return False
+
+def test_supabase_client_reuse():
+    """Test the shared Supabase client and transient error retries"""
+    print("\nTesting Supabase client reuse...")
+    
+    try:
+        import httpx
+        import lib.database as database
+        
+        saved_env = {name: os.environ.get(name) for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY")}
+        os.environ["SUPABASE_URL"] = "https://example.supabase.co"
+        os.environ["SUPABASE_ANON_KEY"] = "test-anon-key"
+        database.reset_supabase_client()
+        before = database.get_client_stats()
+        try:
+            first = database.get_supabase_client()
+            second = database.get_supabase_client()
+        finally:
+            database.reset_supabase_client()
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        after = database.get_client_stats()
+        if first is not second or after["clientsCreated"] - before["clientsCreated"] != 1 \
+                or after["clientsReused"] - before["clientsReused"] != 1:
+            print(f"❌ Client was not reused: {after}")
+            return False
+        
+        class FlakyQuery:
+            def __init__(self, errors):
+                self.errors = list(errors)
+                self.calls = 0
+            def execute(self):
+                self.calls += 1
+                if self.errors:
+                    raise self.errors.pop(0)
+                return "ok"
+        
+        backoff = database.SUPABASE_RETRY_BACKOFF
+        database.SUPABASE_RETRY_BACKOFF = 0
+        try:
+            read = FlakyQuery([httpx.ReadTimeout("slow"), httpx.ConnectError("down")])
+            if database._execute(read) != "ok" or read.calls != 3:
+                print("❌ Idempotent query was not retried")
+                return False
+            
+            write = FlakyQuery([httpx.ReadTimeout("slow")])
+            try:
+                database._execute(write, idempotent=False)
+                print("❌ Write was retried after it may have reached the server")
+                return False
+            except httpx.ReadTimeout:
+                pass
+            
+            unreachable = FlakyQuery([httpx.ConnectError("down")] * 5)
+            try:
+                database._execute(unreachable)
+                print("❌ Retries did not stop")
+                return False
+            except httpx.ConnectError:
+                if unreachable.calls != database.SUPABASE_MAX_RETRIES + 1:
+                    print("❌ Wrong number of attempts")
+                    return False
+        finally:
+            database.SUPABASE_RETRY_BACKOFF = backoff
+        
+        print("✅ Client is reused and transient errors are retried")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Supabase client test failed: {e}")
+        return False
+
+def test_token_cache():
+    """Test that verified admin tokens skip the session lookup until they expire"""
+    print("\nTesting admin token cache...")
+    
+    try:
+        import time
+        import jwt
+        import lib.auth as auth
+        
+        saved_secret = os.environ.get("JWT_SECRET")
+        saved_validate = auth.validate_admin_session
+        saved_ttl, saved_size = auth.TOKEN_CACHE_TTL, auth.TOKEN_CACHE_SIZE
+        os.environ["JWT_SECRET"] = "test-secret"
+        lookups = []
+        auth.validate_admin_session = lambda token: lookups.append(token) or True
+        auth.clear_token_cache()
+        
+        def make_token(user, exp):
+            return jwt.encode({"admin": True, "user": user, "exp": exp}, "test-secret", algorithm="HS256")
+        
+        try:
+            token = make_token("a", int(time.time()) + 3600)
+            before = auth.get_token_cache_stats()
+            for _ in range(5):
+                if not auth.verify_admin_token(f"Bearer {token}"):
+                    print("❌ Valid token rejected")
+                    return False
+            stats = auth.get_token_cache_stats()
+            if len(lookups) != 1 or stats["hits"] - before["hits"] != 4:
+                print(f"❌ Expected one session lookup, got {len(lookups)}: {stats}")
+                return False
+            
+            # Logout drops the entry so the next request hits the database again
+            auth.invalidate_admin_token(token)
+            auth.verify_admin_token(f"Bearer {token}")
+            if len(lookups) != 2:
+                print("❌ Invalidated token was still served from cache")
+                return False
+            
+            # A revoked session is noticed once the revalidation TTL has passed
+            auth.TOKEN_CACHE_TTL = 0
+            auth.clear_token_cache()
+            auth.validate_admin_session = lambda token: lookups.append(token) and False
+            auth.verify_admin_token(f"Bearer {token}")
+            if auth.verify_admin_token(f"Bearer {token}"):
+                print("❌ Revoked session accepted after TTL")
+                return False
+            
+            # Least recently used tokens are evicted past the size limit
+            auth.TOKEN_CACHE_TTL = 60
+            auth.TOKEN_CACHE_SIZE = 2
+            auth.validate_admin_session = lambda token: True
+            tokens = [make_token(str(i), int(time.time()) + 3600) for i in range(3)]
+            for t in tokens:
+                auth.verify_admin_token(f"Bearer {t}")
+            if auth.get_token_cache_stats()["size"] != 2 or tokens[0] in auth._token_cache:
+                print("❌ Cache grew past its size limit")
+                return False
+        finally:
+            auth.validate_admin_session = saved_validate
+            auth.TOKEN_CACHE_TTL, auth.TOKEN_CACHE_SIZE = saved_ttl, saved_size
+            auth.clear_token_cache()
+            if saved_secret is None:
+                os.environ.pop("JWT_SECRET", None)
+            else:
+                os.environ["JWT_SECRET"] = saved_secret
+        
+        print("✅ Verified tokens are cached, revalidated and evicted")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Token cache test failed: {e}")
+        return False
+
+def _use_sqlite_jobs(directory):
+    """Point lib.jobs at a SQLite database in directory, so inline uploads can claim their job; returns a restore function"""
+    import lib.jobs as jobs
+    import lib.sqlite_database as sqlite_database
+    
+    names = ("save_upload_job", "update_upload_job", "get_upload_job", "claim_upload_job")
+    originals = {name: getattr(jobs, name) for name in names}
+    saved_path = sqlite_database.SQLITE_PATH
+    sqlite_database.SQLITE_PATH = os.path.join(directory, "jobs.db")
+    for name in names:
+        setattr(jobs, name, getattr(sqlite_database, name))
+    
+    def restore():
+        for name, value in originals.items():
+            setattr(jobs, name, value)
+        sqlite_database.close_connection()
+        sqlite_database.SQLITE_PATH = saved_path
+    return restore
+
+def _call_asgi(app, method, path, query="", headers=None, body=b""):
+    """Drive an ASGI app for one request and return (status, headers, body)"""
+    import asyncio
+    
+    return asyncio.run(_asgi_request(app, method, path, query, headers, body))
+
+async def _asgi_request(app, method, path, query="", headers=None, body=b""):
+    """Send one request through an ASGI app on the running event loop and return (status, headers, body)"""
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    }
+    messages = [{"type": "http.request", "body": body[i:i + 4096], "more_body": i + 4096 < len(body)}
+                for i in range(0, max(len(body), 1), 4096)]
+    sent = []
+    
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+    
+    async def send(message):
+        sent.append(message)
+    
+    await app(scope, receive, send)
+    response_headers = {name.decode(): value.decode() for name, value in sent[0]["headers"]}
+    return sent[0]["status"], response_headers, b"".join(m.get("body", b"") for m in sent[1:])
+
+def test_asgi_app():
+    """Test the ASGI app routes, caching headers and off-loop upload scoring"""
+    print("\nTesting ASGI app...")
+    
+    try:
+        import gzip
+        import json
+        import tempfile
+        import lib.asgi as asgi
+        import lib.jobs as jobs
+        import lib.cache as cache
+        from lib.artifacts import build_results_artifact
+        
+        status, headers, body = _call_asgi(asgi.app, "GET", "/api/health")
+        if status != 200 or json.loads(body)["status"] != "healthy" or "Access-Control-Allow-Origin" not in {k.title(): v for k, v in headers.items()}:
+            print(f"❌ Health route failed: {status}")
+            return False
+        if _call_asgi(asgi.app, "OPTIONS", "/api/data/upload")[0] != 200 \
+                or _call_asgi(asgi.app, "GET", "/api/data/upload")[0] != 405 \
+                or _call_asgi(asgi.app, "GET", "/api/unknown")[0] != 404 \
+                or _call_asgi(asgi.app, "POST", "/api/data/upload", body=b"email\n")[0] != 401:
+            print("❌ Routing, method or auth checks failed")
+            return False
+        
+        body = b'{"success":true,"data":{"rankingData":[]}}'
+        originals = (cache.get_latest_results_artifact, cache.RESULTS_CACHE_TTL)
+        cache.get_latest_results_artifact = lambda: {"id": 1, **build_results_artifact(body)}
+        cache.RESULTS_CACHE_TTL = 60
+        cache.invalidate_results_cache()
+        try:
+            status, headers, first = _call_asgi(asgi.app, "GET", "/api/data/results", headers={"Accept-Encoding": "gzip"})
+            if status != 200 or headers.get("content-encoding") != "gzip" or gzip.decompress(first) != body:
+                print(f"❌ Results were not served pre-compressed: {status} {headers}")
+                return False
+            identity = _call_asgi(asgi.app, "GET", "/api/data/results")[1]["etag"]
+            if not headers["etag"].endswith('-gz"') or identity == headers["etag"]:
+                print(f"❌ Each content-coding needs its own ETag: {headers['etag']} {identity}")
+                return False
+            status, revalidated, _ = _call_asgi(asgi.app, "GET", "/api/data/results",
+                                                headers={"If-None-Match": headers["etag"]})
+            if status != 304 or revalidated["etag"] != identity:
+                print(f"❌ A gzip ETag should revalidate the identity response, got {status}")
+                return False
+        finally:
+            cache.get_latest_results_artifact, cache.RESULTS_CACHE_TTL = originals
+            cache.invalidate_results_cache()
+        
+        saved = []
+        saved_verify, saved_save, saved_batch = asgi.verify_admin_token, jobs.save_upload, asgi.SPOOL_WRITE_BYTES
+        asgi.verify_admin_token = lambda header: header == "Bearer ok"
+        jobs.save_upload = lambda results, mode: saved.append((results, mode)) or {"id": 1}
+        # Bodies arrive in 4 KiB messages; small batches make the spool write several times
+        asgi.SPOOL_WRITE_BYTES = 10000
+        directory = tempfile.TemporaryDirectory()
+        restore_jobs = _use_sqlite_jobs(directory.name)
+        try:
+            csv_bytes = _sample_cohort_csv(users=10, rows=120).encode()
+            status, _, body = _call_asgi(asgi.app, "POST", "/api/data/upload",
+                                         headers={"Authorization": "Bearer ok", "Content-Type": "text/csv"}, body=csv_bytes)
+            payload = json.loads(body)
+            if status != 200 or payload["newRows"] != 120 or len(saved) != 1 or saved[0][1] != "replace":
+                print(f"❌ Upload was not scored and saved: {status} {payload}")
+                return False
+            status, _, _ = _call_asgi(asgi.app, "POST", "/api/data/upload", query="mode=merge",
+                                      headers={"Authorization": "Bearer ok", "Content-Type": "text/csv"}, body=csv_bytes)
+            if status != 400:
+                print("❌ Unknown upload mode should be rejected")
+                return False
+        finally:
+            asgi.verify_admin_token, jobs.save_upload, asgi.SPOOL_WRITE_BYTES = saved_verify, saved_save, saved_batch
+            restore_jobs()
+            directory.cleanup()
+            asgi.shutdown_scoring_pool()
+        
+        print("✅ ASGI app serves every route and scores uploads in a worker process")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ASGI app test failed: {e}")
+        return False
+
+def test_load_harness():
+    """Test the local database stand-in and a short load-test run over real HTTP"""
+    print("\nTesting load-test harness...")
+    
+    try:
+        import inspect
+        import subprocess
+        import lib.database as database
+        from benchmarks import local_database
+        
+        # The stand-in must keep up with every public function of lib.database
+        missing = [name for name, value in vars(database).items()
+                   if inspect.isfunction(value) and value.__module__ == database.__name__
+                   and not name.startswith("_") and not hasattr(local_database, name)]
+        if missing:
+            print(f"❌ Stand-in is missing: {missing}")
+            return False
+        
+        harness = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "load_test.py")
+        run = subprocess.run([sys.executable, harness, "--duration", "1.5", "--readers", "4", "--users", "40",
+                              "--rows", "800", "--upload-rows", "200", "--upload-interval", "0.5",
+                              "--latency-ms", "2", "--jitter-ms", "1"],
+                             capture_output=True, text=True, timeout=120)
+        if run.returncode != 0 or "p95 ms" not in run.stdout or "upload" not in run.stdout:
+            print(f"❌ Load test failed:\n{run.stdout[-1500:]}{run.stderr[-1500:]}")
+            return False
+        
+        print("✅ Handlers serve mixed traffic over HTTP against the stand-in")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Load harness test failed: {e}")
+        return False
+
+def test_sqlite_backend():
+    """Test the embedded SQLite storage backend and backend selection"""
+    print("\nTesting SQLite backend...")
+    
+    try:
+        import io
+        import gzip
+        import tempfile
+        import subprocess
+        from datetime import datetime, timedelta
+        import lib.database as database
+        import lib.sqlite_database as sqlite_database
+        from lib.gamification import process_csv_upload
+        
+        missing = [name for name in database.STORAGE_FUNCTIONS if not hasattr(sqlite_database, name)]
+        if missing:
+            print(f"❌ SQLite backend is missing: {missing}")
+            return False
+        
+        saved_path = sqlite_database.SQLITE_PATH
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite_database.SQLITE_PATH = os.path.join(directory, "test.db")
+            try:
+                if sqlite_database.get_latest_analysis_id() is not None or sqlite_database.get_latest_results_artifact() is not None:
+                    print("❌ Empty database should have no results")
+                    return False
+                
+                csv_content = _sample_cohort_csv(users=12, rows=150)
+                results = process_csv_upload(io.StringIO(csv_content), {}, sqlite_database.find_ingested_row_keys)
+                saved = sqlite_database.save_analysis_results(results)
+                
+                if sqlite_database.get_snapshot_rankings(saved["id"]) != results["rankingData"]:
+                    print("❌ Snapshot rankings did not round-trip")
+                    return False
+                
+                latest = sqlite_database.get_latest_analysis_results()
+                artifact = sqlite_database.get_latest_results_artifact()
+                leaderboard = sqlite_database.get_latest_leaderboard()
+                ranking = results["rankingData"]
+                if latest["id"] != saved["id"] or latest["rankingData"] != ranking \
+                        or gzip.decompress(artifact["gzip"]) != artifact["body"] or not leaderboard["index"]["sortOrders"] \
+                        or sqlite_database.get_snapshot_ranking(saved["id"], ranking[3]["email"]) != ranking[3] \
+                        or sqlite_database.get_snapshot_ranking_page(saved["id"], 2, 5) != ranking[1:5] \
+                        or sqlite_database.get_snapshot_rankings_at(saved["id"], [6, 1, 6]) != [ranking[0], ranking[5]]:
+                    print("❌ Saved results did not round-trip")
+                    return False
+                
+                # Re-sending the same export finds every row already ingested
+                repeat = process_csv_upload(io.StringIO(csv_content), None, sqlite_database.find_ingested_row_keys)
+                if repeat["newRowCount"] != 0 or len(sqlite_database.get_user_aggregates()) != len(results["changedAggregates"]):
+                    print("❌ Ingested rows or aggregates were not stored")
+                    return False
+                
+                # A save that fails part-way leaves the stored aggregates and row keys as they were
+                try:
+                    sqlite_database.save_analysis_results({**results, "replaceState": True, "newRowKeys": ["fresh"],
+                                                           "dailyBuckets": [{"email": "broken@example.com"}]})
+                    print("❌ A broken save should raise")
+                    return False
+                except KeyError:
+                    pass
+                if sqlite_database.get_latest_analysis_id() != saved["id"] or sqlite_database.find_ingested_row_keys(["fresh"]) \
+                        or len(sqlite_database.get_user_aggregates()) != len(results["changedAggregates"]):
+                    print("❌ A failed save changed the stored state")
+                    return False
+                
+                sqlite_database.save_admin_session("live", datetime.utcnow() + timedelta(hours=1))
+                sqlite_database.save_admin_session("expired", datetime.utcnow() - timedelta(hours=1))
+                if not sqlite_database.validate_admin_session("live") or sqlite_database.validate_admin_session("expired"):
+                    print("❌ Session validation is wrong")
+                    return False
+                sqlite_database.delete_admin_session("live")
+                sqlite_database.clear_analysis_results()
+                sqlite_database.clear_user_aggregates()
+                if sqlite_database.validate_admin_session("live") or sqlite_database.get_latest_analysis_id() is not None \
+                        or sqlite_database.get_user_aggregates():
+                    print("❌ Delete or clear left rows behind")
+                    return False
+                
+                mode = sqlite_database.get_connection().execute("PRAGMA journal_mode").fetchone()[0]
+                if mode != "wal":
+                    print(f"❌ Expected WAL journal mode, got {mode}")
+                    return False
+            finally:
+                sqlite_database.close_connection()
+                sqlite_database.SQLITE_PATH = saved_path
+        
+        selected = subprocess.run([sys.executable, "-c", "import lib.database as d; print(d.save_analysis_results.__module__)"],
+                                  capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  env={**os.environ, "STORAGE_BACKEND": "sqlite"}).stdout.strip()
+        if selected != "lib.sqlite_database":
+            print(f"❌ STORAGE_BACKEND=sqlite selected {selected!r}")
+            return False
+        
+        print("✅ SQLite backend stores results, state and sessions")
+        return True
+        
+    except Exception as e:
+        print(f"❌ SQLite backend test failed: {e}")
+        return False
+
+def test_snapshot_publishing():
+    """Test that Supabase snapshots are published only after all rankings are written"""
+    print("\nTesting snapshot publishing...")
+    
+    try:
+        import io
+        import lib.database as database
+        from lib.gamification import process_csv_data
+        
+        class Result:
+            def __init__(self, data):
+                self.data = data
+        
+        class Query:
+            def __init__(self, log, table, fail_on):
+                self.log, self.table, self.fail_on, self.op = log, table, fail_on, None
+            def insert(self, data):
+                self.op = ("insert", data)
+                return self
+            def upsert(self, rows):
+                self.op = ("upsert", rows)
+                return self
+            def update(self, data):
+                self.op = ("update", data)
+                return self
+            def delete(self):
+                self.op = ("delete", None)
+                return self
+            def eq(self, column, value):
+                return self
+            def execute(self):
+                self.log.append((self.table, self.op[0], self.op[1]))
+                if (self.table, self.op[0]) == self.fail_on:
+                    raise RuntimeError("write failed")
+                return Result([{"id": 7}] if self.op[0] == "insert" else [])
+        
+        class Client:
+            def __init__(self, fail_on=None):
+                self.log, self.fail_on = [], fail_on
+            def table(self, name):
+                return Query(self.log, name, self.fail_on)
+            def rpc(self, name, params):
+                query = Query(self.log, name, self.fail_on)
+                query.op = ("rpc", params)
+                return query
+        
+        results = process_csv_data(_sample_cohort_csv(users=25, rows=200))
+        buckets = [{"email": f"user{i}@example.com", "day": "2024-01-05", "totalInteractions": 1, "totalCredits": 2,
+                    "questionPoints": 1, "followUps": 0, "durationSumMs": 10, "ttftSumMs": 5, "successCount": 1}
+                   for i in range(15)]
+        scopes = [{**{k: v for k, v in bucket.items() if k != "day"}, "scope": "course", "scopeValue": "Networking",
+                   "name": "Learner", "rank": i + 1} for i, bucket in enumerate(buckets[:5])]
+        aggregates = {f"user{i}@example.com": {"name": "Learner", "totalInteractions": 1} for i in range(12)}
+        row_keys = [f"key{i}" for i in range(25)]
+        results = {**results, "dailyBuckets": buckets, "scopeRankings": scopes, "changedAggregates": aggregates,
+                   "newRowKeys": row_keys, "replaceState": False}
+        saved_client, saved_batch = database._client, database.STATE_WRITE_BATCH_SIZE
+        database.STATE_WRITE_BATCH_SIZE = 10
+        try:
+            database._client = Client()
+            database.save_analysis_results(results)
+            steps = [(table, op) for table, op, _ in database._client.log]
+            batches = -(-len(results["rankingData"]) // 10)
+            expected = ([("snapshots", "insert")] + [("snapshot_rankings", "upsert")] * batches +
+                        [("user_daily_buckets", "upsert")] * 2 + [("scope_rankings", "upsert")] +
+                        [("pending_user_aggregates", "upsert")] * 2 + [("pending_ingested_rows", "upsert")] * 3 +
+                        [("publish_snapshot", "rpc")])
+            log = database._client.log
+            if steps != expected or log[0][2]["status"] != "pending" \
+                    or log[-1][2] != {"p_snapshot_id": 7, "p_replace": False}:
+                print(f"❌ Unexpected write sequence: {steps}")
+                return False
+            written = [row for table, op, rows in log if table == "snapshot_rankings" for row in rows]
+            if [row["email"] for row in written] != [entry["email"] for entry in results["rankingData"]] \
+                    or any(row["snapshot_id"] != 7 for row in written):
+                print("❌ Rankings were not written one row per learner")
+                return False
+            staged = [row for table, op, rows in log if table in ("user_daily_buckets", "scope_rankings") for row in rows]
+            if len(staged) != len(buckets) + len(scopes) or any(row["snapshot_id"] != 7 for row in staged):
+                print("❌ Daily and scope buckets were not staged with the pending snapshot")
+                return False
+            staged = [row for table, op, rows in log if table.startswith("pending_") for row in rows]
+            if {row["email"] for row in staged if "email" in row} != set(aggregates) \
+                    or [row["row_key"] for row in staged if "row_key" in row] != row_keys \
+                    or any(row["snapshot_id"] != 7 for row in staged):
+                print("❌ Aggregates and row keys were not staged with the pending snapshot")
+                return False
+            
+            # A failed ranking batch removes the pending snapshot instead of publishing it
+            database._client = Client(fail_on=("snapshot_rankings", "upsert"))
+            try:
+                database.save_analysis_results(results)
+                print("❌ Failed write should raise")
+                return False
+            except RuntimeError:
+                pass
+            steps = [(table, op) for table, op, _ in database._client.log]
+            if steps[-1] != ("snapshots", "delete") or ("publish_snapshot", "rpc") in steps:
+                print(f"❌ Pending snapshot was not cleaned up: {steps}")
+                return False
+            
+            # A failed publish leaves the stored aggregates and row keys untouched
+            database._client = Client(fail_on=("publish_snapshot", "rpc"))
+            try:
+                database.save_analysis_results(results)
+                print("❌ Failed publish should raise")
+                return False
+            except RuntimeError:
+                pass
+            steps = [(table, op) for table, op, _ in database._client.log]
+            if steps[-1] != ("snapshots", "delete") or any(table in ("user_aggregates", "ingested_rows")
+                                                            for table, _ in steps):
+                print(f"❌ A failed publish should only drop its pending snapshot: {steps}")
+                return False
+        finally:
+            database._client, database.STATE_WRITE_BATCH_SIZE = saved_client, saved_batch
+        
+        print("✅ Snapshots are bulk written, then published")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Snapshot publishing test failed: {e}")
+        return False
+
+def test_snapshot_diff():
+    """Test rank-movement diffs between snapshots and the movers view"""
+    print("\nTesting snapshot diff...")
+    
+    try:
+        import json
+        import sqlite3
+        import tempfile
+        import lib.asgi as asgi
+        import lib.cache as cache
+        import lib.sqlite_database as sqlite_database
+        from lib.leaderboard import compute_snapshot_diff, movers_view, parse_movers_params
+        
+        def entry(email, rank, points, achievements=()):
+            return {"email": email, "name": email.split("@")[0], "totalPoints": points, "totalInteractions": 5,
+                    "totalCredits": 0, "followUps": 1, "uniqueCourses": 1, "successRate": 100.0,
+                    "achievements": list(achievements), "rank": rank}
+        
+        previous = [entry("a@x.com", 1, 50), entry("b@x.com", 2, 40), entry("c@x.com", 3, 30), entry("d@x.com", 4, 10)]
+        current = [entry("c@x.com", 1, 60, ["🔥 On Fire"]), entry("a@x.com", 2, 50), entry("b@x.com", 3, 40),
+                   entry("e@x.com", 4, 5)]
+        diff = compute_snapshot_diff(9, previous, current)
+        
+        movers = [(mover["email"], mover["rankDelta"], mover["pointsDelta"]) for mover in diff["movers"]]
+        if movers != [("c@x.com", 2, 30), ("a@x.com", -1, 0), ("b@x.com", -1, 0)] \
+                or diff["movers"][0]["newAchievements"] != ["🔥 On Fire"]:
+            print(f"❌ Unexpected movers: {movers}")
+            return False
+        if [e["email"] for e in diff["newEntrants"]] != ["e@x.com"] or [e["email"] for e in diff["dropOuts"]] != ["d@x.com"] \
+                or diff["dropOuts"][0]["previousRank"] != 4 or diff["previousSnapshotId"] != 9:
+            print("❌ New entrants or drop-outs are wrong")
+            return False
+        if compute_snapshot_diff(9, current, current)["movers"]:
+            print("❌ Unchanged rankings should have no movers")
+            return False
+        
+        view = movers_view(diff, 1)
+        if len(view["movers"]) != 1 or view["totals"] != {"movers": 3, "newEntrants": 1, "dropOuts": 1}:
+            print(f"❌ Movers view was not trimmed: {view['totals']}")
+            return False
+        for bad in ({"limit": ["0"]}, {"limit": ["x"]}):
+            try:
+                parse_movers_params(bad)
+                print(f"❌ {bad} should be rejected")
+                return False
+            except ValueError:
+                pass
+        
+        saved_path = sqlite_database.SQLITE_PATH
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite_database.SQLITE_PATH = os.path.join(directory, "old.db")
+            # A file created before snapshot_diff existed gains the column on first use
+            legacy = sqlite3.connect(sqlite_database.SQLITE_PATH)
+            legacy.execute("CREATE TABLE snapshots (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL, "
+                           "summary_stats TEXT NOT NULL, raw_data_count INTEGER NOT NULL, user_count INTEGER NOT NULL, "
+                           "response_body BLOB, response_gzip BLOB, response_br BLOB, content_hash TEXT, "
+                           "leaderboard_index TEXT)")
+            legacy.close()
+            try:
+                summary = {"totalUsers": 4}
+                sqlite_database.save_analysis_results({"summaryStats": summary, "rankingData": previous, "rawDataCount": 4})
+                first = sqlite_database.get_latest_snapshot_diff()
+                saved = sqlite_database.save_analysis_results({"summaryStats": summary, "rankingData": current,
+                                                               "rawDataCount": 8, "snapshotDiff": diff})
+                latest = sqlite_database.get_latest_snapshot_diff()
+                if first["diff"] is not None or latest["id"] != saved["id"] or latest["diff"] != diff:
+                    print("❌ Snapshot diff did not round-trip through SQLite")
+                    return False
+            finally:
+                sqlite_database.close_connection()
+                sqlite_database.SQLITE_PATH = saved_path
+        
+        originals = (cache.get_latest_snapshot_diff, cache.RESULTS_CACHE_TTL)
+        cache.RESULTS_CACHE_TTL = 60
+        try:
+            cache.get_latest_snapshot_diff = lambda: {"id": 3, "createdAt": "2024-01-15T10:30:00", "diff": diff}
+            cache.invalidate_results_cache()
+            status, headers, body = _call_asgi(asgi.app, "GET", "/api/data/results", query="view=movers&limit=2")
+            data = json.loads(body)["data"] if status == 200 else {}
+            if status != 200 or len(data["movers"]) != 2 or data["totals"]["movers"] != 3:
+                print(f"❌ Movers route failed: {status}")
+                return False
+            if _call_asgi(asgi.app, "GET", "/api/data/results", query="view=movers&limit=2",
+                          headers={"If-None-Match": headers["etag"]})[0] != 304:
+                print("❌ Matching movers ETag should return 304")
+                return False
+            
+            cache.get_latest_snapshot_diff = lambda: {"id": 1, "createdAt": "2024-01-15T10:30:00", "diff": None}
+            cache.invalidate_results_cache()
+            if _call_asgi(asgi.app, "GET", "/api/data/results", query="view=movers")[0] != 404:
+                print("❌ First snapshot should have no movers view")
+                return False
+        finally:
+            cache.get_latest_snapshot_diff, cache.RESULTS_CACHE_TTL = originals
+            cache.invalidate_results_cache()
+        
+        print("✅ Snapshot diffs are stored and served as a movers view")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Snapshot diff test failed: {e}")
+        return False
+
+def test_window_leaderboards():
+    """Test per-user daily buckets and time-windowed leaderboards built from them"""
+    print("\nTesting window leaderboards...")
+    
+    try:
+        import io
+        import json
+        import tempfile
+        from datetime import date
+        import pandas as pd
+        import lib.asgi as asgi
+        import lib.cache as cache
+        import lib.uploads as uploads
+        import lib.sqlite_database as sqlite_database
+        from lib.gamification import process_csv_upload, user_aggregate_from_record, ROW_KEY_COLUMNS
+        from lib.leaderboard import build_window_leaderboard, parse_window_params, BUCKET_TOTALS
+        
+        def totals_by_email(records):
+            totals = {}
+            for record in records:
+                total = totals.setdefault(record["email"], dict.fromkeys(BUCKET_TOTALS, 0))
+                for field in BUCKET_TOTALS:
+                    total[field] += record[field]
+            return totals
+        
+        frame = pd.read_csv(io.StringIO(_sample_cohort_csv()), dtype=str).drop_duplicates(subset=ROW_KEY_COLUMNS)
+        full = process_csv_upload(io.StringIO(frame.to_csv(index=False)))
+        
+        # Summed over every day, buckets reproduce the all-time score minus the Pathway Pro bonus
+        window = build_window_leaderboard(full["changedDailyBuckets"], {})
+        all_time = {entry["email"]: entry for entry in full["rankingData"]}
+        for entry in window:
+            expected = all_time[entry["email"]]
+            if entry["totalPoints"] != expected["totalPoints"] - (5 if expected["uniqueCourses"] >= 3 else 0) \
+                    or entry["followUps"] != expected["followUps"] \
+                    or entry["totalInteractions"] != expected["totalInteractions"]:
+                print(f"❌ Buckets do not add up for {entry['email']}")
+                return False
+        if len(window) != len(all_time) or [entry["rank"] for entry in window] != list(range(1, len(window) + 1)):
+            print("❌ Window leaderboard is not a complete ranking")
+            return False
+        
+        # Exports are not in date order, so a conversation's question can arrive in a later chunk
+        # than its follow-ups; streaming in chunks still puts each follow-up on its own day and scopes
+        chunked = process_csv_upload(io.StringIO(frame.to_csv(index=False)), chunksize=37)
+        for key in ("changedDailyBuckets", "changedScopeBuckets"):
+            if sorted(json.dumps(record, sort_keys=True) for record in chunked[key]) != \
+                    sorted(json.dumps(record, sort_keys=True) for record in full[key]):
+                print(f"❌ Chunked {key} differ from scoring the export in one chunk")
+                return False
+        
+        one_day = [record for record in full["changedDailyBuckets"] if record["day"] == "2024-01-05"]
+        if sum(entry["totalInteractions"] for entry in build_window_leaderboard(one_day, {})) != \
+                sum(record["totalInteractions"] for record in one_day) or not one_day:
+            print("❌ One-day window lost interactions")
+            return False
+        
+        # Appended rows land on their own days and merge onto stored buckets for the same day
+        saved_path, saved_reader = sqlite_database.SQLITE_PATH, uploads.get_daily_buckets
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite_database.SQLITE_PATH = os.path.join(directory, "test.db")
+            uploads.get_daily_buckets = sqlite_database.get_daily_buckets
+            try:
+                first = process_csv_upload(io.StringIO(frame.iloc[:300].to_csv(index=False)))
+                sqlite_database.save_analysis_results({**first, "replaceState": True, "dailyBuckets":
+                                                       uploads.merge_stored_daily_buckets(first["changedDailyBuckets"], 'replace')})
+                stored = {email: user_aggregate_from_record(json.loads(json.dumps(record)))
+                          for email, record in first["changedAggregates"].items()}
+                second = process_csv_upload(io.StringIO(frame.iloc[300:].to_csv(index=False)), stored)
+                sqlite_database.save_analysis_results({**second, "replaceState": False, "dailyBuckets":
+                                                       uploads.merge_stored_daily_buckets(second["changedDailyBuckets"], 'append')})
+                
+                merged = sqlite_database.get_daily_buckets("2024-01-01", "2024-01-31")
+                if totals_by_email(merged) != totals_by_email(full["changedDailyBuckets"]):
+                    print("❌ Appended buckets differ from a full rebuild")
+                    return False
+                if sqlite_database.get_daily_buckets("2024-02-01", "2024-02-28"):
+                    print("❌ Buckets outside the window were returned")
+                    return False
+                
+                # A replace upload drops every stored bucket as its snapshot is saved
+                sqlite_database.save_analysis_results({**first, "replaceState": True,
+                                                       "dailyBuckets": first["changedDailyBuckets"]})
+                if totals_by_email(sqlite_database.get_daily_buckets("2024-01-01", "2024-01-31")) != \
+                        totals_by_email(first["changedDailyBuckets"]):
+                    print("❌ Replace upload kept buckets from earlier uploads")
+                    return False
+                sqlite_database.clear_analysis_results()
+                if sqlite_database.get_daily_buckets("2024-01-01", "2024-01-31"):
+                    print("❌ Clearing results left daily buckets behind")
+                    return False
+            finally:
+                sqlite_database.close_connection()
+                sqlite_database.SQLITE_PATH, uploads.get_daily_buckets = saved_path, saved_reader
+        
+        # Supabase readers skip buckets staged with a snapshot that is not yet published
+        import lib.database as database
+        from lib.leaderboard import bucket_record_to_row
+        published, staged = full["changedDailyBuckets"][:40], full["changedDailyBuckets"][40:80]
+        reader = _CappedReader({
+            "snapshots": [{"id": 3, "status": "published"}, {"id": 4, "status": "pending"}],
+            "user_daily_buckets": [bucket_record_to_row(3, record) for record in published] +
+                                  [bucket_record_to_row(4, record) for record in staged]
+        })
+        saved_read_client = database.get_read_client
+        database.get_read_client = lambda: reader
+        try:
+            if totals_by_email(database.get_daily_buckets("2024-01-01", "2024-01-31")) != totals_by_email(published):
+                print("❌ Buckets of a pending snapshot were served")
+                return False
+            reader.tables["snapshots"] = []
+            if database.get_daily_buckets("2024-01-01", "2024-01-31"):
+                print("❌ Buckets were served without a published snapshot")
+                return False
+        finally:
+            database.get_read_client = saved_read_client
+        
+        week = parse_window_params({"window": ["week"]}, today=date(2024, 1, 10))
+        if (week["from"], week["to"]) != ("2024-01-04", "2024-01-10"):
+            print(f"❌ Unexpected week range: {week}")
+            return False
+        for bad in ({"window": ["year"]}, {"from": ["2024-13-01"]}, {"from": ["2024-01-10"], "to": ["2024-01-01"]},
+                    {"window": ["week"], "from": ["2024-01-01"]}, {}):
+            try:
+                parse_window_params(bad)
+                print(f"❌ {bad} should be rejected")
+                return False
+            except ValueError:
+                pass
+        
+        originals = (cache.get_latest_analysis_id, cache.get_daily_buckets, cache.get_latest_leaderboard)
+        calls = []
+        cache.get_latest_analysis_id = lambda: 5
+        cache.get_latest_leaderboard = lambda: None
+        def fake_buckets(start_day, end_day):
+            calls.append((start_day, end_day))
+            return [record for record in full["changedDailyBuckets"] if start_day <= record["day"] <= end_day]
+        cache.get_daily_buckets = fake_buckets
+        cache.invalidate_results_cache()
+        try:
+            query = "view=window&from=2024-01-01&to=2024-01-07&limit=5"
+            status, headers, body = _call_asgi(asgi.app, "GET", "/api/data/results", query=query)
+            data = json.loads(body)["data"] if status == 200 else {}
+            if status != 200 or len(data["rankingData"]) != 5 or data["to"] != "2024-01-07":
+                print(f"❌ Window route failed: {status}")
+                return False
+            if _call_asgi(asgi.app, "GET", "/api/data/results", query=query,
+                          headers={"If-None-Match": headers["etag"]})[0] != 304 \
+                    or _call_asgi(asgi.app, "GET", "/api/data/results", query="view=window&window=decade")[0] != 400:
+                print("❌ Window ETag or validation failed")
+                return False
+            if calls != [("2024-01-01", "2024-01-07")]:
+                print(f"❌ Window buckets should be read once while cached, read {len(calls)} times")
+                return False
+        finally:
+            cache.get_latest_analysis_id, cache.get_daily_buckets, cache.get_latest_leaderboard = originals
+            cache.invalidate_results_cache()
+        
+        print("✅ Windowed leaderboards are summed from daily buckets")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Window leaderboard test failed: {e}")
+        return False
+
+def _group_scope_records(rank, scope_records):
+    """Group scope bucket records by (scope, value) and rank each group"""
+    groups = {}
+    for record in scope_records:
+        groups.setdefault((record["scope"], record["scopeValue"]), []).append(record)
+    return {key: rank(records) for key, records in groups.items()}
+
+def test_scope_leaderboards():
+    """Test per-course and per-assistant rankings built in the scoring pass"""
+    print("\nTesting scope leaderboards...")
+    
+    try:
+        import io
+        import json
+        import tempfile
+        import pandas as pd
+        import lib.asgi as asgi
+        import lib.cache as cache
+        import lib.uploads as uploads
+        import lib.sqlite_database as sqlite_database
+        from lib.gamification import process_csv_upload, user_aggregate_from_record, ROW_KEY_COLUMNS
+        from lib.leaderboard import rank_scope_records, scope_record_to_entry, parse_scope_params
+        
+        frame = pd.read_csv(io.StringIO(_sample_cohort_csv()), dtype=str).drop_duplicates(subset=ROW_KEY_COLUMNS)
+        full = process_csv_upload(io.StringIO(frame.to_csv(index=False)))
+        ranked = _group_scope_records(rank_scope_records, full["changedScopeBuckets"])
+        
+        # A course leaderboard matches scoring an export filtered to that course, without re-uploading it
+        course_rows = frame[frame["course_name"] == "Networking"]
+        filtered = process_csv_upload(io.StringIO(course_rows.to_csv(index=False)))
+        course = [scope_record_to_entry(record) for record in ranked[("course", "Networking")]]
+        expected = {entry["email"]: entry for entry in filtered["rankingData"]}
+        if len(course) != len(expected) or any(
+                (entry["totalPoints"], entry["totalInteractions"], entry["followUps"]) !=
+                (expected[entry["email"]]["totalPoints"], expected[entry["email"]]["totalInteractions"],
+                 expected[entry["email"]]["followUps"]) for entry in course):
+            print("❌ Course leaderboard differs from scoring the filtered export")
+            return False
+        if [entry["rank"] for entry in course] != list(range(1, len(course) + 1)) \
+                or any(a["totalPoints"] < b["totalPoints"] for a, b in zip(course, course[1:])):
+            print("❌ Course leaderboard is not ranked by points")
+            return False
+        assistant_interactions = sum(record["totalInteractions"] for key, records in ranked.items()
+                                     if key[0] == "assistant" for record in records)
+        if assistant_interactions != full["summaryStats"]["totalInteractions"]:
+            print("❌ Assistant buckets lost interactions")
+            return False
+        
+        # Scope cells are trimmed like scope filters, so padded names land in the bucket a filter finds
+        padded = frame.assign(course_name=" " + frame["course_name"] + " ")
+        padded_keys = {(record["scope"], record["scopeValue"]) for record in
+                       process_csv_upload(io.StringIO(padded.to_csv(index=False)))["changedScopeBuckets"]}
+        if padded_keys != set(ranked) or ("course", parse_scope_params({"course": [" Networking "]})["course"]) \
+                not in padded_keys:
+            print("❌ Padded scope values are bucketed apart from trimmed filters")
+            return False
+        
+        # Appends re-rank each touched scope over stored and new totals; exports arrive in date order,
+        # so each conversation's opening question lands in the same scope as in a full rebuild
+        frame = frame.sort_values("created", kind="stable")
+        saved_path, saved_reader = sqlite_database.SQLITE_PATH, uploads.get_scope_rankings
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite_database.SQLITE_PATH = os.path.join(directory, "test.db")
+            uploads.get_scope_rankings = sqlite_database.get_scope_rankings
+            try:
+                first = process_csv_upload(io.StringIO(frame.iloc[:300].to_csv(index=False)))
+                sqlite_database.save_analysis_results({**first, "replaceState": True, "scopeRankings":
+                                                       uploads.rank_stored_scope_buckets(first["changedScopeBuckets"], 'replace')})
+                stored = {email: user_aggregate_from_record(json.loads(json.dumps(record)))
+                          for email, record in first["changedAggregates"].items()}
+                second = process_csv_upload(io.StringIO(frame.iloc[300:].to_csv(index=False)), stored)
+                sqlite_database.save_analysis_results({**second, "replaceState": False, "scopeRankings":
+                                                       uploads.rank_stored_scope_buckets(second["changedScopeBuckets"], 'append')})
+                
+                for scope, scope_value in ranked:
+                    stored_entries = [scope_record_to_entry(record)
+                                      for record in sqlite_database.get_scope_rankings(scope, scope_value)]
+                    expected_entries = [scope_record_to_entry(record) for record in ranked[(scope, scope_value)]]
+                    if stored_entries != expected_entries:
+                        print(f"❌ Appended {scope} {scope_value} ranking differs from a full rebuild")
+                        return False
+                sqlite_database.clear_analysis_results()
+                if any(sqlite_database.get_scope_rankings(scope, scope_value) for scope, scope_value in ranked):
+                    print("❌ Clearing results left scope rankings behind")
+                    return False
+            finally:
+                sqlite_database.close_connection()
+                sqlite_database.SQLITE_PATH, uploads.get_scope_rankings = saved_path, saved_reader
+        
+        # Supabase readers skip scope rows staged with a snapshot that is not yet published
+        import lib.database as database
+        from lib.leaderboard import scope_record_to_row
+        tutor = ranked[("assistant", "Tutor")]
+        reader = _CappedReader({
+            "snapshots": [{"id": 3, "status": "published"}, {"id": 4, "status": "pending"}],
+            "scope_rankings": [scope_record_to_row(3, record) for record in tutor] +
+                              [scope_record_to_row(4, {**record, "rank": record["rank"] + 1}) for record in tutor]
+        })
+        saved_read_client = database.get_read_client
+        database.get_read_client = lambda: reader
+        try:
+            if database.get_scope_rankings("assistant", "Tutor") != tutor:
+                print("❌ Scope rows of a pending snapshot were served")
+                return False
+        finally:
+            database.get_read_client = saved_read_client
+        
+        for bad in ({}, {"course": ["IT Support"], "assistant": ["Tutor"]}, {"course": [" "]},
+                    {"course": ["IT Support"], "limit": ["0"]}):
+            try:
+                parse_scope_params(bad)
+                print(f"❌ {bad} should be rejected")
+                return False
+            except ValueError:
+                pass
+        
+        originals = (cache.get_latest_analysis_id, cache.get_scope_rankings)
+        cache.get_latest_analysis_id = lambda: 5
+        cache.get_scope_rankings = lambda scope, scope_value: ranked.get((scope, scope_value), [])
+        cache.invalidate_results_cache()
+        try:
+            status, headers, body = _call_asgi(asgi.app, "GET", "/api/data/results", query="assistant=Tutor&limit=3")
+            data = json.loads(body)["data"] if status == 200 else {}
+            if status != 200 or len(data["rankingData"]) != 3 or data["assistant"] != "Tutor" \
+                    or data["total"] != len(ranked[("assistant", "Tutor")]):
+                print(f"❌ Assistant route failed: {status}")
+                return False
+            if _call_asgi(asgi.app, "GET", "/api/data/results", query="assistant=Tutor&limit=3",
+                          headers={"If-None-Match": headers["etag"]})[0] != 304 \
+                    or _call_asgi(asgi.app, "GET", "/api/data/results", query="course=Basket%20Weaving")[0] != 404:
+                print("❌ Scope ETag or unknown scope handling failed")
+                return False
+        finally:
+            cache.get_latest_analysis_id, cache.get_scope_rankings = originals
+            cache.invalidate_results_cache()
+        
+        print("✅ Course and assistant leaderboards come from the same scan")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Scope leaderboard test failed: {e}")
+        return False
+
+def test_upload_jobs():
+    """Test background upload jobs: queueing, worker claims, progress, failures and the ASGI job mode"""
+    print("\nTesting upload jobs...")
+    
+    try:
+        import io
+        import json
+        import time
+        import asyncio
+        import tempfile
+        from datetime import datetime, timedelta
+        import lib.jobs as jobs
+        import lib.asgi as asgi
+        import lib.sqlite_database as sqlite_database
+        
+        saved_names = ("save_upload_job", "update_upload_job", "get_upload_job", "claim_upload_job",
+                       "save_upload", "UPLOAD_JOB_DIR", "JOB_PROGRESS_INTERVAL")
+        originals = {name: getattr(jobs, name) for name in saved_names}
+        asgi_originals = (asgi.verify_admin_token, asgi.get_upload_job)
+        saved_path = sqlite_database.SQLITE_PATH
+        saved_env = {name: os.environ.get(name) for name in ("STORAGE_BACKEND", "SQLITE_PATH")}
+        published = []
+        progress_writes = []
+        
+        def update_upload_job(job_id, changes):
+            progress_writes.append(changes)
+            return sqlite_database.update_upload_job(job_id, changes)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite_database.SQLITE_PATH = os.path.join(directory, "test.db")
+            for name in ("save_upload_job", "get_upload_job", "claim_upload_job"):
+                setattr(jobs, name, getattr(sqlite_database, name))
+            jobs.update_upload_job = update_upload_job
+            jobs.save_upload = lambda results, mode: published.append((results, mode)) or {"id": 9}
+            jobs.UPLOAD_JOB_DIR = directory
+            jobs.JOB_PROGRESS_INTERVAL = 0
+            try:
+                # A queued job waits for a worker, which claims it once and publishes it
+                csv_bytes = _sample_cohort_csv(users=10, rows=200).encode()
+                job = jobs.spool_upload_job(io.BytesIO(csv_bytes), "replace")
+                if job["stage"] != "queued" or job["bytes_total"] != len(csv_bytes) \
+                        or jobs.job_status(sqlite_database.get_upload_job(job["id"]))["stage"] != "queued":
+                    print("❌ Upload was not queued")
+                    return False
+                jobs.run_worker(once=True)
+                status = jobs.job_status(sqlite_database.get_upload_job(job["id"]))
+                if status["stage"] != "published" or status["rowsProcessed"] != 200 or status["progress"] != 1.0 \
+                        or status["result"]["snapshotId"] != 9 or status["result"]["newRows"] != 200 \
+                        or len(published) != 1 or os.path.exists(job["payload_path"]):
+                    print(f"❌ Worker did not publish the job: {status}")
+                    return False
+                if not any("rows_processed" in changes and changes.get("stage") is None for changes in progress_writes):
+                    print("❌ Scoring did not report progress")
+                    return False
+                if jobs.claim_next_job() is not None:
+                    print("❌ A published job was claimed again")
+                    return False
+                
+                # Only one job scores at a time; a job whose worker stopped heartbeating is reclaimed
+                waiting = [jobs.spool_upload_job(io.BytesIO(csv_bytes), "append") for _ in range(2)]
+                active = jobs.claim_next_job()
+                if active is None or active["id"] != waiting[0]["id"] or active["heartbeat_at"] is None \
+                        or jobs.claim_next_job() is not None:
+                    print("❌ A second job was claimed while one was scoring")
+                    return False
+                stale = (datetime.utcnow() - timedelta(seconds=jobs.JOB_STALE_SECONDS + 60)).isoformat()
+                sqlite_database.update_upload_job(active["id"], {"heartbeat_at": stale})
+                reclaimed = jobs.claim_next_job()
+                if reclaimed is None or reclaimed["id"] != active["id"]:
+                    print("❌ A stale scoring job was not queued again and reclaimed")
+                    return False
+                sqlite_database.update_upload_job(active["id"], {"stage": "saving", "heartbeat_at": stale})
+                claimed = jobs.claim_next_job()
+                abandoned = sqlite_database.get_upload_job(active["id"])
+                if claimed is None or claimed["id"] != waiting[1]["id"] or abandoned["stage"] != "failed" \
+                        or not abandoned["error"]:
+                    print(f"❌ A stale saving job should fail and free the queue: {abandoned['stage']}")
+                    return False
+                
+                saved_interval = jobs.JOB_HEARTBEAT_INTERVAL
+                jobs.JOB_HEARTBEAT_INTERVAL = 0.01
+                try:
+                    progress_writes.clear()
+                    with jobs.job_heartbeat(claimed["id"]):
+                        time.sleep(0.1)
+                finally:
+                    jobs.JOB_HEARTBEAT_INTERVAL = saved_interval
+                beats = len(progress_writes)
+                time.sleep(0.05)
+                if beats < 2 or len(progress_writes) != beats or sqlite_database.get_upload_job(claimed["id"])["heartbeat_at"] <= stale:
+                    print(f"❌ Heartbeats were not written while the job ran, or kept going after it: {beats}")
+                    return False
+                sqlite_database.update_upload_job(claimed["id"], {"stage": "failed"})
+                for job_row in waiting:
+                    os.unlink(job_row["payload_path"])
+                
+                broken = jobs.spool_upload_job(io.StringIO('email,input\n"x@example.com,hi\n'), "replace")
+                jobs.run_worker(once=True)
+                status = jobs.job_status(sqlite_database.get_upload_job(broken["id"]))
+                if status["stage"] != "failed" or not status["error"] or len(published) != 1:
+                    print(f"❌ A broken upload should fail its job: {status}")
+                    return False
+                
+                # Inline uploads queue like any job, are only claimed by their own request and fail with it
+                inline = jobs.create_synchronous_upload_job("append", len(csv_bytes))
+                behind = jobs.spool_upload_job(io.BytesIO(csv_bytes), "replace")
+                if jobs.claim_next_job() is not None or (jobs.claim_next_job(inline["id"]) or {}).get("id") != inline["id"]:
+                    print("❌ An inline upload's job was claimed by a worker, or not by its request")
+                    return False
+                saved_wait = jobs.SYNC_UPLOAD_WAIT_SECONDS
+                jobs.SYNC_UPLOAD_WAIT_SECONDS = 0.05
+                try:
+                    with jobs.synchronous_upload_job("append", len(csv_bytes)):
+                        print("❌ An inline upload ran while another upload was scoring")
+                        return False
+                except jobs.UploadBusyError:
+                    pass
+                finally:
+                    jobs.SYNC_UPLOAD_WAIT_SECONDS = saved_wait
+                jobs.release_synchronous_upload_job(inline["id"])
+                if sqlite_database.get_upload_job(inline["id"])["stage"] != "failed":
+                    print("❌ An inline upload's job that was never published should fail")
+                    return False
+                jobs.run_worker(once=True)
+                abandoned = jobs.create_synchronous_upload_job("append", len(csv_bytes))
+                sqlite_database.update_upload_job(abandoned["id"], {"heartbeat_at": stale})
+                if jobs.claim_next_job() is not None or sqlite_database.get_upload_job(abandoned["id"])["stage"] != "failed" \
+                        or sqlite_database.get_upload_job(behind["id"])["stage"] != "published" or len(published) != 2:
+                    print("❌ A stale inline job should fail, and the jobs queued behind it run")
+                    return False
+                
+                # The ETA extrapolates the scoring rate over the bytes still to read
+                started = (datetime.utcnow() - timedelta(seconds=10)).isoformat()
+                eta = jobs.job_status({**sqlite_database.get_upload_job(job["id"]), "stage": "scoring",
+                                       "started_at": started + "+00:00", "bytes_processed": 250,
+                                       "bytes_total": 1000})["etaSeconds"]
+                if eta is None or not 29 <= eta <= 32:
+                    print(f"❌ Expected an ETA of about 30s, got {eta}")
+                    return False
+                
+                # The ASGI app answers 202 at once and scores the job in its worker process
+                os.environ.update({"STORAGE_BACKEND": "sqlite", "SQLITE_PATH": sqlite_database.SQLITE_PATH})
+                asgi.verify_admin_token = lambda header: header == "Bearer ok"
+                asgi.get_upload_job = sqlite_database.get_upload_job
+                
+                async def upload_and_poll():
+                    status, headers, body = await _asgi_request(
+                        asgi.app, "POST", "/api/data/upload", query="async=1",
+                        headers={"Authorization": "Bearer ok", "Content-Type": "application/json"},
+                        body=json.dumps({"csvData": csv_bytes.decode(), "mode": "replace"}).encode())
+                    await asyncio.gather(*asgi._job_tasks)
+                    polled = await _asgi_request(asgi.app, "GET", "/api/data/jobs",
+                                                 query=f"id={json.loads(body).get('jobId')}",
+                                                 headers={"Authorization": "Bearer ok"})
+                    return status, headers, json.loads(body), polled
+                
+                status, headers, accepted, polled = asyncio.run(upload_and_poll())
+                if status != 202 or headers.get("location") != accepted["statusUrl"] or accepted["stage"] != "queued":
+                    print(f"❌ Job upload was not accepted: {status} {accepted}")
+                    return False
+                data = json.loads(polled[2])["data"]
+                if polled[0] != 200 or data["stage"] != "published" or data["rowsProcessed"] != 200 or len(published) != 3:
+                    print(f"❌ ASGI job did not publish: {polled[0]} {data}")
+                    return False
+                if _call_asgi(asgi.app, "GET", "/api/data/jobs", query="id=missing", headers={"Authorization": "Bearer ok"})[0] != 404 \
+                        or _call_asgi(asgi.app, "GET", "/api/data/jobs", headers={"Authorization": "Bearer ok"})[0] != 400 \
+                        or _call_asgi(asgi.app, "GET", "/api/data/jobs", query="id=x")[0] != 401:
+                    print("❌ Job lookup errors were not reported")
+                    return False
+            finally:
+                for name, value in originals.items():
+                    setattr(jobs, name, value)
+                asgi.verify_admin_token, asgi.get_upload_job = asgi_originals
+                for name, value in saved_env.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+                asgi.shutdown_scoring_pool()
+                sqlite_database.close_connection()
+                sqlite_database.SQLITE_PATH = saved_path
+        
+        print("✅ Upload jobs are queued, scored in the background and published once")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Upload jobs test failed: {e}")
+        return False
+
+def test_request_timing():
+    """Test stage timers, Server-Timing headers and structured request logs"""
+    print("\nTesting request timing...")
+    
+    try:
+        import io
+        import re
+        import json
+        import threading
+        import contextlib
+        import importlib.util
+        import http.client
+        from http.server import ThreadingHTTPServer
+        import lib.asgi as asgi
+        import lib.database as database
+        from lib.timing import collect_timings, current_timings, stage, server_timing_header, run_timed
+        from lib.gamification import process_csv_upload
+        
+        # Outside a timed request the timers record nothing
+        with stage("idle"):
+            pass
+        if current_timings() is not None:
+            print("❌ Timers should be off outside a timed request")
+            return False
+        
+        csv_content = _sample_cohort_csv(users=12, rows=150)
+        with collect_timings() as timings:
+            results = process_csv_upload(io.StringIO(csv_content), chunksize=50)
+            with stage("db.fake"):
+                pass
+            with stage("db.fake"):
+                pass
+        expected = {"parse", "dedupe", "fold", "finalize", "achievements", "rank", "buckets"}
+        if not expected <= set(timings.stages) or timings.stages["parse"][1] != 4 \
+                or timings.fields != {"rows": 150, "newRows": results["newRowCount"]}:
+            print(f"❌ Upload stages were not timed: {timings.stages} {timings.fields}")
+            return False
+        header = server_timing_header(timings)
+        if not re.fullmatch(r'([\w.]+;dur=\d+\.\d(;desc="\d+ calls")?, )+total;dur=\d+\.\d', header) \
+                or 'db.fake;dur=0.0;desc="2 calls"' not in header:
+            print(f"❌ Malformed Server-Timing header: {header}")
+            return False
+        
+        # Worker processes send their timings back with the result
+        (scored, worker_timings) = run_timed(process_csv_upload, io.StringIO(csv_content))
+        if scored["rawDataCount"] != 150 or "fold" not in worker_timings.stages:
+            print("❌ run_timed did not return the worker's timings")
+            return False
+        
+        if not hasattr(database.save_upload_job, "__wrapped__") or database.get_client_stats.__module__ != "lib.database":
+            print("❌ Storage calls are not timed")
+            return False
+        
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status, headers, _ = _call_asgi(asgi.app, "GET", "/api/health")
+        log_line = json.loads(output.getvalue().strip().splitlines()[-1])
+        if status != 200 or "total;dur=" not in headers.get("server-timing", "") \
+                or headers.get("timing-allow-origin") != "*" \
+                or (log_line["event"], log_line["path"], log_line["status"]) != ("request", "/api/health", 200) \
+                or log_line["maxRssMB"] <= 0:
+            print(f"❌ ASGI response was not timed and logged: {headers} {log_line}")
+            return False
+        
+        spec = importlib.util.spec_from_file_location("timing_health", os.path.join(os.path.dirname(os.path.abspath(__file__)), "api", "health.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), module.handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+                connection.request("GET", "/api/health?probe=1")
+                response = connection.getresponse()
+                response.read()
+                connection.close()
+                server.shutdown()
+        finally:
+            server.server_close()
+        log_line = json.loads(output.getvalue().strip().splitlines()[-1])
+        if response.status != 200 or "total;dur=" not in (response.getheader("Server-Timing") or "") \
+                or (log_line["method"], log_line["path"], log_line["status"]) != ("GET", "/api/health", 200):
+            print(f"❌ Vercel handler was not timed and logged: {log_line}")
+            return False
+        
+        print("✅ Requests carry Server-Timing and one JSON log line")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Request timing test failed: {e}")
+        return False
+
+def test_health_metrics():
+    """Test the deep health check, in-process metrics and Prometheus output"""
+    print("\nTesting health metrics...")
+    
+    try:
+        import re
+        import json
+        import lib.asgi as asgi
+        import lib.health as health
+        import lib.metrics as metrics
+        
+        metrics.reset_metrics()
+        for seconds in (0.003, 0.004, 0.02, 0.02, 0.3):
+            metrics.observe_request("GET", "/api/data/results/", 200, seconds)
+        metrics.observe_request("GET", "/api/data/results", 304, 0.001)
+        metrics.observe_request("GET", "/wp-admin", 404, 0.001)
+        report = metrics.request_metrics()
+        results = report.get("/api/data/results", {})
+        if results.get("requests") != 6 or results["byStatus"] != {"200": 5, "304": 1} \
+                or results["latencyMs"]["p50"] != 5.0 or results["latencyMs"]["p95"] != 500.0 \
+                or set(report) != {"/api/data/results", "other"}:
+            print(f"❌ Request metrics are wrong: {report}")
+            return False
+        
+        metrics.observe_upload("append", 5000, 1200, 2.5)
+        shallow = health.health_report()
+        if "database" in shallow or shallow["endpoints"]["jobs"] != "/api/data/jobs":
+            print("❌ Plain health checks should not touch the database")
+            return False
+        
+        original = health.get_latest_analysis_id
+        health.get_latest_analysis_id = lambda: 42
+        try:
+            status, headers, body = _call_asgi(asgi.app, "GET", "/api/health", query="deep=1")
+            report = json.loads(body)
+            if status != 200 or report["status"] != "healthy" or report["database"]["latestSnapshotId"] != 42 \
+                    or report["lastUpload"]["rows"] != 5000 or report["lastUpload"]["durationMs"] != 2500.0 \
+                    or report["process"]["maxRssMB"] <= 0 or "hitRate" not in report["caches"]["results"] \
+                    or headers.get("cache-control") != "no-store":
+                print(f"❌ Deep health report is incomplete: {status} {report}")
+                return False
+            
+            status, headers, body = _call_asgi(asgi.app, "GET", "/api/health", query="format=prometheus")
+            text = body.decode()
+            sample = re.compile(r'[a-z_]+(\{[a-z]+="[^"]*"(,[a-z]+="[^"]*")*\})? -?[0-9.e+-]+')
+            bad = [line for line in text.splitlines() if not line.startswith("# ") and not sample.fullmatch(line)]
+            if status != 200 or not headers["content-type"].startswith("text/plain; version=0.0.4") or bad \
+                    or "leaderboard_up 1" not in text:
+                print(f"❌ Malformed Prometheus output: {bad[:3]}")
+                return False
+            buckets = [int(value) for value in re.findall(
+                r'leaderboard_request_duration_seconds_bucket\{endpoint="/api/data/results",le="[^"]+"\} (\d+)', text)]
+            if buckets != sorted(buckets) or buckets[-1] != 6:
+                print(f"❌ Histogram buckets are not cumulative: {buckets}")
+                return False
+            if 'leaderboard_requests_total{endpoint="/api/health",method="GET",status="200"} 1' not in text:
+                print("❌ The deep health request was not counted")
+                return False
+            
+            def unreachable():
+                raise ConnectionError("database unreachable")
+            health.get_latest_analysis_id = unreachable
+            status, _, body = _call_asgi(asgi.app, "GET", "/api/health", query="deep=1")
+            if status != 503 or json.loads(body)["database"]["error"] != "database unreachable":
+                print(f"❌ A failed database ping should return 503, got {status}")
+                return False
+        finally:
+            health.get_latest_analysis_id = original
+            metrics.reset_metrics()
+        
+        print("✅ Deep health reports database latency, request histograms and caches")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Health metrics test failed: {e}")
+        return False
+
+def test_cold_start_imports():
+    """Test each endpoint's import budget and that read endpoints load no heavy dependencies"""
+    print("\nTesting cold-start imports...")
+    
+    try:
+        from benchmarks.bench_imports import measure_endpoints, check_budgets
+        
+        results = measure_endpoints(repeat=2)
+        failures = check_budgets(results)
+        if failures:
+            for failure in failures:
+                print(f"❌ {failure}")
+            return False
+        
+        slowest = max(results, key=lambda handler: results[handler][0])
+        print(f"✅ Every endpoint is within its import budget (slowest {slowest} at {results[slowest][0]:.0f}ms)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Cold-start import test failed: {e}")
+        return False
+
+def test_postgrest_reader():
+    """Test the SDK-free PostgREST reader's query encoding, gzip handling and errors"""
+    print("\nTesting PostgREST reader...")
+    
+    try:
+        import gzip
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlparse, parse_qsl
+        from lib.postgrest import PostgrestReader, PostgrestError
+        
+        requests = []
+        
+        class FakePostgrest(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                requests.append((parsed.path, parse_qsl(parsed.query), dict(self.headers)))
+                if parsed.path.endswith("/missing"):
+                    body, status = b'{"message":"relation does not exist"}', 404
+                else:
+                    body, status = gzip.compress(json.dumps([{"email": "a@example.com"}]).encode()), 200
+                self.send_response(status)
+                if status == 200:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FakePostgrest)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            reader = PostgrestReader(f"http://127.0.0.1:{server.server_port}", "anon-key", 5)
+            rows = (reader.table("scope_rankings").select("email, points")
+                    .eq("scope", "course").in_("email", ["a@example.com", 'b,"c"'])
+                    .order("rank").order("email", desc=True).range(100, 149).execute().data)
+            reader.table("user_aggregates").select("*").limit(1).execute()
+            try:
+                reader.table("missing").select("*").execute()
+                print("❌ An error status did not raise")
+                return False
+            except PostgrestError as e:
+                if e.status != 404:
+                    print(f"❌ Wrong error status: {e.status}")
+                    return False
+        finally:
+            server.shutdown()
+            server.server_close()
+        
+        if rows != [{"email": "a@example.com"}]:
+            print(f"❌ Gzipped rows were not decoded: {rows}")
+            return False
+        
+        path, params, headers = requests[0]
+        expected = [("select", "email,points"), ("scope", "eq.course"), ("email", 'in.("a@example.com","b,\\"c\\"")'),
+                    ("offset", "100"), ("limit", "50"), ("order", "rank.asc,email.desc")]
+        if path != "/rest/v1/scope_rankings" or params != expected:
+            print(f"❌ Wrong query: {path} {params}")
+            return False
+        if headers.get("apikey") != "anon-key" or headers.get("Authorization") != "Bearer anon-key":
+            print("❌ Credentials were not sent")
+            return False
+        
+        print("✅ PostgREST reader encodes filters, ranges and ordering and decodes gzip")
+        return True
+        
+    except Exception as e:
+        print(f"❌ PostgREST reader test failed: {e}")
+        return False
+
+def test_rubric_engine():
+    """Test the compiled rubric: config-hash caching, custom rules and exact keyword scans"""
+    print("\nTesting compiled rubric...")
+    
+    try:
+        import copy
+        from lib import rubric
+        from lib.gamification import process_csv_data, analyze_question_quality_batch
+        from lib.leaderboard import bucket_ranking_entry
+        
+        if rubric.compile_rubric(copy.deepcopy(rubric.DEFAULT_RUBRIC)) is not rubric.get_rubric():
+            print("❌ An identical config was compiled again")
+            return False
+        
+        # Keywords straddling each other or a row boundary must match exactly as a substring test would
+        inputs = ["coursecurity", "an exa", "m tomorrow", "CERT PREP?", "nothing here"]
+        scores = analyze_question_quality_batch(inputs, ["ok"] * len(inputs))
+        expected = [[any(k in text.lower() for k in rule["keywords"]) for text in inputs]
+                    for rule in rubric.DEFAULT_RUBRIC["questionRules"][:2]]
+        if [scores["goalAligned"].tolist(), scores["specificTopic"].tolist()] != expected:
+            print(f"❌ Keyword scan mismatch: {scores}")
+            return False
+        
+        custom = copy.deepcopy(rubric.DEFAULT_RUBRIC)
+        custom["questionRules"][0]["keywords"] = ["quiz"]
+        custom["questionRules"][2]["moreThanWords"] = 3
+        custom["followUpPoints"] = 10
+        custom["userBonuses"][0]["when"] = {"uniqueCourses": 1}
+        custom["achievements"] = [{"name": "Chatty", "when": {"totalInteractions": 2, "followUps": 1}}]
+        csv_content = "\n".join([
+            "email,first,last,input,outputs,credits,course_name,course_id,instance_ainame,success,query_duration_ms,ttft,created",
+            "a@example.com,Ada,L,Practice quiz please,one two three four,1,Networking,N1,Azari,TRUE,100,10,2024-01-01T00:00:00Z",
+            "a@example.com,Ada,L,exam tips,short,1,Networking,N1,Azari,TRUE,100,10,2024-01-01T01:00:00Z",
+            "b@example.com,Bo,K,exam tips,short,1,Networking,N2,Azari,TRUE,100,10,2024-01-01T00:00:00Z",
+        ])
+        try:
+            active = rubric.use_rubric(custom)
+            if active is rubric.compile_rubric(rubric.DEFAULT_RUBRIC):
+                print("❌ The custom rubric was not activated")
+                return False
+            results = process_csv_data(csv_content)
+            totals = {"totalInteractions": 2, "totalCredits": 2, "questionPoints": 5, "followUps": 1, "successCount": 2}
+            windowed = bucket_ranking_entry("a@example.com", "Ada L", totals)["totalPoints"]
+        finally:
+            rubric.use_rubric(None)
+        
+        if windowed != 15:
+            print(f"❌ Windowed points should use the rubric's follow-up points, got {windowed}")
+            return False
+        
+        users = {user["email"]: user for user in results["rankingData"]}
+        # Ada: 2 base + quiz (+2) + detailed (+1) + 1 follow-up (+10) + Pathway Pro (+5)
+        if users["a@example.com"]["totalPoints"] != 20 or users["a@example.com"]["achievements"] != ["Chatty"]:
+            print(f"❌ Custom rubric scored Ada wrong: {users['a@example.com']}")
+            return False
+        if users["b@example.com"]["totalPoints"] != 6 or users["b@example.com"]["achievements"] != []:
+            print(f"❌ Custom rubric scored Bo wrong: {users['b@example.com']}")
+            return False
+        if results["scoreBreakdowns"]["a@example.com"]["goalAlignedQuestions"] != 1:
+            print(f"❌ Wrong breakdown: {results['scoreBreakdowns']['a@example.com']}")
+            return False
+        
+        for bad in ({"achievements": [{"name": "Bad", "when": {"__class__": 1}}]},
+                    {"achievements": [{"when": {"followUps": 1}}]},
+                    {"userBonuses": [{"when": {"uniqueCourses": 1}, "points": 5}]}):
+            try:
+                rubric.compile_rubric({**custom, **bad})
+                print(f"❌ Invalid rubric {bad} was accepted")
+                return False
+            except ValueError:
+                pass
+        
+        print("✅ Rubric config compiles once per hash and drives every rule")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Rubric engine test failed: {e}")
+        return False
+
+def test_schema_migration():
+    """Test supabase-schema.sql on a database holding rows written by the original code
+    
+    Needs a disposable Postgres database: set SCHEMA_TEST_DSN to its connection string.
+    """
+    print("\nTesting schema migration...")
+    
+    dsn = os.environ.get("SCHEMA_TEST_DSN")
+    if not dsn:
+        print("⚠️  SCHEMA_TEST_DSN not set; skipping the Postgres migration check")
+        return True
+    
+    try:
+        import json
+        import subprocess
+        
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "supabase-schema.sql")) as schema_file:
+            schema = schema_file.read()
+        
+        # The original schema's tables, before any column was added
+        baseline_schema = """
+            CREATE TABLE analysis_results (id SERIAL PRIMARY KEY, created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                                           summary_stats JSONB NOT NULL, ranking_data JSONB NOT NULL,
+                                           raw_data_count INTEGER DEFAULT 0);
+            CREATE TABLE admin_sessions (id SERIAL PRIMARY KEY, token TEXT UNIQUE NOT NULL,
+                                         created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                                         expires_at TIMESTAMP WITH TIME ZONE NOT NULL);
+        """
+        
+        def stage(snapshot_id, email, day, interactions):
+            return (f"INSERT INTO snapshots (id, summary_stats) VALUES ({snapshot_id}, '{{}}') ON CONFLICT DO NOTHING; "
+                    f"INSERT INTO user_daily_buckets (snapshot_id, email, day, total_interactions, total_credits, "
+                    f"question_points, follow_ups, duration_sum_ms, ttft_sum_ms, success_count) "
+                    f"VALUES ({snapshot_id}, '{email}', '{day}', {interactions}, 0, 0, 0, 0, 0, 0);")
+        def stage_scope(snapshot_id, scope_value, email, rank):
+            return (f"INSERT INTO snapshots (id, summary_stats) VALUES ({snapshot_id}, '{{}}') ON CONFLICT DO NOTHING; "
+                    f"INSERT INTO scope_rankings (snapshot_id, scope, scope_value, email, name, total_interactions, "
+                    f"total_credits, question_points, follow_ups, duration_sum_ms, ttft_sum_ms, success_count, rank) "
+                    f"VALUES ({snapshot_id}, 'course', '{scope_value}', '{email}', '', 0, 0, 0, 0, 0, 0, 0, {rank});")
+        buckets = ("SELECT 'bucket|' || snapshot_id || '|' || email || '|' || day || '|' || total_interactions "
+                   "FROM user_daily_buckets ORDER BY snapshot_id, email, day; "
+                   "SELECT 'scope|' || snapshot_id || '|' || scope_value || '|' || email || '|' || rank "
+                   "FROM scope_rankings ORDER BY snapshot_id, scope_value, rank;")
+        def stage_state(snapshot_id, email, row_key):
+            return (f"INSERT INTO pending_user_aggregates VALUES ({snapshot_id}, '{email}', '{{\"n\": {snapshot_id}}}'); "
+                    f"INSERT INTO pending_ingested_rows VALUES ({snapshot_id}, '{row_key}');")
+        state = ("SELECT 'state|' || email || '|' || aggregate FROM user_aggregates ORDER BY email; "
+                 "SELECT 'row|' || row_key FROM ingested_rows ORDER BY row_key; "
+                 "SELECT 'pending|' || (SELECT COUNT(*) FROM pending_user_aggregates) "
+                 "|| '|' || (SELECT COUNT(*) FROM pending_ingested_rows);")
+        # An append publish replaces only matching learner-days and the scopes it re-ranked; a replace
+        # publish drops every older row, and an abandoned pending snapshot is dropped with its rows.
+        # Staged aggregates and row keys move into place as their snapshot publishes
+        publishes = [
+            stage(2, "a@example.com", "2024-01-01", 7), stage(2, "c@example.com", "2024-01-02", 1),
+            stage_scope(2, "Networking", "c@example.com", 1), stage_scope(2, "Networking", "a@example.com", 2),
+            stage_state(2, "a@example.com", "k2"),
+            "SELECT publish_snapshot(2, FALSE);", buckets, state,
+            stage(3, "d@example.com", "2024-01-03", 1), stage_state(3, "d@example.com", "k3"),
+            stage(4, "e@example.com", "2024-01-04", 2), stage_scope(4, "Security", "e@example.com", 1),
+            stage_state(4, "e@example.com", "k4"),
+            "SELECT publish_snapshot(4, TRUE);", buckets, state,
+            "SELECT 'snapshot|' || id || '|' || status FROM snapshots ORDER BY id;"
+        ]
+        # One job scores at a time; a job whose heartbeat went stale is claimed again
+        claims = [
+            "INSERT INTO upload_jobs (id, mode, stage, created_at) VALUES "
+            "('j1', 'append', 'queued', NOW() - INTERVAL '2 minutes'), ('j2', 'append', 'queued', NOW());",
+            "SELECT 'claim|' || id || '|' || stage FROM claim_upload_job(NOW() - INTERVAL '5 minutes', NOW());",
+            "SELECT 'claim|' || COUNT(*) FROM claim_upload_job(NOW() - INTERVAL '5 minutes', NOW());",
+            "SELECT 'claim|' || id || '|' || stage FROM claim_upload_job(NOW() + INTERVAL '1 minute', NOW());",
+            "UPDATE upload_jobs SET stage = 'saving', heartbeat_at = NOW() - INTERVAL '10 minutes' WHERE id = 'j1';",
+            "SELECT 'claim|' || id || '|' || stage FROM claim_upload_job(NOW() - INTERVAL '5 minutes', NOW());",
+            # An inline upload's job is only claimed by its own request
+            "UPDATE upload_jobs SET stage = 'published' WHERE id = 'j2';",
+            "INSERT INTO upload_jobs (id, mode, stage, synchronous) VALUES ('j3', 'append', 'queued', TRUE);",
+            "SELECT 'claim|' || COUNT(*) FROM claim_upload_job(NOW() - INTERVAL '5 minutes', NOW());",
+            "SELECT 'claim|' || id || '|' || stage FROM claim_upload_job(NOW() - INTERVAL '5 minutes', NOW(), 'j3');",
+            "SELECT 'job|' || id || '|' || stage FROM upload_jobs ORDER BY id;"
+        ]
+        
+        # The original save_analysis_results stored json.dumps() strings, which JSONB keeps as string scalars
+        ranking = [{"rank": 1, "email": "a@example.com", "name": "Ada L", "totalPoints": 12, "totalInteractions": 3,
+                    "totalCredits": 9, "followUps": 1, "uniqueCourses": 2, "successRate": 66.7,
+                    "achievements": ["🧠 Deep Diver"]},
+                   {"rank": 2, "email": "b@example.com", "name": "Bo K", "totalPoints": 4, "totalInteractions": 1,
+                    "totalCredits": 2, "followUps": 0, "uniqueCourses": 1, "successRate": 100.0, "achievements": []}]
+        baseline_row = ("INSERT INTO analysis_results (summary_stats, ranking_data, raw_data_count) VALUES "
+                        f"(to_jsonb($json${json.dumps({'totalUsers': 2})}$json$::TEXT), "
+                        f"to_jsonb($json${json.dumps(ranking)}$json$::TEXT), 4);")
+        schema_name = f"migration_test_{os.getpid()}"
+        script = "\n".join([
+            "\\set ON_ERROR_STOP 1",
+            f"CREATE SCHEMA {schema_name};",
+            f"SET search_path TO {schema_name};",
+            "SET client_min_messages TO warning;",
+            baseline_schema, baseline_row,
+            # Run twice: the schema is meant to be re-run on existing projects
+            schema, schema,
+            "\\pset format unaligned",
+            "\\pset tuples_only on",
+            "SELECT user_count || '|' || (summary_stats->>'totalUsers') FROM snapshots;",
+            "SELECT rank || '|' || email || '|' || total_points || '|' || achievements FROM snapshot_rankings ORDER BY rank;",
+            buckets, *publishes, *claims
+        ])
+        try:
+            output = subprocess.run(["psql", dsn, "-q", "-X"], input=script, check=True,
+                                    capture_output=True, text=True).stdout
+        finally:
+            subprocess.run(["psql", dsn, "-q", "-X", "-c", f"DROP SCHEMA IF EXISTS {schema_name} CASCADE"],
+                           capture_output=True)
+        
+        lines = [line for line in output.splitlines() if "|" in line]
+        expected = ["2|2", '1|a@example.com|12|["🧠 Deep Diver"]', "2|b@example.com|4|[]",
+                    "bucket|2|a@example.com|2024-01-01|7", "bucket|2|c@example.com|2024-01-02|1",
+                    "scope|2|Networking|c@example.com|1", "scope|2|Networking|a@example.com|2",
+                    'state|a@example.com|{"n": 2}', "row|k2", "pending|0|0",
+                    "bucket|4|e@example.com|2024-01-04|2", "scope|4|Security|e@example.com|1",
+                    'state|e@example.com|{"n": 4}', "row|k4", "pending|0|0",
+                    "snapshot|1|published", "snapshot|2|published", "snapshot|4|published",
+                    "claim|j1|scoring", "claim|0", "claim|j1|scoring", "claim|j2|scoring",
+                    "claim|0", "claim|j3|scoring", "job|j1|failed", "job|j2|published", "job|j3|scoring"]
+        if lines != expected:
+            print(f"❌ Migrated rows differ: {lines}")
+            return False
+        
+        print("✅ Baseline rows migrate into snapshots, buckets publish with them and the schema re-runs cleanly")
+        return True
+        
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Schema migration failed: {e.stderr.strip()[-500:]}")
+        return False
+    except Exception as e:
+        print(f"❌ Schema migration test failed: {e}")
+        return False
+
+class _CappedReader:
+    """In-memory stand-in for the PostgREST reader that, like PostgREST, returns at most 1000 rows"""
+    
+    MAX_ROWS = 1000
+    
+    def __init__(self, tables):
+        self.tables = tables
+        self.requests = []
+        self.rows_read = 0
+    
+    def table(self, name):
+        return _CappedQuery(self, name)
+
+class _CappedQuery:
+    def __init__(self, reader, table):
+        self.reader, self.table, self.filters, self.orders = reader, table, [], []
+        self.offset, self.count = 0, None
+    
+    def select(self, columns):
+        return self
+    
+    def _filter(self, column, test):
+        self.filters.append((column, test))
+        return self
+    
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value)
+    
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v > value)
+    
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v >= value)
+    
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v <= value)
+    
+    def in_(self, column, values):
+        return self._filter(column, lambda v: v in set(values))
+    
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+    
+    def limit(self, count):
+        self.count = count
+        return self
+    
+    def range(self, start, end):
+        self.offset, self.count = start, end - start + 1
+        return self
+    
+    def execute(self):
+        from lib.postgrest import PostgrestResponse
+        rows = [row for row in self.reader.tables[self.table] if all(test(row[c]) for c, test in self.filters)]
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda row: row[column], reverse=desc)
+        count = min(self.count or self.reader.MAX_ROWS, self.reader.MAX_ROWS)
+        self.reader.requests.append(self.table)
+        self.reader.rows_read += len(rows[self.offset:self.offset + count])
+        return PostgrestResponse(rows[self.offset:self.offset + count])
+
+def test_paginated_reads():
+    """Test that reads page past PostgREST's 1000-row response cap"""
+    print("\nTesting paginated reads...")
+    
+    try:
+        import lib.database as database
+        
+        aggregates = [{"email": f"learner{n:05d}@example.com", "aggregate": {"name": f"Learner {n}"}}
+                      for n in range(2500)]
+        reader = _CappedReader({"user_aggregates": aggregates})
+        original = database.get_read_client
+        database.get_read_client = lambda: reader
+        try:
+            stored = database.get_user_aggregates()
+        finally:
+            database.get_read_client = original
+        
+        if len(stored) != 2500 or stored["learner02499@example.com"] != {"name": "Learner 2499"}:
+            print(f"❌ Aggregates were truncated: {len(stored)} of 2500")
+            return False
+        if len(reader.requests) != 3:
+            print(f"❌ Expected 3 batched requests, got {len(reader.requests)}")
+            return False
+        
+        print("✅ Stored aggregates are read in 1000-row batches")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Paginated reads test failed: {e}")
+        return False
+
+def test_snapshot_row_reads():
+    """Test that leaderboard pages and learner lookups read only the rows they return"""
+    print("\nTesting per-row snapshot reads...")
+    
+    try:
+        import json
+        import lib.cache as cache
+        import lib.database as database
+        from lib.gamification import process_csv_data
+        from lib.leaderboard import (build_leaderboard_index, prepare_leaderboard, paginate_leaderboard, find_learner,
+                                     search_learners, ranking_entry_to_row)
+        
+        results = process_csv_data(_sample_cohort_csv(users=120, rows=1500))
+        ranking = results["rankingData"]
+        index = json.loads(json.dumps(build_leaderboard_index(ranking, results["scoreBreakdowns"])))
+        in_memory = prepare_leaderboard({"id": 7, "createdAt": "now", "rankingData": ranking, "index": index})
+        reader = _CappedReader({
+            "snapshots": [{"id": 7, "status": "published", "created_at": "now", "leaderboard_index": index}],
+            "snapshot_rankings": [ranking_entry_to_row(7, entry) for entry in ranking]
+        })
+        
+        original = database.get_read_client
+        database.get_read_client = lambda: reader
+        cache.invalidate_results_cache()
+        try:
+            leaderboard = cache.get_cached_leaderboard()
+            if "rankingData" in leaderboard or reader.rows_read != 1:
+                print("❌ Loading the leaderboard should read only the snapshot row")
+                return False
+            
+            achievement = next(a for user in ranking for a in user["achievements"])
+            for params in ((10, 25, "rank", "desc", None), (3, 20, "rank", "asc", None),
+                           (5, 30, "totalPoints", "desc", None), (0, 10, "followUps", "asc", achievement)):
+                before = reader.rows_read
+                page, total = paginate_leaderboard(leaderboard, *params)
+                if (page, total) != paginate_leaderboard(in_memory, *params):
+                    print(f"❌ Page {params} differs from the in-memory leaderboard")
+                    return False
+                if reader.rows_read - before != len(page):
+                    print(f"❌ Page {params} read {reader.rows_read - before} rows for {len(page)} entries")
+                    return False
+            
+            for email in (ranking[40]["email"], ranking[40]["email"].upper()):
+                before = reader.rows_read
+                learner = find_learner(leaderboard, email)
+                if learner is None or learner["entry"] != ranking[40] or reader.rows_read - before != 1:
+                    print(f"❌ Lookup of {email} failed or read more than its own row")
+                    return False
+            
+            before = reader.rows_read
+            if find_learner(leaderboard, "nobody@example.com") is not None or reader.rows_read != before:
+                print("❌ Unknown learners should be rejected from the index alone")
+                return False
+            
+            matches = search_learners(leaderboard, "first1", 5)
+            if matches != search_learners(in_memory, "first1", 5) or reader.rows_read - before != len(matches):
+                print("❌ Search read more rows than it returned")
+                return False
+        finally:
+            database.get_read_client = original
+            cache.invalidate_results_cache()
+        
+        print(f"✅ Pages and lookups read {reader.rows_read} of {len(ranking)} ranking rows")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Snapshot row reads test failed: {e}")
+        return False
+
+def test_rubric_digest():
+    """Test that append uploads refuse aggregates scored under a different rubric"""
+    print("\nTesting rubric digests on stored aggregates...")
+    
+    try:
+        import io
+        import copy
+        import json
+        import tempfile
+        import lib.asgi as asgi
+        import lib.uploads as uploads
+        from lib import rubric
+        from lib.gamification import process_csv_upload
+        
+        csv_content = _sample_cohort_csv(users=10, rows=120)
+        records = json.loads(json.dumps(process_csv_upload(io.StringIO(csv_content))["changedAggregates"]))
+        if {record["rubric"] for record in records.values()} != {rubric.get_rubric().digest}:
+            print("❌ Aggregate records should carry the digest of the rubric that scored them")
+            return False
+        
+        custom = copy.deepcopy(rubric.DEFAULT_RUBRIC)
+        custom["followUpPoints"] = 3
+        saved_reader, saved_verify = uploads.get_user_aggregates, asgi.verify_admin_token
+        uploads.get_user_aggregates = lambda: records
+        asgi.verify_admin_token = lambda header: header == "Bearer ok"
+        directory = tempfile.TemporaryDirectory()
+        restore_jobs = _use_sqlite_jobs(directory.name)
+        try:
+            if len(uploads.load_stored_aggregates('append')) != len(records):
+                print("❌ Aggregates scored by the active rubric were not loaded")
+                return False
+            
+            # Records saved before digests were stored count as scored by the default rubric
+            legacy = {email: {k: v for k, v in record.items() if k != "rubric"} for email, record in records.items()}
+            uploads.get_user_aggregates = lambda: legacy
+            uploads.load_stored_aggregates('append')
+            
+            rubric.use_rubric(custom)
+            try:
+                uploads.load_stored_aggregates('append')
+                print("❌ Appending onto aggregates from another rubric was accepted")
+                return False
+            except uploads.RubricMismatchError:
+                pass
+            if uploads.load_stored_aggregates('replace') is not None:
+                print("❌ Replace uploads should not load stored aggregates")
+                return False
+            
+            status, _, body = _call_asgi(asgi.app, "POST", "/api/data/upload", query="mode=append",
+                                         headers={"Authorization": "Bearer ok", "Content-Type": "text/csv"},
+                                         body=csv_content.encode())
+            if status != 409 or "replace mode" not in json.loads(body)["error"]:
+                print(f"❌ Mismatched append upload should return 409, got {status}")
+                return False
+        finally:
+            rubric.use_rubric(None)
+            uploads.get_user_aggregates, asgi.verify_admin_token = saved_reader, saved_verify
+            restore_jobs()
+            directory.cleanup()
+            asgi.shutdown_scoring_pool()
+        
+        print("✅ Append uploads only merge aggregates scored by the active rubric")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Rubric digest test failed: {e}")
+        return False
+
 def check_file_structure():
     """Check if all required files exist"""
     print("\\nChecking file structure...")
     
     required_files = [
         "api/auth/login.py",
+        "api/auth/logout.py",
         "api/data/upload.py", 
         "api/data/results.py",
         "api/data/clear.py",
+        "api/data/learner.py",
+        "api/data/jobs.py",
         "api/health.py",
         "lib/auth.py",
         "lib/database.py",
         "lib/gamification.py",
+        "lib/streams.py",
+        "lib/cache.py",
+        "lib/artifacts.py",
+        "lib/leaderboard.py",
+        "lib/uploads.py",
+        "lib/asgi.py",
+        "lib/sqlite_database.py",
+        "lib/jobs.py",
+        "lib/timing.py",
+        "lib/metrics.py",
+        "lib/health.py",
+        "lib/postgrest.py",
+        "lib/rubric.py",
+        "benchmarks/bench_imports.py",
         "requirements.txt",
         "vercel.json",
         "supabase-schema.sql"
@@ -136,7 +2594,36 @@ def main():
         ("File Structure", check_file_structure),
         ("Imports", test_imports),
         ("CORS Headers", test_cors_headers),
-        ("Gamification Logic", test_gamification_logic)
+        ("Gamification Logic", test_gamification_logic),
+        ("Question Quality Batch", test_question_quality_batch),
+        ("Scoring Parity", test_scoring_parity),
+        ("Streaming Ingestion", test_streaming_ingestion),
+        ("Append Uploads", test_append_uploads),
+        ("Parallel Scoring", test_parallel_scoring),
+        ("Columnar Records", test_columnar_records),
+        ("Results Cache", test_results_cache),
+        ("Results Artifact", test_results_artifact),
+        ("Leaderboard Pages", test_leaderboard_pages),
+        ("Learner Lookup", test_learner_lookup),
+        ("Supabase Client Reuse", test_supabase_client_reuse),
+        ("Token Cache", test_token_cache),
+        ("ASGI App", test_asgi_app),
+        ("Load Test Harness", test_load_harness),
+        ("SQLite Backend", test_sqlite_backend),
+        ("Snapshot Publishing", test_snapshot_publishing),
+        ("Snapshot Diff", test_snapshot_diff),
+        ("Window Leaderboards", test_window_leaderboards),
+        ("Scope Leaderboards", test_scope_leaderboards),
+        ("Upload Jobs", test_upload_jobs),
+        ("Request Timing", test_request_timing),
+        ("Health Metrics", test_health_metrics),
+        ("Cold Start Imports", test_cold_start_imports),
+        ("PostgREST Reader", test_postgrest_reader),
+        ("Rubric Engine", test_rubric_engine),
+        ("Schema Migration", test_schema_migration),
+        ("Paginated Reads", test_paginated_reads),
+        ("Snapshot Row Reads", test_snapshot_row_reads),
+        ("Rubric Digest", test_rubric_digest)
     ]
     
     results = []